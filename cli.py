@@ -0,0 +1,203 @@
+"""
+Запуск без графического интерфейса.
+
+    python cli.py ingest [ПАПКА] [-o output.xlsx] [--workers N] [--resume] [--check-content] [--lookup-inn] [--keep-duplicates]
+    python cli.py search ЗАПРОС [--by name|product_type] [-f output.xlsx]
+    python cli.py generate (--name НАИМЕНОВАНИЕ | --product-type ТИП)... [-t шаблон] [-s папка]
+    python cli.py print [ПАПКА] [--all]
+
+Значения по умолчанию берутся из settings.json, который сохраняет
+графический интерфейс. Тяжелые библиотеки (pandas, python-docx, requests,
+pywin32) загружаются только той командой, которой они нужны.
+"""
+import time
+
+STARTED_AT = time.perf_counter()
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+
+SETTINGS_FILE = 'settings.json'
+
+
+def read_settings(path):
+    """Настройки, сохраненные графическим интерфейсом; пустой словарь, если файла нет."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def cmd_ingest(args):
+    from ingest import build_output_file, list_doc_files
+    from inn_index import load_local_index
+    from inn_lookup import InnResolver, YandexProvider
+    from output_writer import OutputWriter
+
+    if not args.folder or not os.path.isdir(args.folder):
+        raise SystemExit("Не указана рабочая папка")
+    doc_files = list_doc_files(args.folder)
+    if not doc_files:
+        raise SystemExit("В папке нет файлов .doc или .docx")
+
+    def update_progress(processed, total_files):
+        logging.info(f"Обработано {processed} из {total_files} файлов")
+
+    writer = OutputWriter(
+        os.path.abspath(args.output), args.folder,
+        collapse_duplicates=not args.keep_duplicates, ignored_inns=[args.compare_inn]
+    )
+    inn_resolver = None
+    if args.lookup_inn:
+        inn_resolver = InnResolver(
+            YandexProvider(args.inn_search_url), workers=args.inn_workers, rate=args.inn_rate,
+            local_index=load_local_index([args.output] + args.known_directory, ignored_inns=[args.compare_inn])
+        )
+
+    rows = build_output_file(
+        writer, doc_files, args.workers, update_progress, inn_resolver, args.resume,
+        compare_inn_value=args.compare_inn, use_hash=args.check_content
+    )
+    print(f"{args.output}: {rows} строк из {len(doc_files)} файлов")
+
+def cmd_search(args):
+    from directory import DirectoryService
+
+    directory = DirectoryService().get(args.file)
+    if args.by == 'name':
+        results = [f"{score:3d}%  {name}" for name, score in directory.search_names(args.query, args.limit)]
+    elif args.query:
+        results = directory.search_product_types(args.query, args.limit)
+    else:
+        results = directory.all_product_types()
+    for result in results:
+        print(result)
+
+def cmd_generate(args):
+    from directory import DirectoryService
+    from generation import generate_request_documents, request_output_folder
+    from numbering import NumberAllocator
+    from selection import Selection
+
+    if not args.template or not os.path.exists(args.template):
+        raise SystemExit("Шаблон документа не найден")
+    if not args.save_folder:
+        raise SystemExit("Не выбрана папка для сохранения")
+
+    directory = DirectoryService().get(args.file)
+    selection = Selection()
+    for name in args.name:
+        selection.add(directory.records_for_result(name, 'name'))
+    for product_type in args.product_type:
+        selection.add(directory.records_for_result(product_type, 'product_type'))
+    if not selection:
+        raise SystemExit("Нет выбранных организаций")
+
+    output_folder = request_output_folder(args.save_folder)
+    orgs = selection.grouped(format_types=False)
+    success_count, text_files_error, first_number = generate_request_documents(
+        orgs, args.template, output_folder, args.start_number, workers=args.workers,
+        allocator=NumberAllocator(args.save_folder)
+    )
+    print(f"Создано {success_count} из {len(orgs)} документов в {output_folder}")
+    print(f"Номера запросов: с {first_number} по {first_number + len(orgs) - 1}")
+    if text_files_error:
+        raise SystemExit(f"Не удалось создать текстовые файлы: {text_files_error}")
+
+def cmd_print(args):
+    from printing import list_print_files, print_files
+
+    if sys.platform != 'win32':
+        raise SystemExit("Печать доступна только в Windows")
+    files = list_print_files(args.folder)
+    if not files:
+        raise SystemExit("В папке нет документов Word")
+
+    def update_progress(done, total, completed, failed, status_text):
+        logging.info(f"{status_text} ({done} из {total})")
+
+    completed, failed = print_files(files, not args.all, progress_callback=update_progress)
+    print(f"Отправлено на печать: {completed}, ошибок: {failed}")
+
+def build_parser(settings):
+    parser = argparse.ArgumentParser(prog='cli.py', description="Коммерческие предложения в один клик без графического интерфейса")
+    parser.add_argument('--settings', default=SETTINGS_FILE, help="файл настроек (по умолчанию settings.json)")
+    parser.add_argument('-v', '--verbose', action='store_true', help="подробный журнал в stderr")
+    parser.add_argument('--timings', action='store_true', help="время запуска и выполнения команды")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    # Модуль легкий: только стандартная библиотека
+    from inn_lookup import DEFAULT_LOOKUP_WORKERS, DEFAULT_RATE, YANDEX_SEARCH_URL
+
+    output_file = settings.get('output_file_fz') or 'output.xlsx'
+
+    ingest = subparsers.add_parser('ingest', help="создать справочник output.xlsx из писем")
+    ingest.add_argument('folder', nargs='?', default=settings.get('working_folder'), help="рабочая папка")
+    ingest.add_argument('-o', '--output', default='output.xlsx', help="файл справочника")
+    ingest.add_argument('--workers', type=int, default=int(settings.get('workers') or 0) or None, help="количество процессов")
+    ingest.add_argument('--resume', action='store_true', help="продолжить прерванный запуск")
+    ingest.add_argument('--check-content', action='store_true', help="брать из кэша разбора и файлы с новым временем изменения, если не изменилось содержимое (например, после синхронизации Dropbox)")
+    ingest.add_argument('--lookup-inn', action='store_true', default=settings.get('compare_inn', False), help="искать ИНН через Яндекс")
+    ingest.add_argument('--inn-workers', type=int, default=DEFAULT_LOOKUP_WORKERS, help="одновременных запросов при поиске ИНН")
+    ingest.add_argument('--inn-rate', type=float, default=DEFAULT_RATE, help="запросов в секунду к поисковику")
+    ingest.add_argument('--inn-search-url', default=YANDEX_SEARCH_URL, help="шаблон адреса поиска с {query} (например, локальный тестовый сервер)")
+    ingest.add_argument('--known-directory', action='append', default=[], help="справочник, из которого брать известные ИНН (можно несколько)")
+    ingest.add_argument('--keep-duplicates', action='store_true', help="не объединять письма одной организации")
+    ingest.add_argument('--compare-inn', default=settings.get('compare_inn_value', ''), help="ИНН, который тоже нужно искать заново")
+    ingest.set_defaults(func=cmd_ingest)
+
+    search = subparsers.add_parser('search', help="поиск по справочнику")
+    search.add_argument('query', nargs='?', default='', help="строка поиска")
+    search.add_argument('--by', choices=('name', 'product_type'), default='name', help="где искать")
+    search.add_argument('-f', '--file', default=output_file, help="файл справочника")
+    search.add_argument('--limit', type=int, default=50, help="сколько результатов выводить")
+    search.set_defaults(func=cmd_search)
+
+    generate = subparsers.add_parser('generate', help="сформировать запросы по шаблону")
+    generate.add_argument('--name', action='append', default=[], help="наименование организации (можно несколько)")
+    generate.add_argument('--product-type', action='append', default=[], help="тип товара (можно несколько)")
+    generate.add_argument('-f', '--file', default=output_file, help="файл справочника")
+    generate.add_argument('-t', '--template', default=settings.get('template_file_fz'), help="шаблон .docx")
+    generate.add_argument('-s', '--save-folder', default=settings.get('save_folder_fz'), help="папка для сохранения")
+    generate.add_argument('--start-number', type=int, default=int(settings.get('start_number') or 1), help="начальный номер запроса")
+    generate.add_argument('--workers', type=int, default=int(settings.get('workers') or 0) or None, help="количество процессов")
+    generate.set_defaults(func=cmd_generate)
+
+    print_cmd = subparsers.add_parser('print', help="печать документов папки (Windows)")
+    print_cmd.add_argument('folder', nargs='?', default=settings.get('print_folder'), help="папка с документами")
+    print_cmd.add_argument('--all', action='store_true', help="печатать все страницы, а не только первую")
+    print_cmd.set_defaults(func=cmd_print)
+
+    return parser
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    # Файл настроек нужен до разбора аргументов: из него берутся значения по умолчанию
+    pre_parser = argparse.ArgumentParser(add_help=False)
+    pre_parser.add_argument('--settings', default=SETTINGS_FILE)
+    settings = read_settings(pre_parser.parse_known_args(argv)[0].settings)
+
+    args = build_parser(settings).parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    work_started_at = time.perf_counter()
+    try:
+        args.func(args)
+    finally:
+        if args.timings:
+            finished_at = time.perf_counter()
+            print(
+                f"Запуск: {work_started_at - STARTED_AT:.3f} с, выполнение: {finished_at - work_started_at:.3f} с",
+                file=sys.stderr
+            )
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
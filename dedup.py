@@ -0,0 +1,148 @@
+import re
+
+# Колонки, значения которых объединяются из всех писем организации;
+# в остальных берется первое непустое значение
+MERGED_COLUMNS = ('Электронная почта', 'Телефон')
+
+SOURCES_COLUMN = 'Файлы'
+
+LIST_SEPARATOR = ', '
+
+_NON_WORD_RE = re.compile(r'[\W_]+')
+
+# Полные названия организационно-правовых форм и их сокращения
+# (после приведения к нижнему регистру и замены ё на е)
+LEGAL_FORM_NAMES = {
+    'общество с ограниченной ответственностью': 'ооо',
+    'открытое акционерное общество': 'оао',
+    'закрытое акционерное общество': 'зао',
+    'публичное акционерное общество': 'пао',
+    'непубличное акционерное общество': 'ао',
+    'акционерное общество': 'ао',
+    'индивидуальный предприниматель': 'ип',
+    'научно производственное объединение': 'нпо',
+    'научно производственное предприятие': 'нпп',
+    'торговый дом': 'тд',
+    'федеральное государственное унитарное предприятие': 'фгуп',
+    'государственное унитарное предприятие': 'гуп',
+    'муниципальное унитарное предприятие': 'муп',
+}
+LEGAL_FORMS = frozenset(LEGAL_FORM_NAMES.values()) | {'нао'}
+
+# Длинные названия раньше коротких: "открытое акционерное общество", а не "акционерное общество"
+_LEGAL_FORM_RE = re.compile(
+    r'\b(?:' + '|'.join(sorted(LEGAL_FORM_NAMES, key=len, reverse=True)) + r')\b'
+)
+
+
+def normalize_inn(inn):
+    """Цифры ИНН или пустая строка, если это не ИНН (не 10 и не 12 цифр)."""
+    digits = re.sub(r'\D', '', str(inn or ''))
+    return digits if len(digits) in (10, 12) else ''
+
+def name_key(name):
+    """
+    Ключ сравнения наименований: без регистра, кавычек и знаков препинания,
+    ё заменена на е, организационно-правовая форма сокращена ("Общество с
+    ограниченной ответственностью" -> "ооо") и перенесена в конец, поэтому
+    "ООО «Ромашка»", "Ромашка, ООО" и "Общество с ограниченной
+    ответственностью "Ромашка"" дают один ключ "ромашка ооо".
+    """
+    name = str(name or '').lower().replace('ё', 'е')
+    name = ' '.join(_NON_WORD_RE.sub(' ', name).split())
+    name = _LEGAL_FORM_RE.sub(lambda m: LEGAL_FORM_NAMES[m.group(0)], name)
+    words = name.split()
+    forms = [word for word in words if word in LEGAL_FORMS]
+    if not forms or len(forms) == len(words):
+        return name
+    return ' '.join([word for word in words if word not in LEGAL_FORMS] + sorted(forms))
+
+def email_domain(emails):
+    """Домен первого адреса электронной почты или пустая строка."""
+    first = str(emails or '').split(LIST_SEPARATOR)[0].strip().lower()
+    return first.rpartition('@')[2] if '@' in first else ''
+
+def _split_list(value):
+    return [item.strip() for item in str(value or '').split(LIST_SEPARATOR) if item.strip()]
+
+
+class OrganizationIndex:
+    """
+    Схлопывает строки справочника по организациям.
+
+    Строки одной организации (сопроводительное письмо, новый прайс, ответ
+    другого менеджера) ищутся в хеш-индексах по нормализованному ИНН, а
+    без ИНН — по нормализованному наименованию и домену почты. Адреса
+    почты, телефоны и имена исходных файлов объединяются в одну строку.
+    ИНН из ignored_inns (например, собственный ИНН, попавший в письма
+    из запроса) для объединения не используются.
+
+    Сами строки индекс не хранит: у группы есть только ИНН и ссылки на
+    строки (например, смещения в журнале), а rows() читает строки каждой
+    организации заново и объединяет их по одной организации за раз.
+    """
+
+    def __init__(self, ignored_inns=()):
+        self.ignored_inns = {normalize_inn(inn) for inn in ignored_inns} - {''}
+        self.groups = []
+        self.by_inn = {}
+        self.by_name = {}
+        self.rows_added = 0
+
+    def add(self, row, ref):
+        """Относит строку справочника к организации; по ref rows() прочитает строку снова."""
+        self.rows_added += 1
+        inn = normalize_inn(row.get('ИНН'))
+        if inn in self.ignored_inns:
+            inn = ''
+        key = name_key(row.get('Наименование'))
+        name_index_key = (key, email_domain(row.get('Электронная почта'))) if key else None
+
+        group = self.by_inn.get(inn) if inn else None
+        if group is None and name_index_key is not None:
+            candidate = self.by_name.get(name_index_key)
+            # Организацию с другим ИНН не объединяем, даже если совпало наименование
+            if candidate is not None and not (inn and candidate['inn']):
+                group = candidate
+
+        if group is None:
+            group = {'inn': '', 'refs': []}
+            self.groups.append(group)
+        group['refs'].append(ref)
+
+        if inn and not group['inn']:
+            group['inn'] = inn
+            self.by_inn[inn] = group
+        if name_index_key is not None:
+            self.by_name.setdefault(name_index_key, group)
+
+    def __len__(self):
+        return len(self.groups)
+
+    def rows(self, load):
+        """
+        Объединенные строки в порядке первого появления организации, с новой
+        нумерацией. load(ref) возвращает (имя файла, строка) для ссылки из add().
+        """
+        for number, group in enumerate(self.groups, 1):
+            row = {}
+            lists = {column: [] for column in MERGED_COLUMNS}
+            files = []
+            for ref in group['refs']:
+                file_name, source = load(ref)
+                for column, value in source.items():
+                    if column in MERGED_COLUMNS:
+                        values = lists[column]
+                        for item in _split_list(value):
+                            if item not in values:
+                                values.append(item)
+                    elif not row.get(column) and value not in (None, ''):
+                        row[column] = value
+                files.append(file_name)
+            for column in MERGED_COLUMNS:
+                row[column] = LIST_SEPARATOR.join(lists[column])
+            if group['inn']:
+                row['ИНН'] = group['inn']
+            row['Номер п/п'] = number
+            row[SOURCES_COLUMN] = LIST_SEPARATOR.join(files)
+            yield row
@@ -0,0 +1,393 @@
+import heapq
+import logging
+import os
+import pickle
+import threading
+import time
+from array import array
+from collections import Counter
+
+from dedup import name_key
+from fileutil import local_cache_path
+
+# Сколько результатов поиска показывать
+SEARCH_LIMIT = 50
+
+# Сколько наименований, отобранных по общим триграммам, сравнивать нечетко
+FUZZY_CANDIDATES = 300
+
+# Продолжение запроса ищется среди наименований, найденных по его началу
+# (и по новым триграммам), если их не больше стольких; иначе — по всему индексу
+NARROW_LIMIT = 5000
+
+# Минимальная оценка наименования в результатах поиска (0–100)
+MIN_NAME_SCORE = 60
+
+# Оценка наименования, в которое запрос входит целиком (как в прежнем поиске по подстроке)
+SUBSTRING_SCORE = 90
+
+# Триграммы, которые есть у большей доли наименований ("ооо", " ао"),
+# почти ничего не отсеивают и для отбора кандидатов не используются
+COMMON_TRIGRAM_SHARE = 0.1
+
+# Снимок загруженного справочника в локальной папке кэшей пользователя
+# ("output.xlsx-<хеш пути>.cache.pickle"): pickle можно читать только из
+# папки, в которую не пишут другие (output.xlsx может лежать в общей папке).
+# Версию нужно менять при изменении структуры Directory
+CACHE_SUFFIX = '.cache.pickle'
+CACHE_VERSION = 2
+
+# Разделитель в строке результата поиска по типу товара
+PRODUCT_TYPE_SEPARATOR = " | Организация: "
+
+NOT_SPECIFIED = 'не указан'
+
+
+class DirectoryError(Exception):
+    """Справочник не подходит для операции (например, нет нужной колонки)."""
+
+
+def file_fingerprint(path):
+    """Размер и время изменения файла: по ним видно, что файл перезаписан."""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+def directory_cache_path(output_file):
+    """Путь к снимку справочника output_file в локальной папке кэшей."""
+    return local_cache_path(output_file, CACHE_SUFFIX)
+
+def read_directory_cache(cache_path, fingerprint):
+    """Directory из снимка или None, если снимка нет, он устарел или поврежден."""
+    try:
+        with open(cache_path, 'rb') as f:
+            version, cached_fingerprint, directory = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.warning(f"Снимок справочника {cache_path} не прочитан: {e}")
+        return None
+    if version != CACHE_VERSION or tuple(cached_fingerprint) != tuple(fingerprint):
+        return None
+    return directory
+
+def write_directory_cache(cache_path, fingerprint, directory):
+    """Сохраняет снимок справочника; ошибки записи только логируются."""
+    tmp_path = f"{cache_path}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((CACHE_VERSION, fingerprint, directory), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logging.warning(f"Не удалось сохранить снимок справочника {cache_path}: {e}")
+
+def read_excel_directory(output_file):
+    """Читает справочник output.xlsx через pandas."""
+    import pandas as pd
+
+    df = pd.read_excel(output_file)
+    return Directory(list(df.columns), df.to_dict('records'))
+
+def load_directory(output_file):
+    """
+    Справочник из output.xlsx. Файл разбирается, только если изменился с
+    последнего чтения, иначе справочник вместе с индексами берется из снимка.
+    """
+    fingerprint = file_fingerprint(output_file)
+    cache_path = directory_cache_path(output_file)
+    directory = read_directory_cache(cache_path, fingerprint)
+    if directory is None:
+        directory = read_excel_directory(output_file)
+        write_directory_cache(cache_path, fingerprint, directory)
+    return directory
+
+def format_product_type(product_type):
+    """Форматирует тип товара: первая буква заглавная, остальные строчные"""
+    if not product_type or not isinstance(product_type, str):
+        return product_type
+    return product_type.strip().capitalize()
+
+def normalize_product_type(product_type):
+    """Ключ типа товара в индексе: без пробелов по краям и без учета регистра."""
+    return product_type.strip().lower()
+
+def split_product_types(cell):
+    """Типы товаров из ячейки "Тип товара" (через запятую)."""
+    if not isinstance(cell, str):
+        return []
+    return [pt.strip() for pt in cell.split(',') if pt.strip()]
+
+def trigrams(key):
+    """Триграммы нормализованного наименования; начало строки дополнено пробелами."""
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _org_record(row, name=None):
+    return (
+        name or row['Наименование'],
+        str(row.get('ИНН', NOT_SPECIFIED)),
+        str(row.get('Электронная почта', NOT_SPECIFIED)),
+        str(row.get('Тип товара', NOT_SPECIFIED))
+    )
+
+
+class Directory:
+    """
+    Загруженный справочник: запросы к нему не перечитывают файл.
+
+    При загрузке строится инвертированный индекс типов товаров
+    (нормализованный тип -> номера строк) и отсортированный словарь
+    типов, поэтому поиск по типу и список всех типов не обходят строки
+    справочника. Для каждого наименования один раз вычисляется ключ
+    сравнения (dedup.name_key): поиск, добавление найденного и отбор
+    работают с ключами и не нормализуют строки при каждом запросе, а
+    варианты написания одной организации считаются одной организацией.
+    Для нечеткого поиска строится индекс триграмм ключей.
+    Для снимка (pickle) строки сохраняются по колонкам.
+    """
+
+    def __init__(self, columns, rows):
+        self.columns = columns
+        self.rows = rows
+        self.has_names = 'Наименование' in columns
+        self.has_product_types = 'Тип товара' in columns
+
+        # Ключ сравнения для каждого встречающегося написания наименования
+        self.key_by_name = {}
+        for row in rows:
+            name = row.get('Наименование')
+            if isinstance(name, str) and name not in self.key_by_name:
+                self.key_by_name[name] = name_key(name)
+        self._index_names()
+
+        # Уникальные ключи, первое написание каждого и триграмма -> номера ключей
+        self.name_keys = list(self.rows_by_key)
+        self.names = [self.rows[row_ids[0]]['Наименование'] for row_ids in self.rows_by_key.values()]
+        self.name_by_key = dict(zip(self.name_keys, self.names))
+        name_trigrams = {}
+        for name_id, key in enumerate(self.name_keys):
+            for gram in trigrams(key):
+                name_trigrams.setdefault(gram, []).append(name_id)
+        # Массивы вместо списков: меньше памяти и быстрее снимок
+        self.name_trigrams = {gram: array('i', name_ids) for gram, name_ids in name_trigrams.items()}
+
+        self.type_rows = {}
+        if self.has_product_types:
+            for row_id, row in enumerate(self.rows):
+                for pt in split_product_types(row.get('Тип товара')):
+                    row_ids = self.type_rows.setdefault(normalize_product_type(pt), [])
+                    if not row_ids or row_ids[-1] != row_id:
+                        row_ids.append(row_id)
+        self.type_vocabulary = sorted(self.type_rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _index_names(self):
+        """Ключ сравнения -> номера строк (в порядке строк)."""
+        self.rows_by_key = {}
+        for row_id, row in enumerate(self.rows):
+            name = row.get('Наименование')
+            if isinstance(name, str):
+                self.rows_by_key.setdefault(self.key_by_name[name], []).append(row_id)
+
+    def key_of(self, name):
+        """Ключ сравнения наименования: из индекса, а для незнакомого — вычисленный."""
+        key = self.key_by_name.get(name)
+        return key if key is not None else name_key(name)
+
+    def __getstate__(self):
+        # Словарь строк по ключам быстрее построить заново, чем прочитать из pickle
+        state = dict(self.__dict__)
+        rows = state.pop('rows')
+        del state['rows_by_key']
+        state['column_values'] = {column: [row.get(column) for row in rows] for column in self.columns}
+        return state
+
+    def __setstate__(self, state):
+        column_values = state.pop('column_values')
+        self.__dict__.update(state)
+        values = [column_values[column] for column in self.columns]
+        self.rows = [dict(zip(self.columns, row)) for row in zip(*values)] if values else []
+        self._index_names()
+
+    def _require_product_types(self):
+        if not self.has_product_types:
+            raise DirectoryError("В файле отсутствует колонка 'Тип товара'.")
+
+    def _matching_types(self, query, within=None):
+        """Типы словаря (или within), содержащие query, в порядке словаря."""
+        query = normalize_product_type(query)
+        return [pt for pt in (self.type_vocabulary if within is None else within) if query in pt]
+
+    def _name_grams(self, key):
+        """
+        Триграммы key, по которым отбираются кандидаты: все, что есть в
+        индексе, кроме частых; частая — только самая редкая, если других нет.
+        """
+        common = max(1, int(len(self.names) * COMMON_TRIGRAM_SHARE))
+        found = [gram for gram in trigrams(key) if gram in self.name_trigrams]
+        rare = {gram for gram in found if len(self.name_trigrams[gram]) <= common}
+        if rare or not found:
+            return rare
+        return {min(found, key=lambda gram: (len(self.name_trigrams[gram]), gram))}
+
+    def _name_candidates(self, key, within=None):
+        """
+        Номера наименований с наибольшим числом общих с key триграмм и
+        (триграммы отбора, все наименования с общими триграммами) — или
+        None, если таких наименований больше NARROW_LIMIT. within — такая
+        пара от предыдущего запроса: тогда индекс читается только для
+        триграмм, которых у предыдущего запроса не было. Триграммы
+        продолжения не всегда включают триграммы начала ("ро " нет в
+        "ром"), поэтому кандидаты те же, что при поиске по всему индексу.
+        """
+        grams = self._name_grams(key)
+        if within is not None:
+            prev_grams, prev_ids = within
+            name_ids = set(prev_ids)
+            for gram in grams - prev_grams:
+                name_ids.update(self.name_trigrams[gram])
+            counts = {}
+            for name_id in name_ids:
+                count = len(grams & trigrams(self.name_keys[name_id]))
+                if count:
+                    counts[name_id] = count
+        else:
+            counts = Counter()
+            for gram in grams:
+                counts.update(self.name_trigrams[gram])
+        # При равном числе общих триграмм — в порядке справочника,
+        # чтобы порядок обхода не менял отобранных кандидатов
+        candidates = heapq.nlargest(FUZZY_CANDIDATES, counts.items(), key=lambda item: (item[1], -item[0]))
+        matched = (frozenset(grams), list(counts)) if len(counts) <= NARROW_LIMIT else None
+        return [name_id for name_id, _ in candidates], matched
+
+    def find_names(self, query, limit=SEARCH_LIMIT, within=None, check=None):
+        """
+        Как search_names, но возвращает еще и отобранные наименования, среди
+        которых ищется продолжение запроса (None, если их слишком много).
+        within — такой результат предыдущего запроса: тогда индекс читается
+        только для новых триграмм. check() вызывается во время
+        сравнения и может прервать поиск исключением.
+        """
+        if not self.has_names:
+            raise DirectoryError("В файле отсутствует колонка 'Наименование'.")
+        key = name_key(query)
+        if not key:
+            return [], None
+        candidates, matched = self._name_candidates(key, within)
+
+        from fuzzywuzzy import fuzz
+
+        scored = []
+        for i, name_id in enumerate(candidates):
+            if check and i % 50 == 0:
+                check()
+            candidate = self.name_keys[name_id]
+            # force_ascii=False: иначе fuzzywuzzy выбрасывает кириллицу из строк
+            score = fuzz.token_set_ratio(key, candidate, force_ascii=False, full_process=False)
+            if key in candidate:
+                score = max(score, SUBSTRING_SCORE)
+            if score >= MIN_NAME_SCORE:
+                scored.append((-score, len(candidate), self.names[name_id]))
+        results = [(name, -neg_score) for neg_score, _, name in heapq.nsmallest(limit, scored)]
+        return results, matched
+
+    def search_names(self, query, limit=SEARCH_LIMIT):
+        """
+        Наименования, похожие на query, по убыванию оценки: [(наименование, оценка 0–100)].
+
+        Кандидаты отбираются по общим триграммам, и только они сравниваются
+        fuzz.token_set_ratio, поэтому опечатки и другой порядок слов не мешают
+        поиску. Наименование, содержащее запрос целиком, получает не меньше
+        SUBSTRING_SCORE.
+        """
+        return self.find_names(query, limit)[0]
+
+    def find_product_types(self, query, limit=SEARCH_LIMIT, within=None, check=None):
+        """
+        Как search_product_types, но возвращает еще и совпавшие типы: среди
+        них ищется продолжение запроса (within), ведь тип, содержащий более
+        длинную строку, содержит и ее начало.
+        """
+        self._require_product_types()
+        matched = self._matching_types(query, within)
+        results = set()
+        for pt in matched:
+            if check:
+                check()
+            formatted_pt = format_product_type(pt)
+            for row_id in self.type_rows[pt]:
+                # Варианты написания одной организации показываются один раз
+                org_name = self.rows[row_id].get('Наименование', '')
+                org_name = self.name_by_key.get(self.key_by_name.get(org_name), org_name)
+                results.add(f"{formatted_pt}{PRODUCT_TYPE_SEPARATOR}{org_name}")
+        return sorted(results)[:limit], matched
+
+    def search_product_types(self, query, limit=SEARCH_LIMIT):
+        """
+        Строки "Тип товара | Организация: наименование" для типов товаров,
+        содержащих query (без учета регистра).
+        """
+        return self.find_product_types(query, limit)[0]
+
+    def all_product_types(self):
+        """Все уникальные типы товаров справочника с форматированием."""
+        self._require_product_types()
+        return sorted({format_product_type(pt) for pt in self.type_vocabulary})
+
+    def records_for_result(self, value, search_type):
+        """
+        Записи (наименование, ИНН, email, типы товаров) для выбранной строки
+        результата поиска по наименованию или по типу товара. Все варианты
+        написания организации получают одно наименование (первое в
+        справочнике), чтобы при отборе не появлялись дубликаты.
+        """
+        if search_type == "product_type":
+            if PRODUCT_TYPE_SEPARATOR in value:
+                # Организация, найденная по типу товара, со всеми вариантами написания
+                _, org_name = value.split(PRODUCT_TYPE_SEPARATOR, 1)
+                row_ids = self.rows_by_key.get(self.key_of(org_name), [])
+            else:
+                # Тип товара из общего списка: все организации с таким типом
+                row_ids = sorted({row_id for pt in self._matching_types(value) for row_id in self.type_rows[pt]})
+        else:
+            # Наименование сравнивается по ключу: кавычки, регистр и форма собственности не важны
+            row_ids = self.rows_by_key.get(self.key_of(value), [])
+        records = []
+        for row_id in row_ids:
+            row = self.rows[row_id]
+            records.append(_org_record(row, self.name_by_key.get(self.key_by_name.get(row['Наименование']))))
+        return records
+
+
+class DirectoryService:
+    """
+    Держит справочник в памяти между запросами.
+
+    get() читает файл только при первом обращении, при выборе другого
+    файла или когда у файла изменились размер или время изменения
+    (например, после обновления в режиме слежения за папкой).
+    """
+
+    def __init__(self, loader=load_directory):
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.path = None
+        self.fingerprint = None
+        self.directory = None
+
+    def get(self, output_file):
+        """Справочник из output_file, при необходимости перечитанный."""
+        output_file = os.path.abspath(output_file)
+        fingerprint = file_fingerprint(output_file)
+        with self.lock:
+            if self.directory is None or self.path != output_file or self.fingerprint != fingerprint:
+                started = time.perf_counter()
+                self.directory = self.loader(output_file)
+                self.path = output_file
+                self.fingerprint = fingerprint
+                logging.info(
+                    f"Справочник {output_file} загружен: {len(self.directory)} строк за {time.perf_counter() - started:.2f} с"
+                )
+            return self.directory
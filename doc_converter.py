@@ -0,0 +1,549 @@
+import logging
+import os
+import queue
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from parsing import is_stop_line
+
+# Количество одновременно запущенных конвертеров по умолчанию
+DEFAULT_DOC_WORKERS = 2
+
+# После стольких документов конвертер перезапускается, чтобы не копить утечки Word
+DEFAULT_MAX_DOCS = 200
+
+# Время на один документ, после которого конвертер считается зависшим
+DEFAULT_TIMEOUT = 60
+
+# Как часто (в секундах) сторож пула проверяет, не завис ли конвертер
+WATCHDOG_INTERVAL = 1
+
+# Сколько файлов soffice --convert-to получает за один запуск (если нет модуля uno)
+LIBREOFFICE_BATCH_SIZE = 20
+
+# Сколько секунд ждать, пока запущенный soffice начнет принимать подключения UNO
+LIBREOFFICE_START_TIMEOUT = 60
+
+# Фильтр LibreOffice для выгрузки документа в текст
+LIBREOFFICE_TEXT_FILTER = 'Text (encoded)'
+
+WD_ALERTS_NONE = 0
+
+
+class ConverterError(Exception):
+    """Ошибка конвертера, после которой его нужно перезапустить."""
+
+
+class WordConverter:
+    """
+    Постоянный экземпляр Word, управляемый через COM.
+    Каждый конвертер запускает отдельный процесс Word (DispatchEx), чтобы
+    зависание одного не блокировало остальные.
+    """
+
+    batch_size = 1
+
+    def __init__(self):
+        self.word = None
+        self.pid = None
+
+    def start(self):
+        import pythoncom
+        import win32com.client as win32
+
+        pythoncom.CoInitialize()
+        self.word = win32.DispatchEx('Word.Application')
+        self.word.Visible = False
+        self.word.DisplayAlerts = WD_ALERTS_NONE
+        self.pid = self._find_pid()
+
+    def _find_pid(self):
+        """PID процесса Word: нужен, чтобы завершить его при зависании."""
+        try:
+            import win32gui
+            import win32process
+
+            caption = f"kp-converter-{id(self)}-{time.time()}"
+            self.word.Caption = caption
+            hwnd = win32gui.FindWindow('OpusApp', caption)
+            return win32process.GetWindowThreadProcessId(hwnd)[1] if hwnd else None
+        except Exception as e:
+            logging.warning(f"Не удалось определить процесс Word: {e}")
+            return None
+
+    def convert(self, paths):
+        results = {}
+        for path in paths:
+            try:
+                doc = self.word.Documents.Open(
+                    os.path.abspath(path), ConfirmConversions=False, ReadOnly=True, AddToRecentFiles=False
+                )
+            except Exception as e:
+                # Word мог упасть или быть завершен сторожем
+                raise ConverterError(str(e)) from e
+            try:
+                full_text = []
+                for para in doc.Paragraphs:
+                    text = para.Range.Text.strip()
+                    full_text.append(text)
+                    if is_stop_line(text):
+                        break
+                results[path] = (full_text, None)
+            except Exception as e:
+                results[path] = (None, str(e))
+            finally:
+                try:
+                    doc.Close(False)
+                except Exception:
+                    pass
+        return results
+
+    def kill(self):
+        if self.pid:
+            try:
+                os.kill(self.pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    def stop(self):
+        import pythoncom
+
+        if self.word is not None:
+            try:
+                self.word.Quit()
+            except Exception:
+                self.kill()
+        self.word = None
+        self.pid = None
+        pythoncom.CoUninitialize()
+
+    def close(self):
+        pass
+
+
+def _read_text_file(txt_path):
+    """Строки текстовой выгрузки LibreOffice до строки со словом "ЗАПРОС"."""
+    full_text = []
+    with open(txt_path, encoding='utf-8-sig', errors='replace') as f:
+        for line in f:
+            text = line.strip()
+            full_text.append(text)
+            if is_stop_line(text):
+                break
+    return full_text
+
+
+class LibreOfficeConverter:
+    """
+    Постоянный экземпляр LibreOffice (soffice --headless --accept),
+    управляемый через UNO, — как WordConverter для Word.
+
+    soffice запускается один раз со своим профилем и слушает именованный
+    канал; документы открываются в нем по одному и выгружаются в текст тем
+    же фильтром, что и soffice --convert-to. Перезапуск после max_docs
+    документов или по таймауту делает пул, как и для Word. Профиль
+    создается один раз и переживает перезапуски, поэтому повторный запуск
+    soffice быстрый.
+    """
+
+    batch_size = 1
+
+    def __init__(self, executable=None):
+        self.executable = executable or find_soffice()
+        self.profile_dir = None
+        self.out_dir = None
+        self.proc = None
+        self.desktop = None
+
+    def start(self):
+        import uno
+        from com.sun.star.connection import NoConnectException
+
+        if self.profile_dir is None:
+            self.profile_dir = tempfile.mkdtemp(prefix='kp_soffice_')
+            self.out_dir = tempfile.mkdtemp(prefix='kp_txt_')
+        pipe_name = f"kp_soffice_{uuid.uuid4().hex}"
+        self.proc = subprocess.Popen(
+            [
+                self.executable,
+                f"-env:UserInstallation={Path(self.profile_dir).as_uri()}",
+                '--headless', '--invisible', '--norestore', '--nolockcheck', '--nodefault', '--nologo',
+                f"--accept=pipe,name={pipe_name};urp;StarOffice.ComponentContext",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+
+        local_context = uno.getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext(
+            'com.sun.star.bridge.UnoUrlResolver', local_context
+        )
+        deadline = time.monotonic() + LIBREOFFICE_START_TIMEOUT
+        while True:
+            try:
+                context = resolver.resolve(f"uno:pipe,name={pipe_name};urp;StarOffice.ComponentContext")
+                break
+            except NoConnectException:
+                if self.proc.poll() is not None:
+                    raise ConverterError(f"soffice завершился с кодом {self.proc.returncode}")
+                if time.monotonic() > deadline:
+                    self.kill()
+                    raise ConverterError("soffice не начал принимать подключения")
+                time.sleep(0.2)
+        self.desktop = context.ServiceManager.createInstanceWithContext('com.sun.star.frame.Desktop', context)
+
+    def convert(self, paths):
+        import uno
+        from com.sun.star.io import IOException
+        from com.sun.star.lang import IllegalArgumentException
+
+        results = {}
+        for path in paths:
+            try:
+                doc = self.desktop.loadComponentFromURL(
+                    uno.systemPathToFileUrl(os.path.abspath(path)), '_blank', 0,
+                    _properties(Hidden=True, ReadOnly=True)
+                )
+            except (IOException, IllegalArgumentException) as e:
+                # Файл поврежден или не является документом: soffice работает дальше
+                results[path] = (None, str(e))
+                continue
+            except Exception as e:
+                # soffice мог упасть или быть завершен сторожем
+                raise ConverterError(str(e)) from e
+            if doc is None:
+                results[path] = (None, "LibreOffice не смог открыть файл")
+                continue
+            txt_path = os.path.join(self.out_dir, 'document.txt')
+            try:
+                doc.storeToURL(
+                    uno.systemPathToFileUrl(txt_path),
+                    _properties(FilterName=LIBREOFFICE_TEXT_FILTER, FilterOptions='UTF8')
+                )
+                results[path] = (_read_text_file(txt_path), None)
+            except Exception as e:
+                results[path] = (None, str(e))
+            finally:
+                try:
+                    doc.close(True)
+                except Exception:
+                    pass
+                if os.path.exists(txt_path):
+                    os.remove(txt_path)
+        return results
+
+    def kill(self):
+        proc = self.proc
+        if proc is not None:
+            proc.kill()
+
+    def stop(self):
+        if self.desktop is not None:
+            try:
+                self.desktop.terminate()
+            except Exception:
+                pass
+            self.desktop = None
+        if self.proc is not None:
+            try:
+                self.proc.wait(10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+            self.proc = None
+
+    def close(self):
+        """Удаляет профиль и папку выгрузки после остановки конвертера."""
+        for folder in (self.profile_dir, self.out_dir):
+            if folder:
+                shutil.rmtree(folder, ignore_errors=True)
+        self.profile_dir = None
+        self.out_dir = None
+
+
+def _properties(**values):
+    """Кортеж com.sun.star.beans.PropertyValue для вызовов UNO."""
+    from com.sun.star.beans import PropertyValue
+
+    properties = []
+    for name, value in values.items():
+        prop = PropertyValue()
+        prop.Name = name
+        prop.Value = value
+        properties.append(prop)
+    return tuple(properties)
+
+
+class LibreOfficeBatchConverter:
+    """
+    Конвертер через soffice --headless --convert-to на случай, когда у
+    Python нет модуля uno (он есть в Python, поставляемом с LibreOffice, и
+    в пакете python3-uno). soffice запускается на каждую пачку файлов.
+    """
+
+    batch_size = LIBREOFFICE_BATCH_SIZE
+
+    def __init__(self, executable=None):
+        self.executable = executable or find_soffice()
+        self.profile_dir = None
+        self.proc = None
+
+    def start(self):
+        if self.profile_dir is None:
+            self.profile_dir = tempfile.mkdtemp(prefix='kp_soffice_')
+
+    def convert(self, paths):
+        out_dir = tempfile.mkdtemp(prefix='kp_txt_')
+        try:
+            self.proc = subprocess.Popen(
+                [
+                    self.executable,
+                    f"-env:UserInstallation={Path(self.profile_dir).as_uri()}",
+                    '--headless', '--norestore', '--nolockcheck',
+                    '--convert-to', 'txt:Text (encoded):UTF8',
+                    '--outdir', out_dir,
+                    *[os.path.abspath(path) for path in paths]
+                ],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+            returncode = self.proc.wait()
+            self.proc = None
+            if returncode != 0:
+                raise ConverterError(f"soffice завершился с кодом {returncode}")
+
+            results = {}
+            for path in paths:
+                txt_path = os.path.join(out_dir, os.path.splitext(os.path.basename(path))[0] + '.txt')
+                if not os.path.exists(txt_path):
+                    results[path] = (None, "LibreOffice не смог преобразовать файл")
+                    continue
+                results[path] = (_read_text_file(txt_path), None)
+            return results
+        finally:
+            shutil.rmtree(out_dir, ignore_errors=True)
+
+    def kill(self):
+        proc = self.proc
+        if proc is not None:
+            proc.kill()
+
+    def stop(self):
+        self.kill()
+
+    def close(self):
+        if self.profile_dir:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+            self.profile_dir = None
+
+
+def find_soffice():
+    """Путь к soffice или None, если LibreOffice не установлен."""
+    return shutil.which('soffice') or shutil.which('libreoffice')
+
+def default_backend():
+    """
+    Word на Windows, если установлен pywin32, иначе LibreOffice: постоянный
+    через UNO, а без модуля uno — запуском soffice на каждую пачку.
+    """
+    if sys.platform == 'win32':
+        try:
+            import win32com.client  # noqa: F401
+            return 'word'
+        except ImportError:
+            pass
+    if not find_soffice():
+        return None
+    try:
+        import uno  # noqa: F401
+        return 'libreoffice'
+    except ImportError:
+        logging.warning("Модуль uno не найден: LibreOffice будет запускаться на каждую пачку файлов .doc")
+        return 'libreoffice-batch'
+
+BACKENDS = {
+    'word': WordConverter,
+    'libreoffice': LibreOfficeConverter,
+    'libreoffice-batch': LibreOfficeBatchConverter,
+}
+
+
+class _Worker(threading.Thread):
+    """Поток, владеющий одним конвертером и обрабатывающий пачки файлов."""
+
+    def __init__(self, pool):
+        super().__init__(daemon=True)
+        self.pool = pool
+        self.converter = BACKENDS[pool.backend]()
+        self.started = False
+        self.docs_done = 0
+        # Срок текущей пачки и отметка сторожа меняются только под lock,
+        # чтобы сторож не убил конвертер, уже взявший следующую пачку
+        self.lock = threading.Lock()
+        self.deadline = None
+        self.hung = False
+
+    def run(self):
+        while True:
+            batch = self.pool._next_batch(self.converter.batch_size)
+            if batch is None:
+                break
+            self._convert_batch(batch)
+        self._stop_converter()
+        self.converter.close()
+
+    def _convert_batch(self, batch):
+        try:
+            if not self.started:
+                self.converter.start()
+                self.started = True
+            with self.lock:
+                self.deadline = time.monotonic() + self.pool.timeout * len(batch)
+                self.hung = False
+            results = self.converter.convert(batch)
+        except Exception as e:
+            logging.warning(f"Конвертер .doc перезапускается после ошибки: {e}")
+            self._stop_converter()
+            if len(batch) > 1:
+                # Неизвестно, какой файл сломал пачку: повторяем каждый отдельно
+                self.pool._retry(batch)
+            else:
+                self.pool._results.put((batch[0], None, str(e)))
+            return
+        finally:
+            with self.lock:
+                self.deadline = None
+                hung, self.hung = self.hung, False
+            if hung:
+                # Процесс конвертера был завершен сторожем
+                self._stop_converter()
+
+        for path in batch:
+            lines, error = results[path]
+            self.pool._results.put((path, lines, error))
+
+        self.docs_done += len(batch)
+        if self.docs_done >= self.pool.max_docs:
+            self._stop_converter()
+
+    def _stop_converter(self):
+        if self.started:
+            try:
+                self.converter.stop()
+            except Exception as e:
+                logging.warning(f"Ошибка остановки конвертера .doc: {e}")
+        self.started = False
+        self.docs_done = 0
+
+
+class DocConverterPool:
+    """
+    Пул постоянно запущенных конвертеров для файлов .doc.
+
+    Конвертеры запускаются один раз на рабочий поток и переиспользуются
+    для всех файлов, перезапускаясь после max_docs документов или если
+    документ обрабатывается дольше timeout секунд. Зависшие конвертеры
+    ищет отдельный поток-сторож, поэтому они завершаются, даже пока
+    результаты пула никто не читает.
+    """
+
+    def __init__(self, backend=None, workers=DEFAULT_DOC_WORKERS, max_docs=DEFAULT_MAX_DOCS, timeout=DEFAULT_TIMEOUT):
+        self.backend = backend or default_backend()
+        if self.backend not in BACKENDS:
+            raise ConverterError("Не найден ни Microsoft Word, ни LibreOffice для чтения файлов .doc")
+        self.workers = max(1, workers)
+        self.max_docs = max_docs
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._retry_queue = queue.Queue()
+        self._results = queue.Queue()
+        self._threads = []
+        self._watchdog = None
+        self._stopped = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _next_batch(self, size):
+        """Следующая пачка файлов для потока или None, если работа закончена."""
+        try:
+            return [self._retry_queue.get_nowait()]
+        except queue.Empty:
+            pass
+        path = self._queue.get()
+        if path is None:
+            return None
+        batch = [path]
+        while len(batch) < size:
+            try:
+                path = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if path is None:
+                # Оставляем признак завершения другим потокам
+                self._queue.put(None)
+                break
+            batch.append(path)
+        return batch
+
+    def _retry(self, paths):
+        # Повторы забирает тот же поток следующим вызовом _next_batch
+        for path in paths:
+            self._retry_queue.put(path)
+
+    def submit(self, paths):
+        """Ставит файлы в очередь и при необходимости запускает потоки."""
+        for path in paths:
+            self._queue.put(path)
+        while len(self._threads) < self.workers:
+            thread = _Worker(self)
+            thread.start()
+            self._threads.append(thread)
+        if self._watchdog is None:
+            self._watchdog = threading.Thread(target=self._watch, daemon=True)
+            self._watchdog.start()
+
+    def results(self, count):
+        """Выдает (путь, строки, ошибка) по мере готовности, всего count результатов."""
+        for _ in range(count):
+            yield self._results.get()
+
+    def _watch(self):
+        while not self._stopped.wait(WATCHDOG_INTERVAL):
+            self._kill_hung()
+
+    def _kill_hung(self):
+        for thread in list(self._threads):
+            with thread.lock:
+                if thread.deadline is not None and time.monotonic() > thread.deadline:
+                    logging.warning("Конвертер .doc завис и будет перезапущен")
+                    thread.hung = True
+                    thread.deadline = None
+                    thread.converter.kill()
+
+    def close(self):
+        # Необработанные файлы больше не нужны
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(self.timeout)
+        self._stopped.set()
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+        self._threads = []
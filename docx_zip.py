@@ -0,0 +1,99 @@
+import struct
+import zipfile
+import zlib
+
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+END_OF_CENTRAL_DIRECTORY = struct.Struct('<IHHHHIIH')
+
+LOCAL_HEADER_SIGNATURE = 0x04034b50
+CENTRAL_HEADER_SIGNATURE = 0x02014b50
+END_OF_CENTRAL_DIRECTORY_SIGNATURE = 0x06054b50
+
+# Версия формата zip, нужная для распаковки (2.0 — deflate)
+ZIP_VERSION = 20
+
+# Флаги записи: 0x08 — размеры после данных (мы всегда пишем их в заголовок), 0x800 — имя в UTF-8
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+ZIP32_LIMIT = 0xFFFFFFFF
+
+
+def _dos_datetime(date_time):
+    year, month, day, hour, minute, second = date_time
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+class ZipTemplate:
+    """
+    Zip-архив шаблона (.docx), из которого быстро пишутся копии с
+    несколькими замененными частями.
+
+    Архив читается в память один раз. write() копирует незатронутые части
+    (картинки, стили, шрифты, настройки) как есть, в сжатом виде, без
+    распаковки и повторного сжатия, и сжимает только переданные новые части.
+    Шифрованные архивы и zip64 не поддерживаются (ValueError).
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        self.entries = []
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                if info.flag_bits & 0x1:
+                    raise ValueError(f"{path}: зашифрованные части не поддерживаются")
+                if info.header_offset > ZIP32_LIMIT or info.compress_size > ZIP32_LIMIT:
+                    raise ValueError(f"{path}: архивы zip64 не поддерживаются")
+                name_length, extra_length = struct.unpack_from('<HH', self.data, info.header_offset + 26)
+                start = info.header_offset + LOCAL_HEADER.size + name_length + extra_length
+                self.entries.append((info, start))
+        self.names = {info.filename for info, _ in self.entries}
+
+    def raw(self, info, start):
+        return self.data[start:start + info.compress_size]
+
+    def write(self, out_path, replacements):
+        """Пишет копию архива в out_path; replacements — {имя части: новое содержимое (bytes)}."""
+        central = []
+        with open(out_path, 'wb') as out:
+            for info, start in self.entries:
+                content = replacements.get(info.filename)
+                if content is None:
+                    data = self.raw(info, start)
+                    method, crc, size = info.compress_type, info.CRC, info.file_size
+                else:
+                    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+                    data = compressor.compress(content) + compressor.flush()
+                    method, crc, size = zipfile.ZIP_DEFLATED, zlib.crc32(content), len(content)
+
+                try:
+                    name = info.filename.encode('ascii')
+                    flags = info.flag_bits & ~(FLAG_DATA_DESCRIPTOR | FLAG_UTF8)
+                except UnicodeEncodeError:
+                    name = info.filename.encode('utf-8')
+                    flags = (info.flag_bits & ~FLAG_DATA_DESCRIPTOR) | FLAG_UTF8
+                if content is not None:
+                    # Биты 1–2 — параметры сжатия исходной части, к новым данным не относятся
+                    flags &= ~0x6
+                dos_time, dos_date = _dos_datetime(info.date_time)
+                offset = out.tell()
+                out.write(LOCAL_HEADER.pack(
+                    LOCAL_HEADER_SIGNATURE, ZIP_VERSION, flags, method, dos_time, dos_date,
+                    crc, len(data), size, len(name), 0
+                ))
+                out.write(name)
+                out.write(data)
+                central.append(CENTRAL_HEADER.pack(
+                    CENTRAL_HEADER_SIGNATURE, ZIP_VERSION, ZIP_VERSION, flags, method, dos_time, dos_date,
+                    crc, len(data), size, len(name), 0, 0, 0, info.internal_attr, info.external_attr, offset
+                ) + name)
+
+            directory_offset = out.tell()
+            for header in central:
+                out.write(header)
+            out.write(END_OF_CENTRAL_DIRECTORY.pack(
+                END_OF_CENTRAL_DIRECTORY_SIGNATURE, 0, 0, len(central), len(central),
+                out.tell() - directory_offset, directory_offset, 0
+            ))
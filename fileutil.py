@@ -0,0 +1,39 @@
+import hashlib
+import os
+import sys
+
+# Имя папки локальных кэшей программы
+CACHE_DIR_NAME = 'kp_one_click'
+
+
+def file_digest(file_path):
+    """SHA-1 содержимого файла."""
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def local_cache_dir():
+    """
+    Папка кэшей программы в профиле пользователя (на Windows — в
+    LOCALAPPDATA), а не в рабочих папках, которые могут
+    синхронизироваться через Dropbox или быть общими.
+    """
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser(r'~\AppData\Local')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    folder = os.path.join(base, CACHE_DIR_NAME)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def local_cache_path(path, suffix):
+    """
+    Файл кэша для файла или папки path в local_cache_dir(). Имя содержит
+    хеш полного пути, поэтому кэши разных папок не смешиваются.
+    """
+    full_path = os.path.normcase(os.path.abspath(path))
+    digest = hashlib.sha1(full_path.encode('utf-8')).hexdigest()[:16]
+    name = os.path.basename(full_path.rstrip(os.sep)) or 'root'
+    return os.path.join(local_cache_dir(), f"{name}-{digest}{suffix}")
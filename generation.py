@@ -0,0 +1,362 @@
+import copy
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from docx_zip import ZipTemplate
+from fileutil import file_digest
+from manifest import RequestManifest
+
+# Папка для готовых документов внутри папки сохранения
+OUTPUT_SUBFOLDER = "Итоговые_документы"
+
+ADDRESSES_WITHOUT_NUMBERS_FILE = "Адреса без номеров.txt"
+ADDRESSES_WITH_NUMBERS_FILE = "Адреса запросов.txt"
+
+# Пометка в "Адреса запросов.txt" у номера, документ с которым не создан
+DOCUMENT_MISSING_MARK = " — документ не создан"
+
+# Максимальная длина имени файла документа
+MAX_FILENAME_LENGTH = 200
+
+# Документов в одном задании рабочего процесса и размер пачки, которую
+# быстрее создать в одном процессе, чем запускать пул
+RENDER_CHUNK_SIZE = 20
+SERIAL_RENDER_LIMIT = 100
+
+
+def request_output_folder(save_folder):
+    """Создает и возвращает папку для готовых документов."""
+    output_folder = os.path.join(save_folder, OUTPUT_SUBFOLDER)
+    os.makedirs(output_folder, exist_ok=True)
+    return output_folder
+
+def number_digits(start_number, count):
+    """Количество цифр в номере запроса, чтобы все номера были одной длины."""
+    return len(str(start_number + count - 1))
+
+def request_number_text(text, formatted_number):
+    """Текст с "№ /07", замененным на "№ {номер}/07", или None, если номера в тексте нет."""
+    if '№' not in text or '/07' not in text:
+        return None
+    if '№ /07' in text:
+        new_text = text.replace('№ /07', f'№ {formatted_number}/07')
+    else:
+        # Альтернативные варианты
+        new_text = re.sub(r'№\s*/07', f'№ {formatted_number}/07', text)
+        new_text = re.sub(r'№\s*(\d*)/07', f'№ {formatted_number}/07', new_text)
+    return new_text if new_text != text else None
+
+
+class RequestTemplate:
+    """
+    Шаблон запроса, разобранный один раз на всю пачку документов.
+
+    При создании шаблон читается с диска, в нем находятся абзацы с номером
+    запроса ("№ /07": текст, таблицы, колонтитулы) и строится абзац
+    реквизитов с пустыми полями. Для каждой организации save() вставляет
+    копию абзаца реквизитов и копии абзацев с номером, сохраняет файл и
+    возвращает шаблон в исходное состояние, так что остальной документ не
+    копируется и не обходится заново. Объект не потокобезопасен.
+
+    Файл пишется из zip-архива шаблона (docx_zip.ZipTemplate): заново
+    сериализуются только word/document.xml и колонтитулы с номером, а
+    картинки, стили и остальные части копируются без пересжатия. Если
+    архив так скопировать нельзя (или zip_copy=False), документ сохраняет
+    python-docx.
+    """
+
+    def __init__(self, template_path, zip_copy=True):
+        from docx import Document
+
+        self.doc = Document(template_path)
+        self.body = self.doc.element.body
+        self.number_paragraphs = [
+            (paragraph._p, paragraph.text, paragraph.part) for paragraph in self._paragraphs()
+            if '№' in paragraph.text and '/07' in paragraph.text
+        ]
+        self.requisites = self._requisites_prototype()
+
+        self.zip = None
+        if zip_copy:
+            try:
+                self.zip = ZipTemplate(template_path)
+            except ValueError as e:
+                logging.warning(f"Шаблон будет сохраняться через python-docx: {e}")
+            else:
+                # Части, которые переписываются в каждом документе
+                self.changed_parts = {self.doc.part} | {part for _, _, part in self.number_paragraphs}
+                missing = [part.partname for part in self.changed_parts if part.partname.membername not in self.zip.names]
+                if missing:
+                    logging.warning(f"Части {missing} нет в архиве шаблона, он будет сохраняться через python-docx")
+                    self.zip = None
+
+    def _paragraphs(self):
+        """Абзацы текста, таблиц и колонтитулов без повторов (объединенные ячейки и общие колонтитулы)."""
+        seen = set()
+        containers = [self.doc]
+        for table in self.doc.tables:
+            for row in table.rows:
+                containers.extend(row.cells)
+        try:
+            for section in self.doc.sections:
+                # Колонтитул, связанный с предыдущим разделом, не создаем
+                for part in (section.header, section.footer):
+                    if not part.is_linked_to_previous:
+                        containers.append(part)
+        except Exception as e:
+            logging.warning(f"Не удалось обработать колонтитулы: {str(e)}")
+        for container in containers:
+            for paragraph in container.paragraphs:
+                # Множество держит ссылки на элементы, поэтому lxml возвращает те же объекты
+                if paragraph._p not in seen:
+                    seen.add(paragraph._p)
+                    yield paragraph
+
+    def _requisites_prototype(self):
+        """Абзац реквизитов (по центру, без типов товаров); runs 0, 2 и 4 заполняются в save()."""
+        paragraph = self.doc.add_paragraph()
+        paragraph.alignment = 1  # Выравнивание по центру
+        paragraph.add_run().bold = True    # Наименование организации
+        paragraph.add_run("ИНН: ").bold = True
+        paragraph.add_run()
+        paragraph.add_run("E-mail: ").bold = True
+        paragraph.add_run()
+        paragraph.add_run("\n\n")
+        self.body.remove(paragraph._p)
+        return paragraph._p
+
+    def _requisites(self, name, inn, email):
+        from docx.text.paragraph import Paragraph
+
+        paragraph = Paragraph(copy.deepcopy(self.requisites), self.doc._body)
+        runs = paragraph.runs
+        runs[0].text = f"\n\n{name if name else 'не указано'}\n\n"
+        runs[2].text = f"{inn if inn else 'не указан'}\n"
+        runs[4].text = f"{email if email else 'не указан'}\n"
+        return paragraph._p
+
+    def save(self, file_path, name, inn, email, formatted_number):
+        """Сохраняет документ запроса для одной организации: реквизиты в начале и номер запроса."""
+        from docx.text.paragraph import Paragraph
+
+        replaced = []
+        requisites = self._requisites(name, inn, email)
+        self.body.insert(0, requisites)
+        try:
+            for original, text, _ in self.number_paragraphs:
+                new_text = request_number_text(text, formatted_number)
+                if new_text is None:
+                    continue
+                patched = copy.deepcopy(original)
+                Paragraph(patched, None).text = new_text
+                original.getparent().replace(original, patched)
+                replaced.append((original, patched))
+                logging.info(f"Заменен номер в параграфе: {text[:30]}... -> {new_text[:30]}...")
+            if self.zip is not None:
+                self.zip.write(file_path, {part.partname.membername: part.blob for part in self.changed_parts})
+            else:
+                self.doc.save(file_path)
+        finally:
+            for original, patched in replaced:
+                patched.getparent().replace(patched, original)
+            self.body.remove(requisites)
+
+def request_filename(name, formatted_number):
+    """Имя файла: "#Номер_запроса Наименование_организации" без расширения."""
+    # Очищаем наименование от недопустимых символов
+    clean_name = re.sub(r'[\\/*?:"<>|]', '_', name).strip()
+
+    # Заменяем пробелы на подчеркивания в наименовании для читаемости
+    name_for_filename = clean_name.replace(' ', '_')
+    file_name = f"#{formatted_number} {name_for_filename}.docx"
+
+    # Если имя файла получилось слишком длинным, оставляем номер и часть названия
+    if len(file_name) > MAX_FILENAME_LENGTH:
+        max_name_length = MAX_FILENAME_LENGTH - len(f"#{formatted_number} .docx")
+        name_for_filename = name_for_filename[:max_name_length]
+    return f"#{formatted_number} {name_for_filename}"
+
+def unique_request_path(output_folder, base_name, taken):
+    """
+    Путь для документа; при совпадении имени добавляется счетчик.
+    taken — имена файлов папки в нижнем регистре (список папки читается
+    один раз); выбранное имя в него добавляется.
+    """
+    file_name = f"{base_name}.docx"
+    counter = 1
+    while file_name.lower() in taken:
+        file_name = f"{base_name}_{counter}.docx"
+        counter += 1
+    taken.add(file_name.lower())
+    return os.path.join(output_folder, file_name)
+
+def write_address_files(output_folder, names, numbered_names):
+    """Создает "Адреса без номеров.txt" и "Адреса запросов.txt"."""
+    # Файл "Адреса без номеров.txt"
+    addresses_without_numbers_path = os.path.join(output_folder, ADDRESSES_WITHOUT_NUMBERS_FILE)
+    with open(addresses_without_numbers_path, 'w', encoding='utf-8') as f:
+        for address in names:
+            f.write(f"{address}\n")
+    logging.info(f"Создан файл {addresses_without_numbers_path}")
+
+    # Файл "Адреса запросов.txt" - с номерами (№) и названиями организаций (с лидирующими нулями)
+    addresses_with_numbers_path = os.path.join(output_folder, ADDRESSES_WITH_NUMBERS_FILE)
+    with open(addresses_with_numbers_path, 'w', encoding='utf-8') as f:
+        for item in numbered_names:
+            f.write(f"{item}\n")
+    logging.info(f"Создан файл {addresses_with_numbers_path}")
+
+def plan_requests(orgs, output_folder, start_number):
+    """
+    Задания на документы в порядке orgs: [(номер с нулями, наименование, ИНН, email, путь)].
+    Номера и имена файлов назначаются заранее, до создания документов.
+    """
+    digits = number_digits(start_number, len(orgs))
+    taken = {file_name.lower() for file_name in os.listdir(output_folder)}
+    plan = []
+    for number, (name, inn, email) in enumerate(orgs, start_number):
+        formatted_number = str(number).zfill(digits)
+        file_path = unique_request_path(output_folder, request_filename(name, formatted_number), taken)
+        plan.append((formatted_number, name, inn, email, file_path))
+    return plan
+
+def _render_requests(template, tasks):
+    """Создает документы заданий [(индекс, задание)]; возвращает [(индекс, текст ошибки или None)]."""
+    results = []
+    for index, (formatted_number, name, inn, email, file_path) in tasks:
+        try:
+            template.save(file_path, name, inn, email, formatted_number)
+            results.append((index, None))
+        except Exception as e:
+            results.append((index, str(e)))
+    return results
+
+# Шаблон, разобранный рабочим процессом один раз
+_worker_template = None
+
+def _init_render_worker(template_path):
+    global _worker_template
+    _worker_template = RequestTemplate(template_path)
+
+def _render_in_worker(tasks):
+    return _render_requests(_worker_template, tasks)
+
+def _render_in_pool(template_path, tasks, workers):
+    """
+    Создает документы заданий [(индекс, задание)], выдает (индекс, текст
+    ошибки или None) по мере готовности.
+    """
+    if not tasks:
+        return
+    # Без пула: один процесс или небольшая пачка (запуск процессов дороже самих документов)
+    if workers <= 1 or len(tasks) <= SERIAL_RENDER_LIMIT:
+        template = RequestTemplate(template_path)
+        for task in tasks:
+            yield from _render_requests(template, [task])
+        return
+
+    chunks = [tasks[i:i + RENDER_CHUNK_SIZE] for i in range(0, len(tasks), RENDER_CHUNK_SIZE)]
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(chunks)), initializer=_init_render_worker, initargs=(template_path,)
+    ) as executor:
+        futures = {executor.submit(_render_in_worker, chunk): chunk for chunk in chunks}
+        try:
+            for future in as_completed(futures):
+                try:
+                    results = future.result()
+                except Exception as e:
+                    # Аварийное завершение рабочего процесса: ошибка у всех документов пачки
+                    results = [(index, str(e)) for index, _ in futures[future]]
+                yield from results
+        finally:
+            # При отмене не создаем оставшиеся документы
+            for future in futures:
+                future.cancel()
+
+def generate_request_documents(orgs, template_path, output_folder, start_number, check=None, progress_callback=None,
+                               workers=None, allocator=None):
+    """
+    Создает документы запросов для организаций orgs ({(наименование, ИНН, email): типы}),
+    нумеруя их подряд с start_number, и текстовые файлы со списками адресов.
+
+    Сначала всем организациям назначаются номера и имена файлов, затем
+    документы создаются в workers процессах (по умолчанию — по числу ядер).
+    Текстовые файлы перечисляют документы в порядке orgs, поэтому не
+    зависят от порядка готовности. Номер организации, документ которой
+    создать не удалось, остается за ней (его займет документ при повторном
+    запуске), поэтому в "Адреса запросов.txt" такая организация указана
+    со своим номером и пометкой DOCUMENT_MISSING_MARK, а в "Адреса без
+    номеров.txt" ее нет.
+
+    Пачка записывается в журнал (manifest.RequestManifest). Если эту же
+    пачку запустить снова после сбоя, номера и имена файлов берутся из
+    журнала, создаются только недостающие документы, а start_number не
+    используется. Пачка, в которой созданы все документы, отмечается
+    завершенной, и повторный запуск тех же организаций — это новая пачка.
+    Для новой пачки номера выдает allocator (numbering.NumberAllocator),
+    если он передан: с start_number или со следующего свободного номера.
+
+    check() вызывается по мере готовности документов и может прервать работу
+    исключением; текстовые файлы при этом все равно создаются по готовым
+    документам. progress_callback(создано, всего) вызывается после каждого
+    документа. Возвращает (число документов, текст ошибки текстовых файлов
+    или None, первый номер пачки).
+    """
+    total_count = len(orgs)
+    template_hash = file_digest(template_path)
+    manifest = RequestManifest(output_folder)
+    resumed = manifest.resume(orgs, template_hash)
+    if resumed:
+        plan, completed = resumed
+    else:
+        if allocator:
+            start_number = allocator.allocate(total_count, start_number)
+        plan = plan_requests(orgs, output_folder, start_number)
+        completed = set()
+        manifest.start(plan, template_hash)
+    created = [index in completed for index in range(total_count)]
+    success_count = len(completed)
+    tasks = [(index, item) for index, item in enumerate(plan) if index not in completed]
+
+    text_files_error = None
+    try:
+        if progress_callback and success_count:
+            progress_callback(success_count, total_count)
+        for index, error in _render_in_pool(template_path, tasks, workers or os.cpu_count() or 1):
+            formatted_number, name, _, _, file_path = plan[index]
+            manifest.record(formatted_number, file_path, error)
+            if error:
+                logging.error(f"Ошибка при создании документа для {name}: {error}")
+            else:
+                created[index] = True
+                success_count += 1
+                logging.info(f"Создан документ {os.path.basename(file_path)} с номером {formatted_number}")
+                if progress_callback:
+                    progress_callback(success_count, total_count)
+            if check:
+                check()
+
+    finally:
+        if success_count == total_count:
+            manifest.finish()
+        manifest.close()
+        # Создаем текстовые файлы после успешного создания документов (в том числе при отмене)
+        if success_count > 0:
+            # Списки в порядке плана: "Адреса без номеров.txt" и "Адреса запросов.txt" (с номерами);
+            # номер несозданного документа указывается, чтобы пропуск в нумерации был виден
+            try:
+                write_address_files(
+                    output_folder,
+                    [name for (_, name, _, _, _), ok in zip(plan, created) if ok],
+                    [
+                        f"№{formatted_number} {name}" + ('' if ok else DOCUMENT_MISSING_MARK)
+                        for (formatted_number, name, _, _, _), ok in zip(plan, created)
+                    ]
+                )
+            except Exception as e:
+                logging.error(f"Ошибка при создании текстовых файлов: {str(e)}")
+                text_files_error = str(e)
+
+    return success_count, text_files_error, int(plan[0][0]) if plan else start_number
@@ -0,0 +1,329 @@
+import glob
+import itertools
+import json
+import logging
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from doc_converter import DEFAULT_DOC_WORKERS, ConverterError, DocConverterPool
+from fileutil import file_digest, local_cache_path
+from inn_lookup import needs_inn_lookup
+from parsing import extract_text_from_doc, extract_text_from_docx, extract_info
+
+# Наименования, с которых начинаются не реквизиты, а тексты писем
+SKIPPED_NAME_PREFIXES = ('запрос', 'добрый', 'еис', 'единая')
+
+# Кэш разбора хранится не в рабочей папке (она может синхронизироваться
+# через Dropbox, а SQLite это плохо переносит), а в локальной папке кэшей:
+# fileutil.local_cache_path(рабочая папка, CACHE_SUFFIX)
+CACHE_SUFFIX = '.ingest_cache.sqlite3'
+
+# Увеличивается при каждом изменении результата extract_info,
+# чтобы старый кэш не подмешивал устаревшие данные
+CACHE_VERSION = 5
+
+
+def list_doc_files(folder):
+    """
+    Файлы .docx и .doc рабочей папки. Список отсортирован, чтобы порядок
+    строк и нумерация не зависели от файловой системы. Файлы .docx идут
+    первыми: они разбираются быстро, и их строки выдаются сразу, не
+    дожидаясь медленного чтения .doc через конвертер (см. ingest_files).
+    """
+    return sorted(glob.glob(os.path.join(folder, '*.docx'))) + sorted(glob.glob(os.path.join(folder, '*.doc')))
+
+def default_workers():
+    """Количество рабочих процессов по умолчанию."""
+    return os.cpu_count() or 1
+
+def is_skipped_name(name):
+    """Проверяет, что извлеченное наименование не является реквизитами."""
+    return name.lower().startswith(SKIPPED_NAME_PREFIXES)
+
+def parse_file(file_path):
+    """
+    Извлекает реквизиты из одного файла .doc/.docx.
+    Выполняется в рабочем процессе, поэтому не бросает исключений,
+    а возвращает пару (info, текст ошибки).
+    """
+    try:
+        if file_path.endswith('.docx'):
+            text_lines = extract_text_from_docx(file_path)
+        else:
+            text_lines = extract_text_from_doc(file_path)
+        return extract_info(text_lines), None
+    except Exception as e:
+        return None, str(e)
+
+def _init_worker():
+    """Инициализация рабочего процесса: COM нужен для чтения .doc через Word."""
+    try:
+        import pythoncom
+        pythoncom.CoInitialize()
+    except ImportError:
+        pass
+
+class IngestCache:
+    """
+    Кэш результатов extract_info рабочей папки в SQLite (в локальной папке
+    кэшей пользователя, отдельный файл для каждой рабочей папки).
+
+    Ключ — имя файла относительно рабочей папки, запись считается актуальной,
+    пока совпадают размер и время изменения. При use_hash=True файл с
+    изменившимся временем, но прежним содержимым (например, после
+    синхронизации Dropbox) тоже берется из кэша.
+    """
+
+    def __init__(self, folder, use_hash=False, cache_path=None):
+        self.folder = folder
+        self.use_hash = use_hash
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(cache_path or local_cache_path(folder, CACHE_SUFFIX))
+        if self.conn.execute('PRAGMA user_version').fetchone()[0] != CACHE_VERSION:
+            self.conn.execute('DROP TABLE IF EXISTS files')
+            self.conn.execute(f'PRAGMA user_version = {CACHE_VERSION}')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'name TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT, info TEXT)'
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _key(self, file_path):
+        return os.path.relpath(file_path, self.folder)
+
+    def get(self, file_path):
+        """Возвращает сохраненный info или None, если файл новый или изменился."""
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        row = self.conn.execute(
+            'SELECT size, mtime_ns, hash, info FROM files WHERE name = ?', (self._key(file_path),)
+        ).fetchone()
+
+        if row is not None:
+            size, mtime_ns, file_hash, info = row
+            if size == st.st_size and mtime_ns == st.st_mtime_ns:
+                self.hits += 1
+                return json.loads(info)
+
+            if self.use_hash and size == st.st_size and file_hash and file_hash == file_digest(file_path):
+                self.conn.execute(
+                    'UPDATE files SET mtime_ns = ? WHERE name = ?', (st.st_mtime_ns, self._key(file_path))
+                )
+                self.hits += 1
+                return json.loads(info)
+
+        self.misses += 1
+        return None
+
+    def put(self, file_path, info):
+        """Сохраняет результат разбора файла."""
+        st = os.stat(file_path)
+        file_hash = file_digest(file_path) if self.use_hash else None
+        self.conn.execute(
+            'INSERT OR REPLACE INTO files (name, size, mtime_ns, hash, info) VALUES (?, ?, ?, ?, ?)',
+            (self._key(file_path), st.st_size, st.st_mtime_ns, file_hash, json.dumps(info, ensure_ascii=False))
+        )
+
+    def prune(self, file_paths):
+        """Удаляет из кэша записи о файлах, которых больше нет в папке."""
+        keep = {self._key(file_path) for file_path in file_paths}
+        names = [name for (name,) in self.conn.execute('SELECT name FROM files') if name not in keep]
+        self.conn.executemany('DELETE FROM files WHERE name = ?', [(name,) for name in names])
+        return len(names)
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+def open_cache(folder, use_hash=False):
+    """Открывает кэш разбора рабочей папки; при ошибке возвращает None."""
+    try:
+        return IngestCache(folder, use_hash)
+    except (sqlite3.Error, OSError) as e:
+        logging.warning(f"Кэш разбора недоступен, файлы будут обработаны заново: {e}")
+        return None
+
+def _parse_in_pool(doc_files, indices, workers):
+    """Разбирает файлы с указанными индексами, выдает (индекс, (info, ошибка)) по мере готовности."""
+    # Без пула: один процесс или один файл
+    if workers <= 1 or len(indices) <= 1:
+        for idx in indices:
+            yield idx, parse_file(doc_files[idx])
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(indices)), initializer=_init_worker) as executor:
+        futures = {executor.submit(parse_file, doc_files[idx]): idx for idx in indices}
+        try:
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # Аварийное завершение рабочего процесса не должно прерывать обработку папки
+                    result = (None, str(e))
+                yield futures[future], result
+        finally:
+            # При досрочной остановке (отмена задачи) не разбираем оставшиеся файлы
+            for future in futures:
+                future.cancel()
+
+def _convert_in_pool(converters, doc_files, indices):
+    """Забирает текст файлов .doc из пула конвертеров и разбирает его."""
+    index_by_path = {doc_files[idx]: idx for idx in indices}
+    for file_path, text_lines, error in converters.results(len(indices)):
+        idx = index_by_path[file_path]
+        if error:
+            yield idx, (None, error)
+            continue
+        try:
+            yield idx, (extract_info(text_lines), None)
+        except Exception as e:
+            yield idx, (None, str(e))
+
+def ingest_files(doc_files, workers=None, progress_callback=None, cache=None, doc_workers=DEFAULT_DOC_WORKERS):
+    """
+    Разбирает файлы в пуле процессов.
+
+    Генератор выдает кортежи (индекс, путь, info, ошибка) строго в порядке
+    doc_files, независимо от того, в каком порядке завершились процессы.
+    progress_callback(обработано, всего) вызывается в вызывающем потоке
+    после завершения каждого файла. Если передан cache (IngestCache),
+    неизмененные файлы берутся из него без разбора, а новые результаты
+    в него сохраняются. Файлы .doc читаются пулом из doc_workers постоянно
+    запущенных конвертеров (Word или LibreOffice) параллельно с разбором .docx.
+    Чтобы готовые результаты не копились в буфере, .doc должны идти в
+    doc_files после .docx (как в list_doc_files).
+    """
+    total = len(doc_files)
+    workers = workers or default_workers()
+
+    # Результаты, пришедшие раньше своей очереди, ждут в буфере
+    pending = {}
+    to_parse = []
+    for idx, file_path in enumerate(doc_files):
+        info = cache.get(file_path) if cache else None
+        if info is not None:
+            pending[idx] = (info, None)
+        else:
+            to_parse.append(idx)
+
+    next_idx = 0
+    processed = len(pending)
+    if progress_callback and processed:
+        progress_callback(processed, total)
+
+    while next_idx in pending:
+        info, error = pending.pop(next_idx)
+        yield next_idx, doc_files[next_idx], info, error
+        next_idx += 1
+
+    docx_indices = [idx for idx in to_parse if doc_files[idx].endswith('.docx')]
+    doc_indices = [idx for idx in to_parse if not doc_files[idx].endswith('.docx')]
+
+    # Конвертеры начинают читать .doc в фоне, пока пул процессов разбирает .docx
+    converters = None
+    if doc_indices:
+        try:
+            converters = DocConverterPool(workers=doc_workers)
+            converters.submit([doc_files[idx] for idx in doc_indices])
+        except ConverterError as e:
+            logging.warning(f"Пул конвертеров .doc недоступен, файлы будут открываться по одному: {e}")
+            docx_indices = to_parse
+
+    pool_results = _parse_in_pool(doc_files, docx_indices, workers)
+    parsed = pool_results
+    if converters:
+        parsed = itertools.chain(pool_results, _convert_in_pool(converters, doc_files, doc_indices))
+
+    try:
+        for idx, (info, error) in parsed:
+            if cache and info is not None:
+                cache.put(doc_files[idx], info)
+            pending[idx] = (info, error)
+            processed += 1
+            if progress_callback:
+                progress_callback(processed, total)
+
+            while next_idx in pending:
+                info, error = pending.pop(next_idx)
+                yield next_idx, doc_files[next_idx], info, error
+                next_idx += 1
+    finally:
+        pool_results.close()
+        if converters:
+            converters.close()
+
+def build_output_file(writer, doc_files, workers=None, progress_callback=None, inn_resolver=None,
+                      resume=False, check=None, compare_inn_value='', use_hash=False):
+    """
+    Разбирает файлы рабочей папки и записывает справочник через writer (OutputWriter).
+
+    При resume файлы, уже записанные в журнал прерванного запуска,
+    пропускаются. Если передан inn_resolver (InnResolver), после разбора
+    всех писем он отдельным этапом ищет ИНН для строк, где ИНН не найден
+    или совпадает с compare_inn_value; ИНН остальных строк пополняют его
+    локальный индекс. check() вызывается между файлами
+    и может прервать работу исключением — журнал при этом сохраняется
+    для продолжения. use_hash — сверять с кэшем разбора и содержимое
+    файлов (см. IngestCache). Возвращает число строк в справочнике.
+    """
+    folder = writer.folder
+    done_files = writer.done_files() if resume else set()
+    index_by_file = {file_path: idx for idx, file_path in enumerate(doc_files)}
+    remaining_files = [file_path for file_path in doc_files if os.path.basename(file_path) not in done_files]
+
+    # Неизмененные с прошлого запуска файлы берутся из кэша без разбора
+    cache = open_cache(folder, use_hash)
+    if cache:
+        writer.on_checkpoint = cache.commit
+
+    writer.start(resume)
+    try:
+        for _, file_path, info, error in ingest_files(remaining_files, workers, progress_callback, cache):
+            if check:
+                check()
+            if error:
+                logging.error(f"Ошибка при обработке файла {file_path}: {error}")
+                continue
+
+            try:
+                # Удаляем строку, если наименование начинается с "Запрос", "Добрый", "ЕИС", "Единая"
+                if is_skipped_name(info['Наименование']):
+                    writer.append(os.path.basename(file_path), None)
+                    continue
+
+                info['Номер п/п'] = index_by_file[file_path] + 1
+                writer.append(os.path.basename(file_path), info)
+            except Exception as e:
+                logging.error(f"Ошибка при обработке файла {file_path}: {e}")
+    finally:
+        writer.close()
+        if cache:
+            removed = cache.prune(doc_files)
+            logging.info(f"Кэш разбора: из кэша {cache.hits}, разобрано {cache.misses}, удалено записей {removed}")
+            cache.close()
+
+    inn_overrides = None
+    if inn_resolver:
+        names = set()
+        for _, row in writer.records():
+            if needs_inn_lookup(row, compare_inn_value):
+                names.add(row['Наименование'])
+            elif inn_resolver.local_index is not None:
+                # ИНН из других писем этой же папки тоже годятся для поиска
+                inn_resolver.local_index.add(row['Наименование'], row['ИНН'])
+        inn_overrides = {name: inn for name, inn in inn_resolver.resolve(sorted(names), check).items() if inn}
+
+    # Переносим накопленные строки в Excel
+    return writer.finish(inn_overrides)
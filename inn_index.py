@@ -0,0 +1,170 @@
+import logging
+import os
+
+from dedup import LEGAL_FORMS, name_key, normalize_inn
+
+# Минимальная оценка fuzz.token_sort_ratio, при которой ИНН берется из похожего наименования
+DEFAULT_MIN_SCORE = 92
+
+# Слова, которые есть почти в каждом наименовании и не помогают отбирать кандидатов
+COMMON_NAME_TOKENS = LEGAL_FORMS | {
+    'нпф', 'торговый', 'дом', 'компания', 'группа', 'завод', 'фирма', 'производственная', 'торговая',
+}
+
+# Прочитанные справочники: полный путь -> ((время изменения, размер), результат read_directory_pairs)
+_directory_pairs = {}
+
+# Весовые коэффициенты контрольных цифр ИНН
+INN10_WEIGHTS = (2, 4, 10, 3, 5, 9, 4, 6, 8)
+INN12_WEIGHTS_11 = (7, 2, 4, 10, 3, 5, 9, 4, 6, 8)
+INN12_WEIGHTS_12 = (3, 7, 2, 4, 10, 3, 5, 9, 4, 6, 8)
+
+
+def _check_digit(digits, weights):
+    return sum(int(d) * w for d, w in zip(digits, weights)) % 11 % 10
+
+def is_valid_inn(inn):
+    """Проверяет контрольные цифры ИНН (10 цифр — организация, 12 — физическое лицо)."""
+    inn = str(inn or '')
+    if not inn.isdigit():
+        return False
+    if len(inn) == 10:
+        return _check_digit(inn, INN10_WEIGHTS) == int(inn[9])
+    if len(inn) == 12:
+        return (_check_digit(inn, INN12_WEIGHTS_11) == int(inn[10])
+                and _check_digit(inn, INN12_WEIGHTS_12) == int(inn[11]))
+    return False
+
+def blocking_tokens(key):
+    """Слова нормализованного наименования, по которым отбираются кандидаты для нечеткого сравнения."""
+    return {token for token in key.split() if len(token) > 1 and token not in COMMON_NAME_TOKENS}
+
+
+class LocalInnIndex:
+    """
+    Индекс известных пар "наименование — ИНН" из уже собранных справочников.
+
+    find() сначала ищет точное совпадение нормализованного наименования,
+    затем нечеткое: кандидаты отбираются по общим значимым словам
+    (блокирование), и только они сравниваются fuzz.token_sort_ratio:
+    порядок слов не важен, а лишние слова ("Ромашка" и "Ромашка Плюс")
+    снижают оценку, в отличие от token_set_ratio.
+    В индекс попадают только ИНН с верными контрольными цифрами, кроме
+    ignored_inns (собственный ИНН из запросов, попавший в строки других
+    организаций), а наименование, встречающееся с разными ИНН, считается
+    неоднозначным.
+    """
+
+    def __init__(self, min_score=DEFAULT_MIN_SCORE, ignored_inns=()):
+        self.min_score = min_score
+        self.ignored_inns = {normalize_inn(inn) for inn in ignored_inns} - {''}
+        self.inns = {}
+        self.ambiguous = set()
+        self.blocks = {}
+
+    def __len__(self):
+        return len(self.inns)
+
+    def add(self, name, inn):
+        """Запоминает ИНН организации; неверные и игнорируемые ИНН пропускаются."""
+        inn = normalize_inn(inn)
+        key = name_key(name)
+        if not key or not is_valid_inn(inn) or inn in self.ignored_inns or key in self.ambiguous:
+            return
+        known = self.inns.get(key)
+        if known is None:
+            self.inns[key] = inn
+            for token in blocking_tokens(key):
+                self.blocks.setdefault(token, set()).add(key)
+        elif known != inn:
+            del self.inns[key]
+            self.ambiguous.add(key)
+            for token in blocking_tokens(key):
+                self.blocks[token].discard(key)
+
+    def add_directory(self, path):
+        """Добавляет строки справочника output.xlsx; возвращает число прочитанных строк."""
+        count, pairs = read_directory_pairs(path)
+        for name, inn in pairs:
+            self.add(name, inn)
+        return count
+
+    def find(self, name):
+        """(ИНН, оценка 0–100) или None, если уверенного совпадения нет."""
+        key = name_key(name)
+        if not key or key in self.ambiguous:
+            return None
+        if key in self.inns:
+            return self.inns[key], 100
+
+        candidates = set()
+        for token in blocking_tokens(key):
+            candidates.update(self.blocks.get(token, ()))
+        if not candidates:
+            return None
+
+        from fuzzywuzzy import fuzz
+
+        best_inn, best_score = None, 0
+        for candidate in candidates:
+            # force_ascii=False: иначе fuzzywuzzy выбрасывает кириллицу из строк
+            score = fuzz.token_sort_ratio(key, candidate, force_ascii=False)
+            if score > best_score:
+                best_inn, best_score = self.inns[candidate], score
+            elif score == best_score and self.inns[candidate] != best_inn:
+                # Два разных ИНН с одинаковой оценкой: угадывать не будем
+                best_inn = None
+        if best_inn is None or best_score < self.min_score:
+            return None
+        return best_inn, best_score
+
+
+def read_directory_pairs(path):
+    """
+    (число строк, [(наименование, ИНН)] строк с верным ИНН) справочника
+    output.xlsx. Пока у файла те же время изменения и размер, пары берутся
+    из памяти: обновления справочника при слежении за папкой не открывают
+    известные справочники заново.
+    """
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    full_path = os.path.abspath(path)
+    cached = _directory_pairs.get(full_path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if not header or 'Наименование' not in header or 'ИНН' not in header:
+            result = (0, [])
+        else:
+            name_col = header.index('Наименование')
+            inn_col = header.index('ИНН')
+            count = 0
+            pairs = []
+            for row in rows:
+                count += 1
+                if is_valid_inn(normalize_inn(row[inn_col])):
+                    pairs.append((row[name_col], row[inn_col]))
+            result = (count, pairs)
+    finally:
+        wb.close()
+    _directory_pairs[full_path] = (stamp, result)
+    return result
+
+def load_local_index(paths, min_score=DEFAULT_MIN_SCORE, ignored_inns=()):
+    """Индекс по существующим справочникам без ignored_inns; недоступные файлы пропускаются."""
+    index = LocalInnIndex(min_score, ignored_inns)
+    for path in dict.fromkeys(paths):
+        if not path or not os.path.exists(path):
+            continue
+        try:
+            rows = index.add_directory(path)
+            logging.info(f"Индекс ИНН: прочитано {rows} строк из {path}")
+        except Exception as e:
+            logging.warning(f"Не удалось прочитать справочник {path} для поиска ИНН: {e}")
+    return index
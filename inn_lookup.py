@@ -0,0 +1,312 @@
+import logging
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import quote, urlsplit
+
+from dedup import name_key
+from fileutil import local_cache_path
+from inn_index import is_valid_inn
+
+YANDEX_SEARCH_URL = "https://yandex.ru/search/?text={query}"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+# Кэш поиска ИНН для папки, где создается output.xlsx, — в локальной папке
+# кэшей пользователя, как и кэш разбора: папка с output.xlsx может
+# синхронизироваться через Dropbox
+INN_CACHE_SUFFIX = '.inn_cache.sqlite3'
+
+# Сколько хранить найденный ИНН и сколько — отметку "не найден", секунд
+FOUND_TTL = 180 * 24 * 3600
+NOT_FOUND_TTL = 7 * 24 * 3600
+
+# Параметры сетевого поиска: одновременные запросы, запросов в секунду на
+# один хост, таймаут запроса (с), число повторов и начальная пауза перед повтором (с)
+DEFAULT_LOOKUP_WORKERS = 4
+DEFAULT_RATE = 1.0
+DEFAULT_TIMEOUT = 10
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1.0
+
+
+def needs_inn_lookup(info, compare_inn_value):
+    """ИНН нужно искать, если он не найден в письме или совпадает с указанным значением."""
+    return not info['ИНН'] or info['ИНН'] == compare_inn_value
+
+class InnProvider:
+    """
+    Источник ИНН по наименованию организации.
+
+    open() готовит соединения для workers одновременных запросов, find()
+    возвращает ИНН или None, если его нет в ответе, и бросает исключение
+    при сетевой ошибке (такой запрос будет повторен). host нужен для
+    ограничения частоты запросов.
+    """
+
+    host = ''
+
+    def open(self, workers):
+        pass
+
+    def find(self, organization_name, timeout):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class YandexProvider(InnProvider):
+    """
+    Поиск ИНН в выдаче Яндекса. Запросы идут через общий requests.Session
+    с пулом соединений. url_template можно заменить адресом локального
+    тестового сервера.
+    """
+
+    def __init__(self, url_template=YANDEX_SEARCH_URL):
+        self.url_template = url_template
+        self.host = urlsplit(url_template).netloc
+        self.session = None
+
+    def open(self, workers):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        # Повторы делает InnResolver, адаптер только держит соединения открытыми
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def find(self, organization_name, timeout):
+        from bs4 import BeautifulSoup
+
+        search_query = f"ИНН {organization_name}"
+        url = self.url_template.format(query=quote(search_query))
+        response = self.session.get(url, timeout=timeout)
+        response.raise_for_status()
+
+        soup = BeautifulSoup(response.text, 'html.parser')
+        search_results = soup.find_all('li', class_='serp-item')
+        for result in search_results:
+            text = result.get_text()
+            # В выдаче бывают телефоны и ОГРН той же длины: берем число с верной контрольной суммой
+            for inn_match in re.finditer(r'\b\d{10,12}\b', text):
+                if is_valid_inn(inn_match.group(0)):
+                    return inn_match.group(0)
+
+        logging.warning(f"ИНН для организации '{organization_name}' не найден в поисковой выдаче Яндекс.")
+        return None
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+
+class RateLimiter:
+    """Не дает начинать запросы к одному хосту чаще rate раз в секунду."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_time = 0
+
+    def wait(self, stop_event):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+        if start > now:
+            stop_event.wait(start - now)
+
+
+def inn_cache_path(folder=None):
+    """Путь к кэшу поиска ИНН для папки folder (по умолчанию — текущей, где output.xlsx)."""
+    return local_cache_path(folder or os.getcwd(), INN_CACHE_SUFFIX)
+
+
+class InnCache:
+    """
+    Постоянный кэш поиска ИНН в SQLite.
+
+    Ключ — нормализованное наименование (см. dedup.name_key), поэтому
+    "ООО «Ромашка»" и "ООО Ромашка" ищутся один раз. Найденный ИНН хранится
+    found_ttl секунд, отметка "не найден" — not_found_ttl. Если кэш открыть
+    не удалось, он просто ничего не хранит. Соединение SQLite привязано к
+    потоку, поэтому кэш используется в том потоке, где создан.
+    """
+
+    def __init__(self, cache_path=None, found_ttl=FOUND_TTL, not_found_ttl=NOT_FOUND_TTL):
+        self.found_ttl = found_ttl
+        self.not_found_ttl = not_found_ttl
+        try:
+            self.conn = sqlite3.connect(cache_path or inn_cache_path())
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS inn_lookups (key TEXT PRIMARY KEY, inn TEXT, checked_at REAL)'
+            )
+        except sqlite3.Error as e:
+            logging.warning(f"Кэш поиска ИНН недоступен: {e}")
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, key):
+        """(есть ли актуальная запись, ИНН или None)."""
+        if self.conn is None:
+            return False, None
+        row = self.conn.execute('SELECT inn, checked_at FROM inn_lookups WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return False, None
+        inn, checked_at = row
+        ttl = self.found_ttl if inn else self.not_found_ttl
+        if time.time() - checked_at > ttl:
+            return False, None
+        return True, inn or None
+
+    def put(self, key, inn):
+        if self.conn is None:
+            return
+        self.conn.execute(
+            'INSERT OR REPLACE INTO inn_lookups (key, inn, checked_at) VALUES (?, ?, ?)',
+            (key, inn or '', time.time())
+        )
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+
+
+class InnResolver:
+    """
+    Отдельный этап поиска ИНН после разбора писем.
+
+    Наименования сначала ищутся в local_index (LocalInnIndex по уже
+    собранным справочникам), затем в кэше, остальные разрешаются одновременно
+    в workers потоках через provider (по умолчанию Яндекс) с ограничением
+    частоты запросов к хосту, таймаутом и повторами с экспоненциальной
+    паузой. Сетевые ошибки не кэшируются. progress_callback(готово, всего)
+    вызывается в вызывающем потоке.
+    """
+
+    def __init__(self, provider=None, workers=DEFAULT_LOOKUP_WORKERS, rate=DEFAULT_RATE, timeout=DEFAULT_TIMEOUT,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, cache_path=None,
+                 found_ttl=FOUND_TTL, not_found_ttl=NOT_FOUND_TTL, progress_callback=None, local_index=None):
+        self.provider = provider or YandexProvider()
+        self.local_index = local_index
+        self.workers = max(1, workers)
+        self.rate = rate
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.cache_path = cache_path
+        self.found_ttl = found_ttl
+        self.not_found_ttl = not_found_ttl
+        self.progress_callback = progress_callback
+        self.limiters = {}
+        self._stop_event = threading.Event()
+
+    def _limiter(self, host):
+        if host not in self.limiters:
+            self.limiters[host] = RateLimiter(self.rate)
+        return self.limiters[host]
+
+    def _fetch(self, organization_name):
+        """Запрос к провайдеру с повторами; бросает последнюю ошибку, если все попытки неудачны."""
+        limiter = self._limiter(self.provider.host)
+        for attempt in range(self.retries + 1):
+            limiter.wait(self._stop_event)
+            if self._stop_event.is_set():
+                raise InterruptedError("поиск ИНН прерван")
+            try:
+                return self.provider.find(organization_name, self.timeout)
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * 2 ** attempt * (1 + random.random() / 2)
+                logging.warning(f"Повтор поиска ИНН для '{organization_name}' через {delay:.1f} с: {e}")
+                if self._stop_event.wait(delay):
+                    raise InterruptedError("поиск ИНН прерван")
+
+    def resolve(self, names, check=None):
+        """
+        Ищет ИНН для наименований names. Возвращает {наименование: ИНН или None}.
+        check() вызывается по мере готовности ответов и может прервать поиск
+        исключением; уже найденные ИНН при этом сохраняются в кэше.
+        """
+        results = {}
+        by_key = {}
+        local = 0
+        for name in names:
+            key = name_key(name)
+            found = self.local_index.find(name) if self.local_index is not None and key else None
+            if found:
+                results[name] = found[0]
+                local += 1
+                logging.info(f"ИНН для '{name}' найден в справочниках: {found[0]} (совпадение {found[1]}%)")
+            elif key:
+                by_key.setdefault(key, []).append(name)
+            else:
+                results[name] = None
+
+        with InnCache(self.cache_path, self.found_ttl, self.not_found_ttl) as cache:
+            to_fetch = {}
+            for key, key_names in by_key.items():
+                cached, inn = cache.get(key)
+                if cached:
+                    for name in key_names:
+                        results[name] = inn
+                else:
+                    to_fetch[key] = key_names[0]
+
+            hits = len(by_key) - len(to_fetch)
+            errors = 0
+            if to_fetch:
+                errors = self._fetch_all(to_fetch, by_key, cache, results, check)
+            logging.info(
+                f"Поиск ИНН: из справочников {local}, из кэша {hits}, запросов {len(to_fetch)}, ошибок {errors}"
+            )
+        return results
+
+    def _fetch_all(self, to_fetch, by_key, cache, results, check):
+        """Запрашивает ИНН одновременно; результаты пишет в кэш в вызывающем потоке."""
+        errors = 0
+        done = 0
+        self._stop_event.clear()
+        self.provider.open(self.workers)
+        executor = ThreadPoolExecutor(max_workers=min(self.workers, len(to_fetch)), thread_name_prefix='inn')
+        try:
+            futures = {executor.submit(self._fetch, name): key for key, name in to_fetch.items()}
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    inn = future.result()
+                    cache.put(key, inn)
+                except Exception as e:
+                    errors += 1
+                    inn = None
+                    logging.error(f"Ошибка при поиске ИНН для организации '{to_fetch[key]}': {e}")
+                for name in by_key[key]:
+                    results[name] = inn
+
+                done += 1
+                if self.progress_callback:
+                    self.progress_callback(done, len(to_fetch))
+                if check:
+                    check()
+        finally:
+            # При отмене не ждем оставшихся запросов и пауз между повторами
+            self._stop_event.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+            self.provider.close()
+        return errors
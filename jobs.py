@@ -0,0 +1,182 @@
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Сколько фоновых задач может выполняться одновременно
+DEFAULT_MAX_JOBS = 2
+
+# Период опроса очереди событий из главного потока, мс
+POLL_INTERVAL = 100
+
+
+class JobCancelled(BaseException):
+    """
+    Задача отменена пользователем.
+    Наследуется от BaseException, чтобы обработчики "except Exception"
+    внутри задач не поглощали отмену.
+    """
+
+
+class Job:
+    """
+    Фоновая задача.
+
+    Функция задачи получает объект Job первым аргументом и должна
+    периодически вызывать job.check() (или job.progress(), который делает
+    то же самое): там задача засыпает на паузе и прерывается при отмене.
+    """
+
+    def __init__(self, runner, name, func, args, on_progress, on_done, on_error, on_cancel):
+        self.runner = runner
+        self.name = name
+        self.func = func
+        self.args = args
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_cancel = on_cancel
+        self.state = 'queued'
+        self.finish_callbacks = []
+        self._cancel_event = threading.Event()
+        self._resume_event = threading.Event()
+        self._resume_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def paused(self):
+        return not self._resume_event.is_set()
+
+    @property
+    def finished(self):
+        return self.state in ('done', 'failed', 'cancelled')
+
+    def cancel(self):
+        self._cancel_event.set()
+        # Задача на паузе должна проснуться, чтобы увидеть отмену
+        self._resume_event.set()
+
+    def pause(self):
+        if not self.finished:
+            self._resume_event.clear()
+
+    def resume(self):
+        self._resume_event.set()
+
+    def check(self):
+        """Ждет снятия паузы и бросает JobCancelled, если задача отменена."""
+        self._resume_event.wait()
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+
+    def sleep(self, seconds):
+        """Пауза внутри задачи, которую прерывает отмена."""
+        if self._cancel_event.wait(seconds):
+            raise JobCancelled()
+        self.check()
+
+    def progress(self, value, text=''):
+        """Сообщает прогресс (0–100) в главный поток."""
+        self.check()
+        self.runner._post(self, 'progress', (value, text))
+
+
+class JobRunner:
+    """
+    Выполняет задачи в рабочих потоках, не более max_jobs одновременно.
+
+    Прогресс и результаты передаются в главный поток Tk через очередь,
+    которую опрашивает root.after, поэтому обработчики on_progress,
+    on_done, on_error и on_cancel могут свободно работать с виджетами.
+    """
+
+    def __init__(self, root, max_jobs=DEFAULT_MAX_JOBS, poll_interval=POLL_INTERVAL):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix='job')
+        self.events = queue.Queue()
+        self.jobs = []
+        self.root.after(self.poll_interval, self._poll)
+
+    def submit(self, name, func, *args, on_progress=None, on_done=None, on_error=None, on_cancel=None):
+        """Ставит задачу в очередь и возвращает объект Job."""
+        job = Job(self, name, func, args, on_progress, on_done, on_error, on_cancel)
+        self.jobs.append(job)
+        self.executor.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        if job.cancelled:
+            job.state = 'cancelled'
+            self._post(job, 'cancelled', None)
+            return
+
+        job.state = 'running'
+        try:
+            result = job.func(job, *job.args)
+        except JobCancelled:
+            job.state = 'cancelled'
+            self._post(job, 'cancelled', None)
+        except Exception as e:
+            logging.error(f"Ошибка фоновой задачи '{job.name}': {e}", exc_info=True)
+            job.state = 'failed'
+            self._post(job, 'failed', e)
+        else:
+            job.state = 'done'
+            self._post(job, 'done', result)
+
+    def call_in_ui(self, func, *args):
+        """Выполняет func(*args) в главном потоке Tk; можно вызывать из любого потока."""
+        self.events.put((None, 'call', (func, args)))
+
+    def _post(self, job, kind, payload):
+        self.events.put((job, kind, payload))
+
+    def _poll(self):
+        while True:
+            try:
+                job, kind, payload = self.events.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                if kind == 'call':
+                    func, args = payload
+                    func(*args)
+                else:
+                    self._dispatch(job, kind, payload)
+            except Exception as e:
+                name = job.name if job else 'call_in_ui'
+                logging.error(f"Ошибка обработчика задачи '{name}': {e}", exc_info=True)
+        self.root.after(self.poll_interval, self._poll)
+
+    def _dispatch(self, job, kind, payload):
+        if kind == 'progress':
+            if job.on_progress:
+                job.on_progress(*payload)
+            return
+
+        self.jobs.remove(job)
+        for callback in job.finish_callbacks:
+            callback(job)
+        if kind == 'done' and job.on_done:
+            job.on_done(payload)
+        elif kind == 'failed' and job.on_error:
+            job.on_error(payload)
+        elif kind == 'cancelled' and job.on_cancel:
+            job.on_cancel()
+
+    def active_jobs(self):
+        """Задачи, которые еще выполняются или ждут очереди."""
+        return [job for job in self.jobs if not job.finished]
+
+    def cancel_all(self):
+        for job in self.jobs:
+            job.cancel()
+
+    def shutdown(self):
+        """Отменяет все задачи и не ждет их завершения."""
+        self.cancel_all()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,126 @@
+import logging
+import threading
+import time
+
+from dedup import name_key
+from directory import normalize_product_type
+
+# Сколько секунд ждать после последнего нажатия клавиши, прежде чем искать
+DEFAULT_DEBOUNCE = 0.25
+
+
+class _StaleQuery(Exception):
+    """Пока выполнялся поиск, пришел новый запрос."""
+
+
+class LiveSearch:
+    """
+    Поиск по мере ввода в отдельном потоке.
+
+    request() запоминает последний запрос; он выполняется, когда debounce
+    секунд не было новых. Если новый запрос приходит во время поиска,
+    устаревший поиск прерывается и его результат не передается. Запрос,
+    продолжающий предыдущий (тот же тип поиска, тот же справочник), ищется
+    среди найденного в прошлый раз (наименования — еще и по новым
+    триграммам запроса), а не по всему справочнику.
+
+    on_results(query, search_type, results) и on_error(exception)
+    вызываются из потока поиска.
+    """
+
+    def __init__(self, on_results, on_error=None, debounce=DEFAULT_DEBOUNCE):
+        self.on_results = on_results
+        self.on_error = on_error
+        self.debounce = debounce
+        self.condition = threading.Condition()
+        self.generation = 0
+        self.pending = None
+        self.requested_at = 0
+        self.stopped = False
+        self.previous = None
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='live-search', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.generation += 1
+            self.condition.notify()
+
+    def request(self, get_directory, query, search_type):
+        """
+        Запрашивает поиск query ("name" или "product_type"); get_directory()
+        вызывается в потоке поиска и возвращает directory.Directory.
+        """
+        with self.condition:
+            self.generation += 1
+            self.pending = (self.generation, get_directory, query, search_type)
+            self.requested_at = time.monotonic()
+            self.condition.notify()
+
+    def cancel(self):
+        """Отменяет ожидающий и выполняющийся поиск."""
+        with self.condition:
+            self.generation += 1
+            self.pending = None
+
+    def _check(self, generation):
+        if generation != self.generation:
+            raise _StaleQuery()
+
+    def _next_request(self):
+        """Следующий запрос после паузы во вводе или None, если поиск остановлен."""
+        with self.condition:
+            while not self.stopped:
+                if self.pending is None:
+                    self.condition.wait()
+                    continue
+                remaining = self.requested_at + self.debounce - time.monotonic()
+                if remaining > 0:
+                    self.condition.wait(remaining)
+                    continue
+                request, self.pending = self.pending, None
+                return request
+            return None
+
+    def _run(self):
+        while True:
+            request = self._next_request()
+            if request is None:
+                return
+            generation, get_directory, query, search_type = request
+            try:
+                results = self._search(generation, get_directory(), query, search_type)
+            except _StaleQuery:
+                continue
+            except Exception as e:
+                if generation == self.generation:
+                    logging.error(f"Ошибка поиска '{query}': {e}")
+                    if self.on_error:
+                        self.on_error(e)
+                continue
+            if generation == self.generation:
+                self.on_results(query, search_type, results)
+
+    def _search(self, generation, directory, query, search_type):
+        check = lambda: self._check(generation)
+        key = name_key(query) if search_type == 'name' else normalize_product_type(query)
+
+        within = None
+        if self.previous is not None:
+            prev_directory, prev_type, prev_key, prev_within = self.previous
+            if (prev_directory is directory and prev_type == search_type
+                    and prev_within is not None and key.startswith(prev_key)):
+                within = prev_within
+
+        if search_type == 'name':
+            results, matched = directory.find_names(query, within=within, check=check)
+        elif key:
+            results, matched = directory.find_product_types(query, within=within, check=check)
+        else:
+            results, matched = directory.all_product_types(), None
+        self.previous = (directory, search_type, key, matched)
+        return results
@@ -1,22 +1,25 @@
-from bs4 import BeautifulSoup
-from docx import Document
-from docx.shared import Pt
-from fuzzywuzzy import process, fuzz
 from tkinter import ttk, filedialog, messagebox, StringVar, Listbox, MULTIPLE, END, Tk, Entry, Button
-import glob
 import json
 import logging
+import multiprocessing
 import os
-import pandas as pd
 import re
-import requests
-import subprocess
 import tkinter as tk
-import threading
-import pythoncom
-import win32com.client as win32
 import time
 
+from directory import DirectoryError, DirectoryService
+from generation import generate_request_documents, number_digits, request_output_folder
+from ingest import build_output_file, default_workers, list_doc_files
+from inn_index import load_local_index
+from inn_lookup import InnResolver
+from jobs import JobRunner
+from live_search import LiveSearch
+from numbering import NumberAllocator
+from output_writer import OutputWriter
+from printing import is_word_installed, list_print_files, print_files
+from selection import Selection, write_requisites_file
+from watcher import FolderWatcher
+
 # Константы Word для печати
 WD_PRINT_ALL_DOCUMENT = 0
 WD_PRINT_SELECTION = 2
@@ -27,193 +30,193 @@ WD_PRINT_PRINT_TO_FILE = 5
 # Отключаем логирование для win32com
 logging.getLogger('win32com').setLevel(logging.WARNING)
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    filename=os.path.join(os.getcwd(), 'log.txt'),
-    filemode='w'
-)
-
-def extract_text_from_docx(file_path):
-    """Извлекает текст из файла .docx."""
-    doc = Document(file_path)
-    full_text = []
-    for para in doc.paragraphs:
-        full_text.append(para.text)
-    return full_text
-
-def extract_text_from_doc(file_path):
-    """Извлекает текст из файла .doc."""
-    word = win32.gencache.EnsureDispatch('Word.Application')
-    word.Visible = False
-    doc = word.Documents.Open(file_path)
-    full_text = []
-    for para in doc.Paragraphs:
-        full_text.append(para.Range.Text.strip())
-    doc.Close()
-    word.Quit()
-    return full_text
-
-def extract_info(text_lines):
-    info = {'Наименование': '', 'ИНН': '', 'Адрес': '', 'Электронная почта': '', 'Телефон': ''}
-    
-    # Убираем пустые строки
-    text_lines = [line for line in text_lines if line.strip()]
-    
-    # Останавливаем обработку при обнаружении слова "ЗАПРОС" (в любом регистре)
-    stop_index = None
-    for i, line in enumerate(text_lines):
-        if "ЗАПРОС" in line.upper():
-            stop_index = i
-            break
-    
-    # Если слово "ЗАПРОС" не найдено, ищем три пустые строки подряд
-    if stop_index is None:
-        empty_lines_count = 0
-        for i, line in enumerate(text_lines):
-            if not line.strip():
-                empty_lines_count += 1
-                if empty_lines_count == 3:
-                    stop_index = i - 2
-                    break
-            else:
-                empty_lines_count = 0
-    
-    # Если найдено условие остановки, обрезаем текст
-    if stop_index is not None:
-        text_lines = text_lines[:stop_index]
-    
-    combined_text = ' '.join(text_lines)
+def create_output_file(progress_bar, status_label):
+    """Создает файл output.xlsx на основе данных из документов."""
+    current_dir = working_folder_var.get()
+    if not current_dir:
+        messagebox.showerror("Ошибка", "Выберите рабочую папку.")
+        return
 
-    # Поиск наименования
-    inn_index = next((i for i, line in enumerate(text_lines) if 'ИНН' in line), None)
-    if inn_index is not None:
-        info['Наименование'] = ' '.join(line.strip() for line in text_lines[:inn_index])
-    else:
-        info['Наименование'] = text_lines[0].strip() if text_lines else ''
+    if not list_doc_files(current_dir):
+        messagebox.showerror("Ошибка", "В папке нет файлов .doc или .docx.")
+        return
 
-    # Удаляем обращения
-    info['Наименование'] = re.sub(
-        r'^(Руководителю|ИП|Индивидуальный предприниматель|Индивидуальному предпринимателю|Директору|Генеральному директору)\s*',
-        '', info['Наименование'], flags=re.IGNORECASE
-    ).strip()
+    if ingest_controls.job and not ingest_controls.job.finished:
+        messagebox.showwarning("Ошибка", "Справочник уже создается.")
+        return
+
+    # Если прошлый запуск по этой папке прервался, предлагаем продолжить
+    done_files = OutputWriter(output_file_path(), current_dir).done_files()
+    resume = bool(done_files) and messagebox.askyesno(
+        "Продолжение",
+        f"Найдена незавершенная обработка этой папки ({len(done_files)} файлов уже обработано).\n"
+        "Продолжить с места остановки?"
+    )
 
-    # Если наименование начинается с кавычек, добавляем "ООО"
-    if info['Наименование'].startswith(('«', '"', "'")):
-        info['Наименование'] = f"ООО {info['Наименование']}"
+    start_ingest_job(progress_bar, status_label, current_dir, resume)
 
-    # Заменяем "Общество с ограниченной ответственностью" на "ООО"
-    info['Наименование'] = info['Наименование'].replace("Общество с ограниченной ответственностью", "ООО")
+def output_file_path():
+    """Путь к создаваемому справочнику output.xlsx."""
+    return os.path.join(os.getcwd(), 'output.xlsx')
 
-    # Поиск ИНН
-    inn_match = re.search(r'ИНН\s*(\d{10,12})', combined_text)
-    if inn_match:
-        info['ИНН'] = inn_match.group(1).strip()
+def start_ingest_job(progress_bar, status_label, current_dir, resume=False, watch=False):
+    """
+    Запускает фоновое создание output.xlsx по рабочей папке.
+    В режиме слежения (watch) результат не сообщается окнами.
+    """
+    try:
+        workers = int(workers_var.get())
+    except ValueError:
+        workers = default_workers()
+
+    compare_inn = compare_inn_var.get()
+    compare_inn_value = compare_inn_value_var.get()
+
+    output_path = output_file_path()
+    # Уже собранные справочники: ИНН из них находятся без обращения к сети
+    known_directories = [output_path, output_file_var_fz.get()]
+    # Собственный ИНН из запроса не должен склеивать разные организации
+    writer = OutputWriter(output_path, current_dir, ignored_inns=[compare_inn_value])
+
+    def ingest_worker(job):
+        def update_progress(processed, total_files):
+            job.progress(processed / total_files * 100, f"Обработано {processed} из {total_files} файлов")
+
+        # Список файлов берется в момент запуска: в режиме слежения он меняется
+        doc_files = list_doc_files(current_dir)
+
+        # Если ИНН не найден или совпадает с указанным значением, ищем его после разбора:
+        # сначала в справочниках, затем через Яндекс
+        inn_resolver = None
+        if compare_inn:
+            inn_resolver = InnResolver(
+                local_index=load_local_index(known_directories, ignored_inns=[compare_inn_value]),
+                progress_callback=lambda done, total: job.progress(
+                    done / total * 100, f"Поиск ИНН: {done} из {total}"
+                )
+            )
 
-    # Поиск адреса
-    address_match = re.search(r'(?:Адрес|Юридический адрес):\s*([\s\S]+?)(?=\sE-mail|\sТелефон|$)', combined_text)
-    if address_match:
-        info['Адрес'] = address_match.group(1).strip()
+        return build_output_file(
+            writer, doc_files, workers, update_progress, inn_resolver, resume, job.check, compare_inn_value
+        )
 
-    # Поиск всех адресов электронной почты
-    emails = re.findall(r'[\w\.-]+@[\w\.-]+', combined_text)
-    if emails:
-        info['Электронная почта'] = ', '.join(emails)
+    def on_progress(value, text):
+        progress_bar['value'] = value
+        status_label.config(text=text)
 
-    # Поиск всех номеров телефонов
-    phones = re.findall(r'\+?\d[\d\s\-()]{6,}\d', combined_text)
-    if phones:
-        info['Телефон'] = ', '.join(phones)
+    def on_done(rows):
+        if watch:
+            # Вкладка "Формирование запросов" сразу ищет по обновленному справочнику
+            if not output_file_var_fz.get():
+                output_file_var_fz.set(output_path)
+            status_label.config(text=f"output.xlsx обновлен в {time.strftime('%H:%M:%S')}: {rows} строк")
+            return
+        status_label.config(text="Обработка завершена")
+        messagebox.showinfo("Успех", f"Файл output.xlsx успешно создан: {output_path}")
+
+    def on_error(e):
+        if watch:
+            # Слежение обновляет справочник заново, продолжать этот запуск не нужно
+            writer.discard()
+            status_label.config(text=f"Не удалось обновить output.xlsx: {e}")
+            return
+        status_label.config(text="Обработка завершилась с ошибкой")
+        messagebox.showerror("Ошибка", f"Не удалось создать output.xlsx:\n{e}")
 
-    # Сохраняем всю информацию до последней строки с email
-    info['Исходная информация'] = '\n'.join(text_lines)
+    def on_cancel():
+        if watch:
+            writer.discard()
+            status_label.config(text="Обновление output.xlsx прервано")
+            return
+        status_label.config(text="Обработка прервана, ее можно продолжить при следующем запуске")
 
-    return info
+    job = job_runner.submit(
+        "Создание output.xlsx", ingest_worker,
+        on_progress=on_progress, on_done=on_done, on_error=on_error, on_cancel=on_cancel
+    )
+    ingest_controls.attach(job)
+    return job
 
-def get_inn_by_name(organization_name):
-    """Поиск ИНН через Яндекс."""
-    try:
-        search_query = f"ИНН {organization_name}"
-        url = f"https://yandex.ru/search/?text={requests.utils.quote(search_query)}"
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-
-        soup = BeautifulSoup(response.text, 'html.parser')
-        search_results = soup.find_all('li', class_='serp-item')
-        for result in search_results:
-            text = result.get_text()
-            inn_match = re.search(r'\b\d{10,12}\b', text)
-            if inn_match:
-                return inn_match.group(0)
-
-        logging.warning(f"ИНН для организации '{organization_name}' не найден в поисковой выдаче Яндекс.")
-        return None
-    except Exception as e:
-        logging.error(f"Ошибка при поиске ИНН для организации '{organization_name}': {e}")
-        return None
+# Наблюдатель за рабочей папкой и признак изменений, пришедших во время обновления
+folder_watcher = None
+watch_rebuild_pending = False
+
+def toggle_watch_folder():
+    """Включает или выключает слежение за рабочей папкой."""
+    if watch_folder_var.get():
+        start_watch_folder()
+    else:
+        stop_watch_folder()
+        status_label.config(text="Слежение за папкой выключено")
+
+def start_watch_folder():
+    """Начинает следить за рабочей папкой и сразу обновляет справочник."""
+    global folder_watcher
 
-def create_output_file(progress_bar, status_label):
-    """Создает файл output.xlsx на основе данных из документов."""
     current_dir = working_folder_var.get()
-    if not current_dir:
+    if not current_dir or not os.path.isdir(current_dir):
         messagebox.showerror("Ошибка", "Выберите рабочую папку.")
+        watch_folder_var.set(False)
         return
 
-    doc_files = glob.glob(os.path.join(current_dir, '*.doc')) + glob.glob(os.path.join(current_dir, '*.docx'))
-    if not doc_files:
-        messagebox.showerror("Ошибка", "В папке нет файлов .doc или .docx.")
-        return
+    stop_watch_folder()
+    folder_watcher = FolderWatcher(current_dir, lambda paths: job_runner.call_in_ui(on_folder_changed, paths))
+    folder_watcher.start()
+    status_label.config(text=f"Слежение за папкой включено ({folder_watcher.backend})")
+    rebuild_watched_folder()
 
-    data = []
-    total_files = len(doc_files)
-    for idx, file_path in enumerate(doc_files):
-        try:
-            if file_path.endswith('.docx'):
-                text_lines = extract_text_from_docx(file_path)
-            else:
-                text_lines = extract_text_from_doc(file_path)
+def stop_watch_folder():
+    """Прекращает слежение за рабочей папкой."""
+    global folder_watcher, watch_rebuild_pending
 
-            info = extract_info(text_lines)
+    if folder_watcher is not None:
+        folder_watcher.stop()
+        folder_watcher = None
+    watch_rebuild_pending = False
 
-            # Удаляем строку, если наименование начинается с "Запрос", "Добрый", "ЕИС", "Единая"
-            if info['Наименование'].lower().startswith(('запрос', 'добрый', 'еис', 'единая')):
-                continue
+def on_folder_changed(paths):
+    """Изменения в рабочей папке (вызывается в главном потоке)."""
+    if folder_watcher is None:
+        return
+    logging.info(f"Изменены файлы рабочей папки: {', '.join(os.path.basename(path) for path in paths)}")
+    rebuild_watched_folder()
+
+def rebuild_watched_folder():
+    """
+    Обновляет output.xlsx после изменений в папке. Неизмененные файлы
+    берутся из кэша разбора, поэтому заново разбираются только затронутые.
+    """
+    global watch_rebuild_pending
 
-            info['Номер п/п'] = idx + 1
+    if folder_watcher is None:
+        return
 
-            # Если ИНН не найден или совпадает с указанным значением, ищем через Яндекс
-            if compare_inn_var.get() and (not info['ИНН'] or info['ИНН'] == compare_inn_value_var.get()):
-                inn = get_inn_by_name(info['Наименование'])
-                if inn:
-                    info['ИНН'] = inn
+    job = ingest_controls.job
+    if job and not job.finished:
+        # Обновим еще раз, когда закончится текущий запуск
+        if not watch_rebuild_pending:
+            watch_rebuild_pending = True
+            job.finish_callbacks.append(lambda _: rebuild_pending_changes())
+        return
 
-            data.append(info)
-        except Exception as e:
-            logging.error(f"Ошибка при обработке файла {file_path}: {e}")
+    start_ingest_job(progress_bar, status_label, folder_watcher.folder, watch=True)
 
-        # Обновляем прогресс
-        progress = (idx + 1) / total_files * 100
-        progress_bar['value'] = progress
-        status_label.config(text=f"Обработано {idx + 1} из {total_files} файлов")
-        root.update_idletasks()
+def rebuild_pending_changes():
+    global watch_rebuild_pending
 
-    # Создаем DataFrame и сохраняем в Excel
-    df = pd.DataFrame(data)
-    columns_order = ['Номер п/п', 'Наименование', 'ИНН', 'Адрес', 'Электронная почта', 'Телефон', 'Исходная информация']
-    df = df[columns_order]
-    output_path = os.path.join(os.getcwd(), 'output.xlsx')
-    df.to_excel(output_path, index=False)
-    messagebox.showinfo("Успех", f"Файл output.xlsx успешно создан: {output_path}")
+    if watch_rebuild_pending:
+        watch_rebuild_pending = False
+        # Обработчики завершения задачи еще не отработали, запускаем после них
+        root.after_idle(rebuild_watched_folder)
 
 def select_working_folder():
     """Выбор рабочей папки."""
     folder = filedialog.askdirectory()
     if folder:
         working_folder_var.set(folder)
+        if folder_watcher is not None:
+            # Слежение переходит на новую папку
+            start_watch_folder()
 
 def select_output_file():
     """Выбор файла output.xlsx."""
@@ -227,528 +230,225 @@ def select_template_file():
     if file:
         template_file_var_fz.set(file)
 
-def is_word_installed():
-    try:
-        word = win32.Dispatch("Word.Application")
-        word.Quit()
-        return True
-    except:
-        return False
-
-def print_first_page_vbs(file_path, progress_callback=None):
-    """Печатает первую страницу через VBS скрипт (отдельный процесс)"""
-    try:
-        abs_path = os.path.abspath(file_path)
-        if not os.path.exists(abs_path):
-            raise FileNotFoundError(f"Файл не найден: {abs_path}")
-        
-        # Создаем уникальное имя для VBS файла
-        timestamp = int(time.time() * 1000)
-        safe_filename = re.sub(r'[^a-zA-Z0-9]', '_', os.path.basename(file_path))
-        vbs_path = os.path.join(os.environ['TEMP'], f'print_{timestamp}_{safe_filename}.vbs')
-        
-        # VBS скрипт для печати первой страницы
-        vbs_script = f'''
-' VBS скрипт для печати первой страницы
-On Error Resume Next
-
-Dim Word, Doc
-Set Word = CreateObject("Word.Application")
-Word.Visible = False
-Word.DisplayAlerts = False
-
-' Открываем документ
-Set Doc = Word.Documents.Open("{abs_path}")
-
-If Err.Number <> 0 Then
-    WScript.Echo "Ошибка открытия: " & Err.Description
-    Word.Quit
-    WScript.Quit 1
-End If
-
-' Печатаем первую страницу
-' Range=4 (wdPrintRangeOfPages), Pages="1"
-Doc.PrintOut False, , , , , , , , , , , , , , 4, "1"
-
-' Ждем отправки на печать
-WScript.Sleep 2000
-
-Doc.Close False
-Word.Quit
-
-WScript.Quit 0
-'''
-        
-        # Сохраняем VBS скрипт
-        with open(vbs_path, 'w', encoding='cp1251') as f:
-            f.write(vbs_script)
-        
-        # Запускаем VBS скрипт в отдельном процессе (не ждем завершения)
-        subprocess.Popen(
-            ['cscript', '//nologo', vbs_path],
-            creationflags=subprocess.CREATE_NO_WINDOW,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
-        
-        # Сразу сообщаем об успехе
-        if progress_callback:
-            progress_callback(True, os.path.basename(file_path))
-        
-        # Планируем удаление VBS файла через 30 секунд
-        def delete_vbs():
-            time.sleep(30)
-            try:
-                if os.path.exists(vbs_path):
-                    os.remove(vbs_path)
-            except:
-                pass
-        
-        threading.Thread(target=delete_vbs, daemon=True).start()
-        
-        return True
-        
-    except Exception as e:
-        error_msg = f"Ошибка печати {os.path.basename(file_path)}: {str(e)}"
-        logging.error(error_msg)
-        if progress_callback:
-            progress_callback(False, error_msg)
-        return False
-
-def print_all_document_vbs(file_path, progress_callback=None):
-    """Печатает весь документ через VBS скрипт (отдельный процесс)"""
-    try:
-        abs_path = os.path.abspath(file_path)
-        if not os.path.exists(abs_path):
-            raise FileNotFoundError(f"Файл не найден: {abs_path}")
-        
-        # Создаем уникальное имя для VBS файла
-        timestamp = int(time.time() * 1000)
-        safe_filename = re.sub(r'[^a-zA-Z0-9]', '_', os.path.basename(file_path))
-        vbs_path = os.path.join(os.environ['TEMP'], f'print_all_{timestamp}_{safe_filename}.vbs')
-        
-        # VBS скрипт для печати всего документа
-        vbs_script = f'''
-' VBS скрипт для печати всего документа
-On Error Resume Next
-
-Dim Word, Doc
-Set Word = CreateObject("Word.Application")
-Word.Visible = False
-Word.DisplayAlerts = False
-
-' Открываем документ
-Set Doc = Word.Documents.Open("{abs_path}")
-
-If Err.Number <> 0 Then
-    WScript.Echo "Ошибка открытия: " & Err.Description
-    Word.Quit
-    WScript.Quit 1
-End If
-
-' Печатаем весь документ
-' Range=0 (wdPrintAllDocument)
-Doc.PrintOut False, , 0
-
-' Ждем отправки на печать
-WScript.Sleep 2000
-
-Doc.Close False
-Word.Quit
-
-WScript.Quit 0
-'''
-        
-        # Сохраняем VBS скрипт
-        with open(vbs_path, 'w', encoding='cp1251') as f:
-            f.write(vbs_script)
-        
-        # Запускаем VBS скрипт в отдельном процессе (не ждем завершения)
-        subprocess.Popen(
-            ['cscript', '//nologo', vbs_path],
-            creationflags=subprocess.CREATE_NO_WINDOW,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
-        
-        # Сразу сообщаем об успехе
-        if progress_callback:
-            progress_callback(True, os.path.basename(file_path))
-        
-        # Планируем удаление VBS файла через 30 секунд
-        def delete_vbs():
-            time.sleep(30)
-            try:
-                if os.path.exists(vbs_path):
-                    os.remove(vbs_path)
-            except:
-                pass
-        
-        threading.Thread(target=delete_vbs, daemon=True).start()
-        
-        return True
-        
-    except Exception as e:
-        error_msg = f"Ошибка печати {os.path.basename(file_path)}: {str(e)}"
-        logging.error(error_msg)
-        if progress_callback:
-            progress_callback(False, error_msg)
-        return False
-
 def print_first_pages():
     """Печать ТОЛЬКО ПЕРВОЙ СТРАНИЦЫ каждого документа"""
+    start_print_folder_job(
+        True,
+        "Будет напечатана ТОЛЬКО ПЕРВАЯ СТРАНИЦА {count} документов.\nПродолжить?",
+        "Печать первых страниц",
+        "Печать первых страниц завершена!"
+    )
+
+def print_all_documents():
+    """Печать ВСЕХ СТРАНИЦ каждого документа"""
+    start_print_folder_job(
+        False,
+        "Будут напечатаны ВСЕ СТРАНИЦЫ {count} документов.\nПродолжить?",
+        "Печать всех страниц",
+        "Печать всех страниц завершена!"
+    )
+
+def start_print_folder_job(first_page_only, confirm_text, title, done_text):
+    """Печатает документы папки печати в фоновой задаче после подтверждения."""
     folder = print_folder_var.get()
     if not folder:
         messagebox.showwarning("Ошибка", "Выберите папку с документами")
         return
-    
+
     try:
-        files = []
-        for ext in ['*.doc', '*.docx']:
-            files.extend(glob.glob(os.path.join(folder, ext)))
-        
+        files = list_print_files(folder)
         if not files:
             messagebox.showinfo("Информация", "В папке нет документов Word")
             return
-        
-        files.sort()
-        
-        if not messagebox.askyesno("Подтверждение", 
-                                   f"Будет напечатана ТОЛЬКО ПЕРВАЯ СТРАНИЦА {len(files)} документов.\n"
-                                   "Продолжить?"):
+
+        if not messagebox.askyesno("Подтверждение", confirm_text.format(count=len(files))):
             return
-        
-        # Создаем окно прогресса
-        progress_window = tk.Toplevel(root)
-        progress_window.title("Печать первых страниц")
-        progress_window.geometry("450x200")
-        progress_window.resizable(False, False)
-        
-        # Центрируем
-        progress_window.update_idletasks()
-        x = (progress_window.winfo_screenwidth() - 450) // 2
-        y = (progress_window.winfo_screenheight() - 200) // 2
-        progress_window.geometry(f"+{x}+{y}")
-        
-        # Элементы окна
-        label = tk.Label(progress_window, text="Подготовка к печати первых страниц...", font=('Arial', 10, 'bold'))
-        label.pack(pady=10)
-        
-        progress = ttk.Progressbar(progress_window, length=350, maximum=len(files))
-        progress.pack(pady=10)
-        
-        status = tk.Label(progress_window, text="", font=('Arial', 9))
-        status.pack(pady=5)
-        
-        counter = tk.Label(progress_window, text=f"0 из {len(files)}", font=('Arial', 9))
-        counter.pack(pady=5)
-        
-        def print_worker():
-            completed = 0
-            failed = 0
-            
-            for i, file_path in enumerate(files):
-                try:
-                    abs_path = os.path.abspath(file_path)
-                    # Создаем VBS скрипт с правильными параметрами как в рабочем макросе
-                    vbs_script = f'''
-On Error Resume Next
-Dim Word, Doc
-Set Word = CreateObject("Word.Application")
-Word.Visible = False
-Word.DisplayAlerts = False
-' Открываем документ с параметрами ReadOnly и AddToRecentFiles как в макросе
-Set Doc = Word.Documents.Open("{abs_path}", , True, True)
-If Err.Number = 0 Then
-    ' Печатаем только первую страницу с правильными параметрами
-    Doc.PrintOut False, , 4, , , , , , "1"
-    WScript.Sleep 2000
-    Doc.Close False
-End If
-Word.Quit
-WScript.Quit 0
-'''
-                    # Сохраняем VBS файл
-                    vbs_path = os.path.join(os.environ['TEMP'], f'print_first_{i}_{int(time.time())}.vbs')
-                    with open(vbs_path, 'w', encoding='cp1251') as f:
-                        f.write(vbs_script)
-                    
-                    # Запускаем VBS скрипт
-                    subprocess.Popen(
-                        ['cscript', '//nologo', vbs_path],
-                        creationflags=subprocess.CREATE_NO_WINDOW,
-                        stdout=subprocess.DEVNULL,
-                        stderr=subprocess.DEVNULL
-                    )
-                    
-                    completed += 1
-                    status.config(text=f"✓ {os.path.basename(file_path)}")
-                    
-                    # Планируем удаление VBS файла
-                    def del_vbs():
-                        time.sleep(10)
-                        try:
-                            if os.path.exists(vbs_path):
-                                os.remove(vbs_path)
-                        except:
-                            pass
-                    threading.Thread(target=del_vbs, daemon=True).start()
-                    
-                except Exception as e:
-                    failed += 1
-                    status.config(text=f"✗ {os.path.basename(file_path)}")
-                    logging.error(f"Ошибка печати {file_path}: {str(e)}")
-                
-                # Обновляем прогресс
-                progress['value'] = i + 1
-                counter.config(text=f"{i + 1} из {len(files)} (успешно: {completed}, ошибок: {failed})")
-                progress_window.update()
-                
-                # Пауза между файлами
-                time.sleep(3)
-            
-            # Завершение
-            label.config(text="Печать первых страниц завершена!")
-            status.config(text=f"Готово: {completed} файлов, ошибок: {failed}")
-            tk.Button(progress_window, text="Закрыть", 
-                     command=progress_window.destroy,
-                     width=10).pack(pady=10)
-        
-        # Запускаем в отдельном потоке
-        thread = threading.Thread(target=print_worker, daemon=True)
-        thread.start()
-        
+
+        def print_worker(job):
+            def update_progress(done, total, completed, failed, status_text):
+                job.progress(
+                    done / total * 100,
+                    f"{status_text}\n{done} из {total} (успешно: {completed}, ошибок: {failed})"
+                )
+
+            return print_files(files, first_page_only, job.check, job.sleep, update_progress)
+
+        start_job_with_window(title, print_worker, done_text)
+
     except Exception as e:
         messagebox.showerror("Ошибка", f"Ошибка: {str(e)}")
-        logging.error(f"Ошибка в print_first_pages: {str(e)}")
+        logging.error(f"Ошибка печати папки {folder}: {str(e)}")
 
-def print_all_documents():
-    """Печать ВСЕХ СТРАНИЦ каждого документа"""
-    folder = print_folder_var.get()
-    if not folder:
-        messagebox.showwarning("Ошибка", "Выберите папку с документами")
-        return
-    
-    try:
-        # Получаем все doc и docx файлы
-        files = []
-        for ext in ['*.doc', '*.docx']:
-            files.extend(glob.glob(os.path.join(folder, ext)))
-        
-        if not files:
-            messagebox.showinfo("Информация", "В папке нет документов Word")
-            return
+class JobControls:
+    """Кнопки "Пауза" и "Отменить" для фоновой задачи"""
+    def __init__(self, parent):
+        self.job = None
+        self.frame = tk.Frame(parent)
         
-        files.sort()
+        self.pause_btn = tk.Button(self.frame, text="Пауза", command=self.toggle_pause, state=tk.DISABLED, width=10)
+        self.pause_btn.pack(side=tk.LEFT, padx=5)
         
-        # Подтверждение
-        if not messagebox.askyesno("Подтверждение", 
-                                   f"Будут напечатаны ВСЕ СТРАНИЦЫ {len(files)} документов.\n"
-                                   "Продолжить?"):
+        self.cancel_btn = tk.Button(self.frame, text="Отменить", command=self.cancel, state=tk.DISABLED, width=10)
+        self.cancel_btn.pack(side=tk.LEFT, padx=5)
+    
+    def attach(self, job):
+        """Привязывает кнопки к задаче до ее завершения"""
+        self.job = job
+        self.pause_btn.config(text="Пауза", state=tk.NORMAL)
+        self.cancel_btn.config(state=tk.NORMAL)
+        job.finish_callbacks.append(self.detach)
+    
+    def detach(self, job=None):
+        self.pause_btn.config(text="Пауза", state=tk.DISABLED)
+        self.cancel_btn.config(state=tk.DISABLED)
+    
+    def toggle_pause(self):
+        if not self.job:
             return
-        
-        # Создаем окно прогресса
-        progress_window = tk.Toplevel(root)
-        progress_window.title("Печать всех страниц")
-        progress_window.geometry("450x200")
-        progress_window.resizable(False, False)
-        
-        # Центрируем
-        progress_window.update_idletasks()
-        x = (progress_window.winfo_screenwidth() - 450) // 2
-        y = (progress_window.winfo_screenheight() - 200) // 2
-        progress_window.geometry(f"+{x}+{y}")
-        
-        # Элементы окна
-        label = tk.Label(progress_window, text="Подготовка к печати всех страниц...", font=('Arial', 10, 'bold'))
-        label.pack(pady=10)
-        
-        progress = ttk.Progressbar(progress_window, length=350, maximum=len(files))
-        progress.pack(pady=10)
-        
-        status = tk.Label(progress_window, text="", font=('Arial', 9))
-        status.pack(pady=5)
-        
-        counter = tk.Label(progress_window, text=f"0 из {len(files)}", font=('Arial', 9))
-        counter.pack(pady=5)
-        
-        def print_worker():
-            completed = 0
-            failed = 0
-            
-            for i, file_path in enumerate(files):
-                try:
-                    # Используем os.startfile для печати всего документа
-                    os.startfile(file_path, "print")
-                    
-                    completed += 1
-                    status.config(text=f"✓ {os.path.basename(file_path)}")
-                    
-                except Exception as e:
-                    failed += 1
-                    status.config(text=f"✗ {os.path.basename(file_path)}")
-                    logging.error(f"Ошибка печати {file_path}: {str(e)}")
-                
-                # Обновляем прогресс
-                progress['value'] = i + 1
-                counter.config(text=f"{i + 1} из {len(files)} (успешно: {completed}, ошибок: {failed})")
-                progress_window.update()
-                
-                # Пауза между файлами
-                time.sleep(2)
-            
-            # Завершение
-            label.config(text="Печать всех страниц завершена!")
-            status.config(text=f"Готово: {completed} файлов, ошибок: {failed}")
-            tk.Button(progress_window, text="Закрыть", 
-                     command=progress_window.destroy,
-                     width=10).pack(pady=10)
-        
-        # Запускаем в отдельном потоке
-        thread = threading.Thread(target=print_worker, daemon=True)
-        thread.start()
-        
-    except Exception as e:
-        messagebox.showerror("Ошибка", f"Ошибка: {str(e)}")
-        logging.error(f"Ошибка в print_all_documents: {str(e)}")
+        if self.job.paused:
+            self.job.resume()
+            self.pause_btn.config(text="Пауза")
+        else:
+            self.job.pause()
+            self.pause_btn.config(text="Продолжить")
+    
+    def cancel(self):
+        if self.job and messagebox.askyesno("Подтверждение", f"Прервать задачу \"{self.job.name}\"?"):
+            self.job.cancel()
 
-class PrintProgressWindow:
-    """Окно прогресса печати"""
-    def __init__(self, parent, total_files):
+class JobProgressWindow:
+    """Окно прогресса фоновой задачи с кнопками паузы и отмены"""
+    def __init__(self, parent, title):
         self.top = tk.Toplevel(parent)
-        self.top.title("Печать документов")
-        self.top.geometry("450x200")
+        self.top.title(title)
+        self.top.geometry("450x230")
         self.top.resizable(False, False)
         
         # Центрируем окно
         self.top.update_idletasks()
-        x = (self.top.winfo_screenwidth() - self.top.winfo_width()) // 2
-        y = (self.top.winfo_screenheight() - self.top.winfo_height()) // 2
+        x = (self.top.winfo_screenwidth() - 450) // 2
+        y = (self.top.winfo_screenheight() - 230) // 2
         self.top.geometry(f"+{x}+{y}")
         
         # Заголовок
-        self.label = tk.Label(self.top, text="Подготовка к печати...", font=('Arial', 10, 'bold'))
+        self.label = tk.Label(self.top, text="Подготовка...", font=('Arial', 10, 'bold'))
         self.label.pack(pady=10)
         
         # Прогресс бар
-        self.progress = ttk.Progressbar(self.top, length=400, maximum=total_files)
+        self.progress = ttk.Progressbar(self.top, length=400, maximum=100)
         self.progress.pack(pady=10, padx=20)
         
         # Статус
         self.status = tk.Label(self.top, text="", font=('Arial', 9))
         self.status.pack(pady=5)
         
-        # Счетчик
-        self.counter_label = tk.Label(self.top, text=f"0 из {total_files}", font=('Arial', 9))
-        self.counter_label.pack(pady=5)
+        # Пауза и отмена
+        self.controls = JobControls(self.top)
+        self.controls.frame.pack(pady=5)
         
         # Кнопка закрытия (изначально неактивна)
-        self.close_btn = tk.Button(
-            self.top, 
-            text="Закрыть", 
-            command=self.close,
-            state=tk.DISABLED,
-            width=10
-        )
-        self.close_btn.pack(pady=10)
-        
-        self.completed = 0
-        self.failed = 0
-        self.total = total_files
-        self.is_complete = False
+        self.close_btn = tk.Button(self.top, text="Закрыть", command=self.close, state=tk.DISABLED, width=10)
+        self.close_btn.pack(pady=5)
+        self.top.protocol("WM_DELETE_WINDOW", self.close)
+    
+    def attach(self, job):
+        self.controls.attach(job)
+        job.finish_callbacks.append(lambda job: self.close_btn.config(state=tk.NORMAL))
     
-    def update(self, success, message):
+    def update(self, value, text):
         """Обновляет прогресс"""
-        if success:
-            self.completed += 1
-            status_text = f"✓ {message}"
-        else:
-            self.failed += 1
-            status_text = f"✗ {message}"
-        
-        # Обновляем прогресс
-        current = self.completed + self.failed
-        self.progress['value'] = current
-        self.counter_label.config(text=f"{current} из {self.total}")
-        self.status.config(text=status_text)
-        
-        # Если все файлы обработаны
-        if current == self.total:
-            self.is_complete = True
-            result_text = f"Завершено!\nУспешно: {self.completed}\nОшибок: {self.failed}"
-            self.label.config(text=result_text)
-            self.close_btn.config(state=tk.NORMAL)
-        
-        self.top.update()
+        if not self.top.winfo_exists():
+            return
+        self.progress['value'] = value
+        self.status.config(text=text)
+    
+    def finish(self, text):
+        if self.top.winfo_exists():
+            self.label.config(text=text)
     
     def close(self):
         """Закрывает окно прогресса"""
-        if self.is_complete or self.completed + self.failed == self.total:
-            self.top.destroy()
-        else:
-            # Если печать еще не завершена, спрашиваем подтверждение
-            if messagebox.askyesno("Подтверждение", 
-                                   "Печать еще не завершена. Прервать?"):
-                self.top.destroy()
-
-def start_print_job(print_func, files):
-    """Запускает печать в отдельном потоке"""
-    if not files:
-        messagebox.showwarning("Ошибка", "Нет файлов для печати")
-        return
+        job = self.controls.job
+        if job and not job.finished:
+            # Если задача еще не завершена, спрашиваем подтверждение
+            if not messagebox.askyesno("Подтверждение", "Задача еще не завершена. Прервать?"):
+                return
+            job.cancel()
+        self.top.destroy()
+
+def start_job_with_window(title, worker, done_text):
+    """Запускает задачу в фоне с окном прогресса; worker возвращает (успешно, ошибок)"""
+    window = JobProgressWindow(root, title)
     
-    progress_window = PrintProgressWindow(root, len(files))
+    def on_done(result):
+        completed, failed = result
+        window.finish(done_text)
+        window.status.config(text=f"Готово: {completed} файлов, ошибок: {failed}")
     
-    def worker():
-        for file_path in files:
-            if not os.path.exists(file_path):
-                progress_window.update(False, f"Файл не найден: {os.path.basename(file_path)}")
-                continue
-            
-            # Вызываем функцию печати
-            print_func(file_path, progress_window.update)
-            
-            # Небольшая пауза между заданиями печати
-            time.sleep(0.5)
+    def on_error(e):
+        window.finish("Ошибка выполнения")
+        window.status.config(text=str(e))
     
-    # Запускаем в отдельном потоке
-    thread = threading.Thread(target=worker, daemon=True)
-    thread.start()
+    def on_cancel():
+        window.finish("Прервано пользователем")
+    
+    job = job_runner.submit(title, worker, on_progress=window.update,
+                            on_done=on_done, on_error=on_error, on_cancel=on_cancel)
+    window.attach(job)
+    return job
 
 
-# Список для хранения отобранных строк
-selected_rows = []
+# Отобранные организации (строки списка selected_rows_listbox в том же порядке)
+selection = Selection()
 
-def format_product_type(product_type):
-    """Форматирует тип товара: первая буква заглавная, остальные строчные"""
-    if not product_type or not isinstance(product_type, str):
-        return product_type
-    return product_type.strip().capitalize()
+# Справочник output.xlsx в памяти: перечитывается только при изменении файла
+directory_service = DirectoryService()
 
-def update_selected_rows_listbox():
-    """Обновляет список выбранных организаций с группировкой по компании"""
-    selected_rows_listbox.delete(0, tk.END)
-    
-    # Группируем организации
-    orgs = {}
-    for name, inn, email, product_type in selected_rows:
-        key = (name, inn, email)
-        if key not in orgs:
-            orgs[key] = set()
-        if product_type and product_type != 'не указан':
-            types = [format_product_type(t.strip()) for t in str(product_type).split(',')]
-            orgs[key].update(types)
-    
-    # Выводим в список
-    for idx, ((name, inn, email), types) in enumerate(orgs.items(), 1):
-        types_str = ', '.join(sorted(types)) if types else 'не указан'
-        entry = (
-            f"{idx}. {name[:50]}{'...' if len(name) > 50 else ''}\n"
-            f"   ИНН: {inn if inn else 'не указан'}\n"
-            f"   Email: {email if email else 'не указан'}\n"
-            f"   Типы товаров: {types_str[:100]}{'...' if len(types_str) > 100 else ''}"
-        )
-        selected_rows_listbox.insert(tk.END, entry)
+# Значения строк списка результатов поиска (наименования без оценки или строки типов)
+search_result_values = []
+
+def show_search_results(values, labels=None):
+    """Заполняет список результатов; labels — отображаемый текст строк, если он отличается от значений."""
+    search_result_values[:] = values
+    search_results_listbox.delete(0, tk.END)
+    search_results_listbox.config(selectmode=tk.MULTIPLE)
+    for label in (labels if labels is not None else values):
+        search_results_listbox.insert(tk.END, label)
+
+def show_found(search_type, results):
+    """Показывает результаты поиска; у наименований рядом выводится оценка сходства."""
+    if search_type == "name":
+        show_search_results([name for name, _ in results], [f"{name}  ({score}%)" for name, score in results])
+    else:
+        show_search_results(results)
+
+def selected_entry(position):
+    """Текст строки списка выбранных организаций для организации с номером position (с нуля)"""
+    key = selection.key_at(position)
+    name, inn, email = selection.requisites(key)
+    types = selection.types(key)
+    types_str = ', '.join(sorted(types)) if types else 'не указан'
+    return (
+        f"{position + 1}. {name[:50]}{'...' if len(name) > 50 else ''}\n"
+        f"   ИНН: {inn if inn else 'не указан'}\n"
+        f"   Email: {email if email else 'не указан'}\n"
+        f"   Типы товаров: {types_str[:100]}{'...' if len(types_str) > 100 else ''}"
+    )
+
+def update_selected_rows_listbox(first=0):
+    """Перерисовывает список выбранных организаций начиная со строки first"""
+    selected_rows_listbox.delete(first, tk.END)
+    for position in range(first, len(selection)):
+        selected_rows_listbox.insert(tk.END, selected_entry(position))
+
+def patch_selected_rows_listbox(added, updated):
+    """Обновляет только измененные строки списка и дописывает новые организации"""
+    for key in updated:
+        position = selection.index(key)
+        selected_rows_listbox.delete(position)
+        selected_rows_listbox.insert(position, selected_entry(position))
+    for key in added:
+        selected_rows_listbox.insert(tk.END, selected_entry(selection.index(key)))
 
 def fuzzy_search():
     """Выполняет поиск по наименованию или типу товара (без учета регистра)"""
@@ -764,56 +464,41 @@ def fuzzy_search():
         messagebox.showwarning("Ошибка", "Файл output.xlsx не выбран или не существует.")
         return
 
+    # Если запрос пустой, показываем все типы товаров
+    if search_type == "product_type" and not query:
+        show_all_product_types()
+        return
+
+    # Поиск по мере ввода больше не нужен: результат будет сейчас
+    live_search.cancel()
     try:
-        df = pd.read_excel(output_file)
-        search_results_listbox.delete(0, tk.END)
-        search_results_listbox.config(selectmode=tk.MULTIPLE)
-        
+        directory = directory_service.get(output_file)
         if search_type == "name":
-            if 'Наименование' not in df.columns:
-                messagebox.showwarning("Ошибка", "В файле отсутствует колонка 'Наименование'.")
-                return
-                
-            # Ищем по наименованию организации (без учета регистра)
-            mask = df['Наименование'].str.lower().str.contains(query, na=False, regex=False)
-            results = df[mask]['Наименование'].tolist()
-            
-            # Добавляем в список результатов
-            for org_name in results[:50]:
-                search_results_listbox.insert(tk.END, org_name)
-                
-        elif search_type == "product_type":
-            if 'Тип товара' not in df.columns:
-                messagebox.showwarning("Ошибка", "В файле отсутствует колонка 'Тип товара'.")
-                return
-            
-            # Если запрос пустой, показываем все типы товаров
-            if not query:
-                show_all_product_types()
-                return
-            
-            # Ищем по типу товара (без учета регистра)
-            results = set()
-            for _, row in df.iterrows():
-                product_types = str(row.get('Тип товара', '')).strip()
-                if not product_types:
-                    continue
-                
-                # Разбиваем на отдельные типы товаров
-                for pt in product_types.split(','):
-                    pt_clean = pt.strip()
-                    if pt_clean and query in pt_clean.lower():
-                        formatted_pt = format_product_type(pt_clean)
-                        org_name = row.get('Наименование', '')
-                        results.add(f"{formatted_pt} | Организация: {org_name}")
-            
-            for result in sorted(results)[:50]:
-                search_results_listbox.insert(tk.END, result)
-            
+            show_found(search_type, directory.search_names(query))
+        else:
+            show_found(search_type, directory.search_product_types(query))
+
+    except DirectoryError as e:
+        messagebox.showwarning("Ошибка", str(e))
     except Exception as e:
         messagebox.showerror("Ошибка", f"Произошла ошибка: {e}")
         logging.error(f"Ошибка поиска: {str(e)}")
 
+def on_search_query_changed(*args):
+    """Запускает поиск по мере ввода; результаты приходят в show_live_results"""
+    query = search_query_var.get().strip()
+    search_type = search_type_var.get()
+    output_file = output_file_var_fz.get()
+    if not output_file or not os.path.exists(output_file) or (not query and search_type == "name"):
+        live_search.cancel()
+        return
+    live_search.request(lambda: directory_service.get(output_file), query, search_type)
+
+def show_live_results(query, search_type, results):
+    """Показывает результаты поиска по мере ввода, если запрос еще актуален"""
+    if query == search_query_var.get().strip() and search_type == search_type_var.get():
+        show_found(search_type, results)
+
 def add_selected_row():
     """Добавляет выбранные организации в список"""
     selected_indices = search_results_listbox.curselection()
@@ -822,74 +507,20 @@ def add_selected_row():
         return
 
     try:
-        df = pd.read_excel(output_file_var_fz.get())
+        directory = directory_service.get(output_file_var_fz.get())
         search_type = search_type_var.get()
-        added_count = 0
+        added = {}
+        updated = {}
 
         for index in selected_indices:
-            selected_value = search_results_listbox.get(index)
-            
-            if search_type == "product_type":
-                # Проверяем, содержит ли строка разделитель " | Организация: "
-                if " | Организация: " in selected_value:
-                    # Извлекаем тип товара и организацию из строки
-                    product_type, org_name = selected_value.split(" | Организация: ", 1)
-                    
-                    # Ищем организацию с таким наименованием (без учета регистра)
-                    mask = df['Наименование'].str.lower() == org_name.lower()
-                    matching_rows = df[mask]
-                else:
-                    # Если это просто тип товара без организации (из show_all_product_types)
-                    product_type = selected_value
-                    # Ищем все организации с таким типом товара
-                    mask = df['Тип товара'].str.lower().str.contains(product_type.lower(), na=False, regex=False)
-                    matching_rows = df[mask]
-                
-                for _, row in matching_rows.iterrows():
-                    org_data = (
-                        row['Наименование'],
-                        str(row.get('ИНН', 'не указан')),
-                        str(row.get('Электронная почта', 'не указан')),
-                        str(row.get('Тип товара', 'не указан'))
-                    )
-                    
-                    # Проверяем, есть ли уже такая организация в списке
-                    is_duplicate = False
-                    for existing in selected_rows:
-                        if existing[0] == org_data[0] and existing[1] == org_data[1]:
-                            is_duplicate = True
-                            break
-                    
-                    if not is_duplicate:
-                        selected_rows.append(org_data)
-                        added_count += 1
-            
-            elif search_type == "name":
-                # Для наименования ищем точное совпадение
-                mask = df['Наименование'] == selected_value
-                matching_rows = df[mask]
-                
-                for _, row in matching_rows.iterrows():
-                    org_data = (
-                        row['Наименование'],
-                        str(row.get('ИНН', 'не указан')),
-                        str(row.get('Электронная почта', 'не указан')),
-                        str(row.get('Тип товара', 'не указан'))
-                    )
-                    
-                    # Проверяем на дубликаты
-                    is_duplicate = False
-                    for existing in selected_rows:
-                        if existing[0] == org_data[0] and existing[1] == org_data[1]:
-                            is_duplicate = True
-                            break
-                    
-                    if not is_duplicate:
-                        selected_rows.append(org_data)
-                        added_count += 1
-
-        update_selected_rows_listbox()
-        
+            selected_value = search_result_values[index]
+            new_keys, changed_keys = selection.add(directory.records_for_result(selected_value, search_type))
+            added.update(dict.fromkeys(new_keys))
+            updated.update(dict.fromkeys(changed_keys))
+
+        patch_selected_rows_listbox(added, [key for key in updated if key not in added])
+        added_count = len(added)
+
         if added_count > 0:
             messagebox.showinfo("Успех", f"Добавлено {added_count} организаций")
         else:
@@ -906,10 +537,9 @@ def remove_selected_row():
         messagebox.showwarning("Ошибка", "Выберите строку для удаления.")
         return
     
-    for index in reversed(selected_index):
-        selected_rows.pop(index)
-    
-    update_selected_rows_listbox()
+    selection.remove([selection.key_at(index) for index in selected_index])
+    # Строки выше удаленных не меняются, ниже — сдвигаются и перенумеровываются
+    update_selected_rows_listbox(min(selected_index))
 
 def search_by_name():
     """Поиск организаций по наименованию"""
@@ -930,33 +560,20 @@ def show_all_product_types():
         return
 
     try:
-        df = pd.read_excel(output_file)
-        if 'Тип товара' not in df.columns:
-            messagebox.showwarning("Ошибка", "В файле отсутствует колонка 'Тип товара'.")
-            return
-
-        # Получаем все уникальные типы товаров с форматированием
-        product_types = set()
-        for types in df['Тип товара'].dropna():
-            if isinstance(types, str):
-                for pt in types.split(','):
-                    cleaned_pt = pt.strip()
-                    if cleaned_pt:
-                        product_types.add(format_product_type(cleaned_pt))
+        product_types = directory_service.get(output_file).all_product_types()
 
         if not product_types:
             messagebox.showinfo("Информация", "В файле не найдено типов товаров.")
             return
 
         # Очищаем и заполняем список результатов
-        search_results_listbox.delete(0, tk.END)
-        search_results_listbox.config(selectmode=tk.MULTIPLE)
-        for pt in sorted(product_types):
-            search_results_listbox.insert(tk.END, pt)
+        show_search_results(product_types)
 
         search_type_var.set("product_type")
         messagebox.showinfo("Информация", f"Найдено {len(product_types)} типов товаров.\nВы можете выбрать несколько типов для добавления.")
 
+    except DirectoryError as e:
+        messagebox.showwarning("Ошибка", str(e))
     except Exception as e:
         messagebox.showerror("Ошибка", f"Произошла ошибка: {e}")
         logging.error(f"Ошибка показа типов товаров: {str(e)}")
@@ -971,7 +588,7 @@ def generate_documents():
     """
     try:
         # Проверка наличия данных
-        if not selected_rows:
+        if not selection:
             messagebox.showerror("Ошибка", "Нет выбранных организаций")
             return
 
@@ -992,199 +609,68 @@ def generate_documents():
             start_number = 1
 
         # Создаем папку для документов
-        output_folder = os.path.join(save_folder, "Итоговые_документы")
-        os.makedirs(output_folder, exist_ok=True)
+        output_folder = request_output_folder(save_folder)
 
         # Группируем организации по названию, ИНН и email
-        orgs_dict = {}
-        for name, inn, email, product_type in selected_rows:
-            key = (name, inn, email)
-            if key not in orgs_dict:
-                orgs_dict[key] = set()
-            
-            # Типы товаров больше не нужны в реквизитах, но сохраняем для группировки
-            if product_type and product_type != 'не указан':
-                types = [t.strip() for t in str(product_type).split(',')]
-                orgs_dict[key].update(types)
+        orgs_dict = selection.grouped(format_types=False)
 
-        # Определяем максимальное количество цифр в номере
         total_count = len(orgs_dict)
-        max_number = start_number + total_count - 1
-        number_digits = len(str(max_number))
+        # Номера выдаются по журналу в папке сохранения, чтобы не пересечься с другими пользователями
+        allocator = NumberAllocator(save_folder)
         
-        # Создаем документы для каждой уникальной организации
-        success_count = 0
-        current_number = start_number
-        
-        # Списки для текстовых файлов
-        addresses_without_numbers = []  # Для файла "Адреса без номеров.txt"
-        addresses_with_numbers = []      # Для файла "Адреса запросов.txt" (с номерами)
-        
-        for (name, inn, email), product_types in orgs_dict.items():
-            try:
-                # Форматируем номер с лидирующими нулями
-                formatted_number = str(current_number).zfill(number_digits)
-                
-                # Создаем временный документ для реквизитов
-                temp_doc = Document()
-                
-                # Форматируем реквизиты (БЕЗ ТИПОВ ТОВАРОВ)
-                p = temp_doc.add_paragraph()
-                p.alignment = 1  # Выравнивание по центру
-                
-                # Наименование организации
-                name_run = p.add_run(f"\n\n{name if name else 'не указано'}\n\n")
-                name_run.bold = True
-                
-                # ИНН
-                p.add_run("ИНН: ").bold = True
-                p.add_run(f"{inn if inn else 'не указан'}\n")
-                
-                # Email
-                p.add_run("E-mail: ").bold = True
-                p.add_run(f"{email if email else 'не указан'}\n")
-                
-                # Типы товаров УДАЛЕНЫ из реквизитов
-                p.add_run("\n\n")
-
-                # Открываем основной шаблон
-                doc = Document(template_path)
-                
-                # Вставляем реквизиты в начало документа
-                for element in temp_doc.element.body:
-                    doc.element.body.insert(0, element)
-
-                # Функция для замены текста во всех элементах документа
-                def replace_text_in_paragraph(paragraph):
-                    if '№' in paragraph.text and '/07' in paragraph.text:
-                        old_text = paragraph.text
-                        # Заменяем "№ /07" на "№ {номер}/07"
-                        if '№ /07' in old_text:
-                            new_text = old_text.replace('№ /07', f'№ {formatted_number}/07')
-                        else:
-                            # Альтернативные варианты
-                            new_text = re.sub(r'№\s*/07', f'№ {formatted_number}/07', old_text)
-                            new_text = re.sub(r'№\s*(\d*)/07', f'№ {formatted_number}/07', new_text)
-                        
-                        if new_text != old_text:
-                            paragraph.text = new_text
-                            logging.info(f"Заменен номер в параграфе: {old_text[:30]}... -> {new_text[:30]}...")
-
-                # Обрабатываем все параграфы в документе
-                for paragraph in doc.paragraphs:
-                    replace_text_in_paragraph(paragraph)
-
-                # Обрабатываем все таблицы в документе
-                for table in doc.tables:
-                    for row in table.rows:
-                        for cell in row.cells:
-                            for paragraph in cell.paragraphs:
-                                replace_text_in_paragraph(paragraph)
-
-                # Обрабатываем верхние и нижние колонтитулы (если есть)
-                try:
-                    for section in doc.sections:
-                        # Верхний колонтитул
-                        header = section.header
-                        if header:
-                            for paragraph in header.paragraphs:
-                                replace_text_in_paragraph(paragraph)
-                        
-                        # Нижний колонтитул
-                        footer = section.footer
-                        if footer:
-                            for paragraph in footer.paragraphs:
-                                replace_text_in_paragraph(paragraph)
-                except Exception as e:
-                    logging.warning(f"Не удалось обработать колонтитулы: {str(e)}")
-
-                # Генерируем имя файла с номером запроса в начале (с лидирующими нулями)
-                # Очищаем наименование от недопустимых символов
-                clean_name = re.sub(r'[\\/*?:"<>|]', '_', name).strip()
-                
-                # Формируем имя файла: "#Номер_запроса Наименование_организации.docx"
-                # Заменяем пробелы на подчеркивания в наименовании для читаемости
-                name_for_filename = clean_name.replace(' ', '_')
-                file_name = f"#{formatted_number} {name_for_filename}.docx"
-                
-                # Если имя файла получилось слишком длинным (больше 200 символов), обрезаем
-                if len(file_name) > 200:
-                    # Оставляем номер и часть названия
-                    max_name_length = 200 - len(f"#{formatted_number} .docx")
-                    name_for_filename = name_for_filename[:max_name_length]
-                    file_name = f"#{formatted_number} {name_for_filename}.docx"
-                
-                file_path = os.path.join(output_folder, file_name)
-                
-                # Проверяем, не существует ли уже файл с таким именем
-                counter = 1
-                original_file_path = file_path
-                final_file_name = file_name
-                while os.path.exists(file_path):
-                    # Если файл существует, добавляем счетчик в конец имени
-                    base_name = f"#{formatted_number} {name_for_filename}"
-                    final_file_name = f"{base_name}_{counter}.docx"
-                    file_path = os.path.join(output_folder, final_file_name)
-                    counter += 1
-                
-                # Сохраняем документ
-                doc.save(file_path)
-                
-                # Добавляем информацию в списки для текстовых файлов
-                addresses_without_numbers.append(name)
-                # Для файла "Адреса запросов" добавляем номер со знаком № (с лидирующими нулями) и название организации
-                addresses_with_numbers.append(f"№{formatted_number} {name}")
-                
-                success_count += 1
-                logging.info(f"Создан документ {final_file_name} с номером {formatted_number}")
-                current_number += 1
-
-                root.update_idletasks()
-
-            except Exception as e:
-                logging.error(f"Ошибка при создании документа для {name}: {str(e)}")
-                continue
-
-        # Создаем текстовые файлы после успешного создания документов
-        if success_count > 0:
-            try:
-                # Файл "Адреса без номеров.txt"
-                addresses_without_numbers_path = os.path.join(output_folder, "Адреса без номеров.txt")
-                with open(addresses_without_numbers_path, 'w', encoding='utf-8') as f:
-                    for address in addresses_without_numbers:
-                        f.write(f"{address}\n")
-                logging.info(f"Создан файл {addresses_without_numbers_path}")
-                
-                # Файл "Адреса запросов.txt" - с номерами (№) и названиями организаций (с лидирующими нулями)
-                addresses_with_numbers_path = os.path.join(output_folder, "Адреса запросов.txt")
-                with open(addresses_with_numbers_path, 'w', encoding='utf-8') as f:
-                    for item in addresses_with_numbers:
-                        f.write(f"{item}\n")
-                logging.info(f"Создан файл {addresses_with_numbers_path}")
-                
-            except Exception as e:
-                logging.error(f"Ошибка при создании текстовых файлов: {str(e)}")
+        def generate_worker(job):
+            def update_progress(success_count, total_count):
+                job.progress(success_count / total_count * 100, f"Создано {success_count} из {total_count} документов")
+
+            return generate_request_documents(orgs_dict, template_path, output_folder, start_number, job.check, update_progress,
+                                              allocator=allocator)
+
+        def on_done(result):
+            success_count, text_files_error, first_number = result
+            # Определяем максимальное количество цифр в номере
+            max_number = first_number + total_count - 1
+            digits = number_digits(first_number, total_count)
+            refresh_start_number()
+            window.finish("Формирование документов завершено!")
+            if text_files_error:
                 messagebox.showwarning("Предупреждение", 
-                                     f"Документы созданы, но не удалось создать текстовые файлы:\n{str(e)}")
-
-            # Показываем результат
-            messagebox.showinfo(
-                "Успех",
-                f"Успешно создано {success_count} из {total_count} документов.\n"
-                f"Номера запросов: с {start_number} по {max_number}\n"
-                f"Формат номеров: {number_digits} знаков с лидирующими нулями\n"
-                f"Созданы файлы:\n"
-                f"- Адреса без номеров.txt\n"
-                f"- Адреса запросов.txt\n"
-                f"Папка: {output_folder}"
-            )
-            os.startfile(output_folder)
-        else:
+                                     f"Документы созданы, но не удалось создать текстовые файлы:\n{text_files_error}")
+
+            if success_count > 0:
+                # Показываем результат
+                messagebox.showinfo(
+                    "Успех",
+                    f"Успешно создано {success_count} из {total_count} документов.\n"
+                    f"Номера запросов: с {first_number} по {max_number}\n"
+                    f"Формат номеров: {digits} знаков с лидирующими нулями\n"
+                    f"Созданы файлы:\n"
+                    f"- Адреса без номеров.txt\n"
+                    f"- Адреса запросов.txt\n"
+                    f"Папка: {output_folder}"
+                )
+                os.startfile(output_folder)
+            else:
+                messagebox.showerror(
+                    "Ошибка",
+                    "Не удалось создать ни одного документа. Проверьте log.txt"
+                )
+
+        def on_error(e):
+            window.finish("Ошибка выполнения")
             messagebox.showerror(
-                "Ошибка",
-                "Не удалось создать ни одного документа. Проверьте log.txt"
+                "Критическая ошибка",
+                f"Произошла ошибка:\n{str(e)}\n\nПодробности в log.txt"
             )
 
+        def on_cancel():
+            window.finish("Прервано пользователем")
+
+        window = JobProgressWindow(root, "Формирование документов")
+        window.attach(job_runner.submit(
+            "Формирование документов", generate_worker,
+            on_progress=window.update, on_done=on_done, on_error=on_error, on_cancel=on_cancel
+        ))
+
     except Exception as e:
         messagebox.showerror(
             "Критическая ошибка",
@@ -1192,6 +678,26 @@ def generate_documents():
         )
         logging.error(f"Критическая ошибка: {str(e)}", exc_info=True)
 
+def refresh_start_number(*_):
+    """Подставляет в поле начального номера следующий свободный номер папки сохранения."""
+    save_folder = save_folder_var_fz.get()
+    if not save_folder or not os.path.isdir(save_folder):
+        return
+    try:
+        next_number = NumberAllocator(save_folder).next_number()
+    except OSError as e:
+        logging.warning(f"Не удалось прочитать журнал номеров запросов: {e}")
+        return
+    if next_number is None:
+        return
+    try:
+        start_number = int(start_number_var.get())
+    except ValueError:
+        start_number = 0
+    # Номер больше свободного, введенный вручную, оставляем
+    if start_number < next_number:
+        start_number_var.set(str(next_number))
+
 def clean_text(text):
     """Очистка текста от лишних символов."""
     if not text:
@@ -1241,7 +747,9 @@ def save_settings():
         'template_file_fz': template_file_var_fz.get(),
         'save_folder_fz': save_folder_var_fz.get(),
         'print_folder': print_folder_var.get(),
-        'start_number': start_number_var.get()
+        'start_number': start_number_var.get(),
+        'workers': workers_var.get(),
+        'watch_folder': watch_folder_var.get()
     }
     
     try:
@@ -1266,6 +774,11 @@ def load_settings():
             save_folder_var_fz.set(settings.get('save_folder_fz', ''))
             print_folder_var.set(settings.get('print_folder', ''))
             start_number_var.set(settings.get('start_number', '1'))
+            refresh_start_number()
+            workers_var.set(settings.get('workers', str(default_workers())))
+            watch_folder_var.set(settings.get('watch_folder', False))
+            if watch_folder_var.get():
+                start_watch_folder()
             
             messagebox.showinfo("Успех", "Настройки успешно загружены!")
         else:
@@ -1275,7 +788,7 @@ def load_settings():
 
 def create_requisites_file():
     """Создает текстовый файл с реквизитами отобранных организаций"""
-    if not selected_rows:
+    if not selection:
         messagebox.showwarning("Ошибка", "Нет отобранных организаций")
         return
 
@@ -1285,31 +798,10 @@ def create_requisites_file():
         return
 
     try:
-        output_folder = os.path.join(save_folder, "Итоговые_документы")
-        os.makedirs(output_folder, exist_ok=True)
+        output_folder = request_output_folder(save_folder)
         
         file_path = os.path.join(output_folder, "Реквизиты.txt")
-        
-        # Группируем организации для более компактного вывода
-        orgs_dict = {}
-        for name, inn, email, product_type in selected_rows:
-            key = (name, inn, email)
-            if key not in orgs_dict:
-                orgs_dict[key] = set()
-            if product_type and product_type != 'не указан':
-                types = [format_product_type(t.strip()) for t in str(product_type).split(',')]
-                orgs_dict[key].update(types)
-        
-        with open(file_path, 'w', encoding='utf-8') as f:
-            for i, ((name, inn, email), types) in enumerate(orgs_dict.items(), 1):
-                f.write(f"{i}. {name}\n")
-                f.write(f"   ИНН: {inn if inn else 'не указан'}\n")
-                f.write(f"   Email: {email if email else 'не указан'}\n")
-                
-                if types:
-                    f.write(f"   Типы товаров: {', '.join(sorted(types))}\n\n")
-                else:
-                    f.write(f"   Типы товаров: не указаны\n\n")
+        write_requisites_file(file_path, selection)
         
         messagebox.showinfo("Успех", f"Файл с реквизитами успешно создан:\n{file_path}")
         os.startfile(output_folder)
@@ -1327,258 +819,303 @@ def center_window(window, width, height):
     y = (screen_height - height) // 2
     window.geometry(f"{width}x{height}+{x}+{y}")
 
-# Создаем графический интерфейс
-root = tk.Tk()
-root.title("Коммерческие предложения в один клик v1.2")
-root.geometry("900x700")
-
-# Центрируем главное окно
-center_window(root, 900, 700)
-
-# Проверим, установлен ли Word
-if not is_word_installed():
-    messagebox.showwarning(
-        "Предупреждение", 
-        "Microsoft Word не обнаружен!\n"
-        "Функции печати будут недоступны.\n"
-        "Установите Microsoft Office для использования этой функции."
+# Интерфейс создается только в основном процессе: рабочие процессы пула
+# заново импортируют этот модуль и не должны открывать окна
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+
+    # Настройка логирования
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        filename=os.path.join(os.getcwd(), 'log.txt'),
+        filemode='w'
+    )
+
+    # Создаем графический интерфейс
+    root = tk.Tk()
+    root.title("Коммерческие предложения в один клик v1.2")
+    root.geometry("900x700")
+
+    # Центрируем главное окно
+    center_window(root, 900, 700)
+
+    # Фоновые задачи: создание справочника, формирование документов, печать
+    job_runner = JobRunner(root)
+
+    # Поиск по мере ввода: результаты передаются в главный поток
+    live_search = LiveSearch(lambda *result: job_runner.call_in_ui(show_live_results, *result))
+    live_search.start()
+
+    # Проверим, установлен ли Word
+    if not is_word_installed():
+        messagebox.showwarning(
+            "Предупреждение", 
+            "Microsoft Word не обнаружен!\n"
+            "Функции печати будут недоступны.\n"
+            "Установите Microsoft Office для использования этой функции."
+        )
+
+    # Переменные для хранения путей
+    compare_inn_value_var = tk.StringVar()
+    compare_inn_var = tk.BooleanVar()
+    output_file_var_fz = tk.StringVar()
+    save_folder_var_fz = tk.StringVar()
+    search_query_var = tk.StringVar()
+    template_file_var_fz = tk.StringVar()
+    working_folder_var = tk.StringVar()
+    print_folder_var = tk.StringVar()
+    start_number_var = tk.StringVar(value="1")
+    search_type_var = tk.StringVar(value="name")
+    workers_var = tk.StringVar(value=str(default_workers()))
+    watch_folder_var = tk.BooleanVar()
+
+    # Создаем вкладки
+    notebook = ttk.Notebook(root)
+    notebook.pack(fill='both', expand=True, padx=10, pady=10)
+
+    # Вкладка для создания output.xlsx (переименована)
+    tab1 = ttk.Frame(notebook)
+    notebook.add(tab1, text="Создать справочник реквизитов (output.xlsx)")
+
+    # Центрируем содержимое вкладки 1
+    tab1.grid_columnconfigure(0, weight=1)
+    tab1.grid_columnconfigure(1, weight=1)
+    tab1.grid_columnconfigure(2, weight=1)
+
+    tk.Label(tab1, text="Рабочая папка:").grid(row=0, column=0, padx=5, pady=5, sticky='e')
+    tk.Entry(tab1, textvariable=working_folder_var, width=50).grid(row=0, column=1, padx=5, pady=5)
+    tk.Button(tab1, text="Выбрать", command=select_working_folder).grid(row=0, column=2, padx=5, pady=5, sticky='w')
+
+    tk.Checkbutton(tab1, text="Искать ИНН через Яндекс, если не найден или совпадает с указанным", variable=compare_inn_var).grid(row=1, column=0, columnspan=3, padx=5, pady=5)
+
+    tk.Label(tab1, text="ИНН для сравнения:").grid(row=2, column=0, padx=5, pady=5, sticky='e')
+    tk.Entry(tab1, textvariable=compare_inn_value_var, width=50).grid(row=2, column=1, padx=5, pady=5)
+
+    tk.Label(tab1, text="Количество процессов:").grid(row=3, column=0, padx=5, pady=5, sticky='e')
+    tk.Entry(tab1, textvariable=workers_var, width=50).grid(row=3, column=1, padx=5, pady=5)
+
+    progress_bar = ttk.Progressbar(tab1, orient="horizontal", length=400, mode="determinate")
+    progress_bar.grid(row=4, column=0, columnspan=3, padx=5, pady=5)
+
+    status_label = tk.Label(tab1, text="Ожидание начала обработки")
+    status_label.grid(row=5, column=0, columnspan=3, padx=5, pady=5)
+
+    tk.Button(tab1, text="Создать output.xlsx", command=lambda: create_output_file(progress_bar, status_label)).grid(row=6, column=1, padx=5, pady=20)
+
+    # Пауза и отмена создания справочника
+    ingest_controls = JobControls(tab1)
+    ingest_controls.frame.grid(row=7, column=0, columnspan=3, padx=5, pady=5)
+
+    tk.Checkbutton(tab1, text="Следить за папкой и обновлять output.xlsx автоматически", variable=watch_folder_var, command=toggle_watch_folder).grid(row=8, column=0, columnspan=3, padx=5, pady=5)
+
+    # Вкладка "Формирование запросов" (теперь вторая вкладка)
+    tab2 = ttk.Frame(notebook)
+    notebook.add(tab2, text="Формирование запросов")
+
+    # Центрируем содержимое вкладки 2
+    for i in range(4):
+        tab2.grid_columnconfigure(i, weight=1)
+
+    # Элементы управления
+    controls_frame = tk.Frame(tab2)
+    controls_frame.grid(row=0, column=0, columnspan=4, padx=5, pady=5, sticky='n')
+
+    # Центрируем содержимое фрейма управления
+    controls_frame.grid_columnconfigure(1, weight=1)
+
+    # Файл шаблона
+    tk.Label(controls_frame, text="Файл шаблона:").grid(row=0, column=0, padx=5, pady=5, sticky='e')
+    tk.Entry(controls_frame, textvariable=template_file_var_fz, width=50).grid(row=0, column=1, padx=5, pady=5)
+    tk.Button(
+        controls_frame, 
+        text="Выбрать", 
+        command=select_template_file
+    ).grid(row=0, column=2, padx=5, pady=5, sticky='w')
+
+    # Файл output.xlsx
+    tk.Label(controls_frame, text="Файл output.xlsx:").grid(row=1, column=0, padx=5, pady=5, sticky='e')
+    tk.Entry(controls_frame, textvariable=output_file_var_fz, width=50).grid(row=1, column=1, padx=5, pady=5)
+    tk.Button(
+        controls_frame, 
+        text="Выбрать", 
+        command=select_output_file
+    ).grid(row=1, column=2, padx=5, pady=5, sticky='w')
+
+    # Папка для сохранения
+    tk.Label(controls_frame, text="Папка для сохранения:").grid(row=2, column=0, padx=5, pady=5, sticky='e')
+    tk.Entry(controls_frame, textvariable=save_folder_var_fz, width=50).grid(row=2, column=1, padx=5, pady=5)
+    tk.Button(
+        controls_frame, 
+        text="Выбрать", 
+        command=lambda: save_folder_var_fz.set(filedialog.askdirectory())
+    ).grid(row=2, column=2, padx=5, pady=5, sticky='w')
+
+    # Начальный номер запроса
+    tk.Label(controls_frame, text="Начальный номер запроса:").grid(row=3, column=0, padx=5, pady=5, sticky='e')
+    tk.Entry(controls_frame, textvariable=start_number_var, width=50).grid(row=3, column=1, padx=5, pady=5)
+    save_folder_var_fz.trace_add('write', refresh_start_number)
+
+    # Поисковая строка
+    search_frame = tk.Frame(tab2)
+    search_frame.grid(row=4, column=0, columnspan=4, padx=5, pady=5, sticky='n')
+
+    # Центрируем содержимое фрейма поиска
+    search_frame.grid_columnconfigure(1, weight=1)
+
+    tk.Label(search_frame, text="Поисковой запрос:").grid(row=0, column=0, padx=5, pady=5, sticky='e')
+    search_entry = tk.Entry(search_frame, textvariable=search_query_var, width=50)
+    search_entry.grid(row=0, column=1, padx=5, pady=5)
+    search_entry.focus_set()
+    search_query_var.trace_add('write', on_search_query_changed)
+
+    # Кнопки поиска
+    search_buttons_frame = tk.Frame(tab2)
+    search_buttons_frame.grid(row=5, column=0, columnspan=4, padx=5, pady=5)
+
+    tk.Button(search_buttons_frame, text="Поиск по наименованию", 
+              command=search_by_name).pack(side=tk.LEFT, padx=5)
+    tk.Button(search_buttons_frame, text="Показать все типы товаров", 
+              command=show_all_product_types).pack(side=tk.LEFT, padx=5)
+
+    # Список результатов поиска с кнопкой очистки
+    results_frame = tk.Frame(tab2)
+    results_frame.grid(row=6, column=0, columnspan=4, padx=5, pady=5, sticky='nsew')
+
+    # Настраиваем веса для растягивания
+    tab2.grid_rowconfigure(6, weight=1)
+    tab2.grid_rowconfigure(8, weight=1)
+
+    search_results_listbox = Listbox(
+        results_frame, 
+        selectmode=tk.MULTIPLE,
+        width=70,
+        height=8,
+        font=('Tahoma', 9)
     )
+    search_results_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-# Переменные для хранения путей
-compare_inn_value_var = tk.StringVar()
-compare_inn_var = tk.BooleanVar()
-output_file_var_fz = tk.StringVar()
-save_folder_var_fz = tk.StringVar()
-search_query_var = tk.StringVar()
-template_file_var_fz = tk.StringVar()
-working_folder_var = tk.StringVar()
-print_folder_var = tk.StringVar()
-start_number_var = tk.StringVar(value="1")
-search_type_var = tk.StringVar(value="name")
-
-# Создаем вкладки
-notebook = ttk.Notebook(root)
-notebook.pack(fill='both', expand=True, padx=10, pady=10)
-
-# Вкладка для создания output.xlsx (переименована)
-tab1 = ttk.Frame(notebook)
-notebook.add(tab1, text="Создать справочник реквизитов (output.xlsx)")
-
-# Центрируем содержимое вкладки 1
-tab1.grid_columnconfigure(0, weight=1)
-tab1.grid_columnconfigure(1, weight=1)
-tab1.grid_columnconfigure(2, weight=1)
-
-tk.Label(tab1, text="Рабочая папка:").grid(row=0, column=0, padx=5, pady=5, sticky='e')
-tk.Entry(tab1, textvariable=working_folder_var, width=50).grid(row=0, column=1, padx=5, pady=5)
-tk.Button(tab1, text="Выбрать", command=select_working_folder).grid(row=0, column=2, padx=5, pady=5, sticky='w')
-
-tk.Checkbutton(tab1, text="Искать ИНН через Яндекс, если не найден или совпадает с указанным", variable=compare_inn_var).grid(row=1, column=0, columnspan=3, padx=5, pady=5)
-
-tk.Label(tab1, text="ИНН для сравнения:").grid(row=2, column=0, padx=5, pady=5, sticky='e')
-tk.Entry(tab1, textvariable=compare_inn_value_var, width=50).grid(row=2, column=1, padx=5, pady=5)
-
-progress_bar = ttk.Progressbar(tab1, orient="horizontal", length=400, mode="determinate")
-progress_bar.grid(row=3, column=0, columnspan=3, padx=5, pady=5)
-
-status_label = tk.Label(tab1, text="Ожидание начала обработки")
-status_label.grid(row=4, column=0, columnspan=3, padx=5, pady=5)
-
-tk.Button(tab1, text="Создать output.xlsx", command=lambda: create_output_file(progress_bar, status_label)).grid(row=5, column=1, padx=5, pady=20)
-
-# Вкладка "Формирование запросов" (теперь вторая вкладка)
-tab2 = ttk.Frame(notebook)
-notebook.add(tab2, text="Формирование запросов")
-
-# Центрируем содержимое вкладки 2
-for i in range(4):
-    tab2.grid_columnconfigure(i, weight=1)
-
-# Элементы управления
-controls_frame = tk.Frame(tab2)
-controls_frame.grid(row=0, column=0, columnspan=4, padx=5, pady=5, sticky='n')
-
-# Центрируем содержимое фрейма управления
-controls_frame.grid_columnconfigure(1, weight=1)
-
-# Файл шаблона
-tk.Label(controls_frame, text="Файл шаблона:").grid(row=0, column=0, padx=5, pady=5, sticky='e')
-tk.Entry(controls_frame, textvariable=template_file_var_fz, width=50).grid(row=0, column=1, padx=5, pady=5)
-tk.Button(
-    controls_frame, 
-    text="Выбрать", 
-    command=select_template_file
-).grid(row=0, column=2, padx=5, pady=5, sticky='w')
-
-# Файл output.xlsx
-tk.Label(controls_frame, text="Файл output.xlsx:").grid(row=1, column=0, padx=5, pady=5, sticky='e')
-tk.Entry(controls_frame, textvariable=output_file_var_fz, width=50).grid(row=1, column=1, padx=5, pady=5)
-tk.Button(
-    controls_frame, 
-    text="Выбрать", 
-    command=select_output_file
-).grid(row=1, column=2, padx=5, pady=5, sticky='w')
-
-# Папка для сохранения
-tk.Label(controls_frame, text="Папка для сохранения:").grid(row=2, column=0, padx=5, pady=5, sticky='e')
-tk.Entry(controls_frame, textvariable=save_folder_var_fz, width=50).grid(row=2, column=1, padx=5, pady=5)
-tk.Button(
-    controls_frame, 
-    text="Выбрать", 
-    command=lambda: save_folder_var_fz.set(filedialog.askdirectory())
-).grid(row=2, column=2, padx=5, pady=5, sticky='w')
-
-# Начальный номер запроса
-tk.Label(controls_frame, text="Начальный номер запроса:").grid(row=3, column=0, padx=5, pady=5, sticky='e')
-tk.Entry(controls_frame, textvariable=start_number_var, width=50).grid(row=3, column=1, padx=5, pady=5)
-
-# Поисковая строка
-search_frame = tk.Frame(tab2)
-search_frame.grid(row=4, column=0, columnspan=4, padx=5, pady=5, sticky='n')
-
-# Центрируем содержимое фрейма поиска
-search_frame.grid_columnconfigure(1, weight=1)
-
-tk.Label(search_frame, text="Поисковой запрос:").grid(row=0, column=0, padx=5, pady=5, sticky='e')
-search_entry = tk.Entry(search_frame, textvariable=search_query_var, width=50)
-search_entry.grid(row=0, column=1, padx=5, pady=5)
-search_entry.focus_set()
-
-# Кнопки поиска
-search_buttons_frame = tk.Frame(tab2)
-search_buttons_frame.grid(row=5, column=0, columnspan=4, padx=5, pady=5)
-
-tk.Button(search_buttons_frame, text="Поиск по наименованию", 
-          command=search_by_name).pack(side=tk.LEFT, padx=5)
-tk.Button(search_buttons_frame, text="Показать все типы товаров", 
-          command=show_all_product_types).pack(side=tk.LEFT, padx=5)
-
-# Список результатов поиска с кнопкой очистки
-results_frame = tk.Frame(tab2)
-results_frame.grid(row=6, column=0, columnspan=4, padx=5, pady=5, sticky='nsew')
-
-# Настраиваем веса для растягивания
-tab2.grid_rowconfigure(6, weight=1)
-tab2.grid_rowconfigure(8, weight=1)
-
-search_results_listbox = Listbox(
-    results_frame, 
-    selectmode=tk.MULTIPLE,
-    width=70,
-    height=8,
-    font=('Tahoma', 9)
-)
-search_results_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-
-scrollbar = ttk.Scrollbar(results_frame, orient="vertical", command=search_results_listbox.yview)
-scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-search_results_listbox.config(yscrollcommand=scrollbar.set)
-
-clear_results_btn = tk.Button(
-    results_frame,
-    text="Очистить",
-    command=lambda: search_results_listbox.delete(0, tk.END),
-    width=8
-)
-clear_results_btn.pack(side=tk.RIGHT, padx=(5,0))
-
-# Кнопка добавления выбранного
-add_button_frame = tk.Frame(tab2)
-add_button_frame.grid(row=7, column=0, columnspan=4, padx=5, pady=5)
-
-tk.Button(add_button_frame, text="Добавить выбранное", 
-          command=add_selected_row).pack()
-
-# Список отобранных организаций с кнопкой очистки
-selected_frame = tk.Frame(tab2)
-selected_frame.grid(row=8, column=0, columnspan=4, padx=5, pady=5, sticky='nsew')
-
-selected_rows_listbox = Listbox(
-    selected_frame,
-    selectmode=tk.MULTIPLE,
-    width=70,
-    height=8,
-    font=('Tahoma', 9),
-    bg='#f0f0f0',
-    selectbackground='#a6d8ff'
-)
-selected_rows_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-
-scrollbar_selected = ttk.Scrollbar(selected_frame, orient="vertical", command=selected_rows_listbox.yview)
-scrollbar_selected.pack(side=tk.RIGHT, fill=tk.Y)
-selected_rows_listbox.config(yscrollcommand=scrollbar_selected.set)
-
-clear_selected_btn = tk.Button(
-    selected_frame,
-    text="Очистить",
-    command=lambda: [selected_rows.clear(), update_selected_rows_listbox()],
-    width=8,
-    bg='#ffdddd'
-)
-clear_selected_btn.pack(side=tk.RIGHT, padx=(5,0))
-
-# Кнопка удаления выбранного
-remove_button_frame = tk.Frame(tab2)
-remove_button_frame.grid(row=9, column=0, columnspan=4, padx=5, pady=5)
-
-tk.Button(remove_button_frame, text="Удалить выбранное", 
-          command=remove_selected_row).pack()
-
-# Кнопки формирования документов
-doc_buttons_frame = tk.Frame(tab2)
-doc_buttons_frame.grid(row=10, column=0, columnspan=4, padx=5, pady=10)
-
-tk.Button(doc_buttons_frame, 
-          text="Сформировать текстовый файл с реквизитами", 
-          command=create_requisites_file,
-          bg="#e6e6fa").pack(side=tk.LEFT, padx=5)
-
-tk.Button(doc_buttons_frame, 
-          text="Сформировать документы", 
-          command=generate_documents).pack(side=tk.LEFT, padx=5)
-
-# Привязка горячих клавиш
-root.bind('<Return>', lambda e: search_by_name())
-
-# Вкладка "Печать"
-tab3 = ttk.Frame(notebook)
-notebook.add(tab3, text="Печать")
-
-# Центрируем содержимое вкладки 3
-tab3.grid_columnconfigure(0, weight=1)
-tab3.grid_columnconfigure(1, weight=1)
-tab3.grid_columnconfigure(2, weight=1)
-
-tk.Label(tab3, text="Папка с документами:").grid(row=0, column=0, padx=5, pady=5, sticky='e')
-tk.Entry(tab3, textvariable=print_folder_var, width=50).grid(row=0, column=1, padx=5, pady=5)
-tk.Button(tab3, text="Выбрать", command=lambda: print_folder_var.set(filedialog.askdirectory())).grid(row=0, column=2, padx=5, pady=5, sticky='w')
-
-# Добавляем кнопки печати с подтверждением
-tk.Button(tab3, text="Печать первых страниц", 
-          command=print_first_pages,
-          bg="#e6f3ff").grid(row=1, column=1, padx=5, pady=10, sticky='ew')
-
-tk.Button(tab3, text="Печать всех документов", 
-          command=print_all_documents,
-          bg="#e6f3ff").grid(row=2, column=1, padx=5, pady=10, sticky='ew')
-
-# Информационная метка
-info_label = tk.Label(tab3, text="Для печати используется принтер по умолчанию", 
-                     font=('Tahoma', 8), fg='gray')
-info_label.grid(row=3, column=1, padx=5, pady=5)
-
-# Кнопки сохранения/загрузки настроек внизу окна
-settings_frame = tk.Frame(root)
-settings_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=5, pady=5)
-
-# Центрируем кнопки настроек
-settings_frame.grid_columnconfigure(0, weight=1)
-settings_frame.grid_columnconfigure(1, weight=1)
-
-tk.Button(settings_frame, text="Сохранить настройки", command=save_settings).grid(row=0, column=0, padx=5, pady=5, sticky='e')
-tk.Button(settings_frame, text="Загрузить настройки", command=load_settings).grid(row=0, column=1, padx=5, pady=5, sticky='w')
-
-# Запуск основного цикла GUI
-if __name__ == "__main__":
+    scrollbar = ttk.Scrollbar(results_frame, orient="vertical", command=search_results_listbox.yview)
+    scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+    search_results_listbox.config(yscrollcommand=scrollbar.set)
+
+    clear_results_btn = tk.Button(
+        results_frame,
+        text="Очистить",
+        command=lambda: show_search_results([]),
+        width=8
+    )
+    clear_results_btn.pack(side=tk.RIGHT, padx=(5,0))
+
+    # Кнопка добавления выбранного
+    add_button_frame = tk.Frame(tab2)
+    add_button_frame.grid(row=7, column=0, columnspan=4, padx=5, pady=5)
+
+    tk.Button(add_button_frame, text="Добавить выбранное", 
+              command=add_selected_row).pack()
+
+    # Список отобранных организаций с кнопкой очистки
+    selected_frame = tk.Frame(tab2)
+    selected_frame.grid(row=8, column=0, columnspan=4, padx=5, pady=5, sticky='nsew')
+
+    selected_rows_listbox = Listbox(
+        selected_frame,
+        selectmode=tk.MULTIPLE,
+        width=70,
+        height=8,
+        font=('Tahoma', 9),
+        bg='#f0f0f0',
+        selectbackground='#a6d8ff'
+    )
+    selected_rows_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+    scrollbar_selected = ttk.Scrollbar(selected_frame, orient="vertical", command=selected_rows_listbox.yview)
+    scrollbar_selected.pack(side=tk.RIGHT, fill=tk.Y)
+    selected_rows_listbox.config(yscrollcommand=scrollbar_selected.set)
+
+    clear_selected_btn = tk.Button(
+        selected_frame,
+        text="Очистить",
+        command=lambda: [selection.clear(), update_selected_rows_listbox()],
+        width=8,
+        bg='#ffdddd'
+    )
+    clear_selected_btn.pack(side=tk.RIGHT, padx=(5,0))
+
+    # Кнопка удаления выбранного
+    remove_button_frame = tk.Frame(tab2)
+    remove_button_frame.grid(row=9, column=0, columnspan=4, padx=5, pady=5)
+
+    tk.Button(remove_button_frame, text="Удалить выбранное", 
+              command=remove_selected_row).pack()
+
+    # Кнопки формирования документов
+    doc_buttons_frame = tk.Frame(tab2)
+    doc_buttons_frame.grid(row=10, column=0, columnspan=4, padx=5, pady=10)
+
+    tk.Button(doc_buttons_frame, 
+              text="Сформировать текстовый файл с реквизитами", 
+              command=create_requisites_file,
+              bg="#e6e6fa").pack(side=tk.LEFT, padx=5)
+
+    tk.Button(doc_buttons_frame, 
+              text="Сформировать документы", 
+              command=generate_documents).pack(side=tk.LEFT, padx=5)
+
+    # Привязка горячих клавиш
+    root.bind('<Return>', lambda e: search_by_name())
+
+    # Вкладка "Печать"
+    tab3 = ttk.Frame(notebook)
+    notebook.add(tab3, text="Печать")
+
+    # Центрируем содержимое вкладки 3
+    tab3.grid_columnconfigure(0, weight=1)
+    tab3.grid_columnconfigure(1, weight=1)
+    tab3.grid_columnconfigure(2, weight=1)
+
+    tk.Label(tab3, text="Папка с документами:").grid(row=0, column=0, padx=5, pady=5, sticky='e')
+    tk.Entry(tab3, textvariable=print_folder_var, width=50).grid(row=0, column=1, padx=5, pady=5)
+    tk.Button(tab3, text="Выбрать", command=lambda: print_folder_var.set(filedialog.askdirectory())).grid(row=0, column=2, padx=5, pady=5, sticky='w')
+
+    # Добавляем кнопки печати с подтверждением
+    tk.Button(tab3, text="Печать первых страниц", 
+              command=print_first_pages,
+              bg="#e6f3ff").grid(row=1, column=1, padx=5, pady=10, sticky='ew')
+
+    tk.Button(tab3, text="Печать всех документов", 
+              command=print_all_documents,
+              bg="#e6f3ff").grid(row=2, column=1, padx=5, pady=10, sticky='ew')
+
+    # Информационная метка
+    info_label = tk.Label(tab3, text="Для печати используется принтер по умолчанию", 
+                         font=('Tahoma', 8), fg='gray')
+    info_label.grid(row=3, column=1, padx=5, pady=5)
+
+    # Кнопки сохранения/загрузки настроек внизу окна
+    settings_frame = tk.Frame(root)
+    settings_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=5, pady=5)
+
+    # Центрируем кнопки настроек
+    settings_frame.grid_columnconfigure(0, weight=1)
+    settings_frame.grid_columnconfigure(1, weight=1)
+
+    tk.Button(settings_frame, text="Сохранить настройки", command=save_settings).grid(row=0, column=0, padx=5, pady=5, sticky='e')
+    tk.Button(settings_frame, text="Загрузить настройки", command=load_settings).grid(row=0, column=1, padx=5, pady=5, sticky='w')
+
+    def on_close():
+        """Закрытие окна: незавершенные фоновые задачи прерываются"""
+        if job_runner.active_jobs() and not messagebox.askyesno(
+            "Подтверждение", "Есть незавершенные задачи. Прервать их и выйти?"
+        ):
+            return
+        stop_watch_folder()
+        live_search.stop()
+        job_runner.shutdown()
+        root.destroy()
+
+    root.protocol("WM_DELETE_WINDOW", on_close)
+
+    # Запуск основного цикла GUI
     load_settings()
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
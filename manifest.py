@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+
+from fileutil import file_digest
+
+# Журнал пачки запросов в папке документов
+MANIFEST_FILENAME = '.requests_manifest.jsonl'
+
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_FINISHED = 'finished'
+
+
+class RequestManifest:
+    """
+    Журнал пачки документов запросов (по одной JSON-записи в строке).
+
+    Первая запись — заголовок с хешем шаблона, затем по записи на документ
+    (номер, ключ организации, имя файла) и по мере создания — записи о
+    статусе (готов — с хешем, размером и временем изменения файла; ошибка).
+    Когда созданы все документы, пачка отмечается завершенной. Если
+    незавершенную пачку (тот же шаблон и те же организации в том же
+    порядке) запускают снова, номера и имена файлов берутся из журнала и
+    создаются только документы, которых нет; готовые документы, в том числе
+    измененные с тех пор вручную, не перезаписываются. Завершенная пачка
+    при повторном запуске считается новой.
+    """
+
+    def __init__(self, output_folder):
+        self.output_folder = output_folder
+        self.path = os.path.join(output_folder, MANIFEST_FILENAME)
+        self.journal = None
+
+    def load(self):
+        """
+        (заголовок, записи документов по порядку с последним статусом,
+        завершена ли пачка) или (None, [], False).
+        """
+        if not os.path.exists(self.path):
+            return None, [], False
+        entries = []
+        by_number = {}
+        finished = False
+        with open(self.path, encoding='utf-8') as f:
+            header = _read_record(f.readline())
+            for line in f:
+                record = _read_record(line)
+                # Последняя строка могла быть записана не до конца
+                if record is None:
+                    break
+                if record.get('status') == STATUS_FINISHED:
+                    finished = True
+                elif 'key' in record:
+                    by_number[record['number']] = record
+                    entries.append(record)
+                elif record.get('number') in by_number:
+                    by_number[record['number']].update(record)
+        return header, entries, finished
+
+    def _is_present(self, entry):
+        """
+        Готовый документ на месте. Документ, измененный после создания (при
+        другом времени изменения сверяется хеш), тоже считается готовым.
+        """
+        file_path = os.path.join(self.output_folder, entry['file'])
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return False
+        if st.st_size != entry.get('size') or (
+                st.st_mtime_ns != entry.get('mtime_ns') and file_digest(file_path) != entry.get('hash')):
+            logging.warning(f"Документ {entry['file']} изменен после создания и не будет создан заново")
+        return True
+
+    def resume(self, orgs, template_hash):
+        """
+        Задания прерванной пачки [(номер, наименование, ИНН, email, путь)] и
+        номера уже готовых из них или None, если журнал от другой пачки.
+        """
+        header, entries, finished = self.load()
+        if finished or not header or header.get('template_hash') != template_hash:
+            return None
+        if [tuple(entry['key']) for entry in entries] != [tuple(key) for key in orgs]:
+            return None
+
+        plan = [
+            (entry['number'], *entry['key'], os.path.join(self.output_folder, entry['file']))
+            for entry in entries
+        ]
+        completed = {
+            index for index, entry in enumerate(entries)
+            if entry.get('status') == STATUS_DONE and self._is_present(entry)
+        }
+        self._truncate_broken_tail()
+        self.journal = open(self.path, 'a', encoding='utf-8')
+        logging.info(f"Продолжение пачки запросов: готово {len(completed)} из {len(plan)}")
+        return plan, completed
+
+    def _truncate_broken_tail(self):
+        """Отрезает недописанную последнюю запись журнала."""
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end != len(data):
+                f.truncate(end)
+
+    def start(self, plan, template_hash):
+        """Начинает журнал новой пачки."""
+        self.journal = open(self.path, 'w', encoding='utf-8')
+        self._write({'template_hash': template_hash, 'count': len(plan)})
+        for formatted_number, name, inn, email, file_path in plan:
+            self._write({'number': formatted_number, 'key': [name, inn, email], 'file': os.path.basename(file_path)})
+        self.journal.flush()
+
+    def record(self, formatted_number, file_path, error=None):
+        """Записывает результат создания документа."""
+        if error:
+            self._write({'number': formatted_number, 'status': STATUS_FAILED, 'error': error})
+        else:
+            st = os.stat(file_path)
+            self._write({
+                'number': formatted_number, 'status': STATUS_DONE,
+                'hash': file_digest(file_path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+            })
+        self.journal.flush()
+
+    def finish(self):
+        """Отмечает пачку завершенной: повторный запуск начнет новую."""
+        self._write({'status': STATUS_FINISHED})
+        self.journal.flush()
+
+    def close(self):
+        if self.journal:
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+            self.journal.close()
+            self.journal = None
+
+    def _write(self, record):
+        self.journal.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def _read_record(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
@@ -0,0 +1,133 @@
+import datetime
+import getpass
+import json
+import logging
+import os
+import socket
+import sys
+import time
+
+# Журнал выданных номеров запросов и файл блокировки в папке сохранения
+NUMBERS_FILENAME = '.request_numbers.jsonl'
+LOCK_FILENAME = '.request_numbers.lock'
+
+# Сколько секунд ждать, пока номера выдает другой пользователь
+LOCK_TIMEOUT = 30
+LOCK_POLL_INTERVAL = 0.1
+
+# Сколько байт с конца журнала читать, чтобы найти последнюю запись
+TAIL_SIZE = 4096
+
+if sys.platform == 'win32':
+    import msvcrt
+
+    def _try_lock(f):
+        f.seek(0)
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+
+    def _unlock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _try_lock(f):
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        return True
+
+    def _unlock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class NumberingError(Exception):
+    """Не удалось выдать номера запросов."""
+
+
+class NumberAllocator:
+    """
+    Выдача номеров запросов по журналу в папке сохранения.
+
+    Каждая пачка получает непрерывный диапазон номеров: под блокировкой
+    файла читается последняя запись журнала (только его хвост, поэтому
+    время не зависит от длины журнала), и в журнал дописывается новый
+    диапазон с пользователем, компьютером и временем. Так два пользователя,
+    формирующие запросы в одной папке, не получат одинаковые номера, а
+    журнал показывает, кому какие номера выданы.
+    """
+
+    def __init__(self, save_folder):
+        self.path = os.path.join(save_folder, NUMBERS_FILENAME)
+        self.lock_path = os.path.join(save_folder, LOCK_FILENAME)
+
+    def last_range(self):
+        """Последняя запись журнала {'first', 'last', ...} или None."""
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - TAIL_SIZE))
+                tail = f.read()
+        except FileNotFoundError:
+            return None
+        # Первая строка хвоста может быть обрезана, последняя — недописана
+        for line in reversed(tail.splitlines()):
+            try:
+                record = json.loads(line.decode('utf-8'))
+            except ValueError:
+                continue
+            if isinstance(record, dict) and 'last' in record:
+                return record
+        return None
+
+    def next_number(self):
+        """Следующий свободный номер или None, если номера в этой папке еще не выдавались."""
+        record = self.last_range()
+        return record['last'] + 1 if record else None
+
+    def allocate(self, count, start_number=1):
+        """
+        Выдает count номеров подряд и возвращает первый. Номера начинаются
+        с start_number, если он не занят, иначе — со следующего свободного.
+        """
+        with open(self.lock_path, 'a+b') as lock:
+            deadline = time.monotonic() + LOCK_TIMEOUT
+            while not _try_lock(lock):
+                if time.monotonic() > deadline:
+                    raise NumberingError(f"Номера запросов выдает другой пользователь: {self.lock_path} занят")
+                time.sleep(LOCK_POLL_INTERVAL)
+            try:
+                next_number = self.next_number()
+                first = start_number
+                if next_number is not None and next_number > start_number:
+                    logging.warning(f"Номера с {start_number} по {next_number - 1} уже выданы, нумерация начинается с {next_number}")
+                    first = next_number
+                self._append({
+                    'first': first,
+                    'last': first + count - 1,
+                    'count': count,
+                    'user': getpass.getuser(),
+                    'host': socket.gethostname(),
+                    'time': datetime.datetime.now().isoformat(timespec='seconds'),
+                })
+            finally:
+                _unlock(lock)
+        logging.info(f"Выданы номера запросов с {first} по {first + count - 1}")
+        return first
+
+    def _append(self, record):
+        with open(self.path, 'ab') as f:
+            # Недописанную последнюю строку (сбой при записи) отделяем от новой
+            if f.tell() > 0:
+                with open(self.path, 'rb') as r:
+                    r.seek(-1, os.SEEK_END)
+                    if r.read(1) != b'\n':
+                        f.write(b'\n')
+            f.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
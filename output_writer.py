@@ -0,0 +1,222 @@
+import json
+import logging
+import os
+
+from dedup import SOURCES_COLUMN, OrganizationIndex
+
+# Порядок колонок в output.xlsx
+COLUMNS_ORDER = ['Номер п/п', 'Наименование', 'ИНН', 'Адрес', 'Электронная почта', 'Телефон', 'Исходная информация', SOURCES_COLUMN]
+
+# Через сколько записей журнал сбрасывается на диск
+DEFAULT_CHECKPOINT_EVERY = 50
+
+JOURNAL_SUFFIX = '.partial'
+TMP_SUFFIX = '.tmp'
+
+
+class OutputWriter:
+    """
+    Потоковая запись output.xlsx с возможностью продолжить прерванный запуск.
+
+    Строки по мере извлечения дописываются в журнал рядом с output.xlsx
+    (output.xlsx.partial, по одной JSON-записи на исходный файл) и
+    периодически сбрасываются на диск. В памяти строки не копятся: при
+    finish() журнал построчно переносится в книгу openpyxl в режиме
+    write-only, и журнал удаляется. Если запуск прервался, журнал остается,
+    и done_files() сообщает, какие файлы уже обработаны.
+
+    При collapse_duplicates письма одной организации сводятся в одну строку
+    (см. OrganizationIndex): первый проход по журналу раскладывает записи по
+    организациям, и в памяти остаются только ключи и смещения записей в
+    журнале; второй читает записи каждой организации и пишет ее строку.
+    """
+
+    def __init__(self, output_path, folder, checkpoint_every=DEFAULT_CHECKPOINT_EVERY,
+                 collapse_duplicates=True, ignored_inns=()):
+        self.output_path = output_path
+        self.folder = folder
+        self.collapse_duplicates = collapse_duplicates
+        self.ignored_inns = ignored_inns
+        self.journal_path = output_path + JOURNAL_SUFFIX
+        self.tmp_path = output_path + TMP_SUFFIX
+        self.checkpoint_every = checkpoint_every
+        self.journal = None
+        self.unsaved = 0
+        self.on_checkpoint = None
+
+    def done_files(self):
+        """
+        Файлы, уже записанные в журнал прерванного запуска по этой же папке.
+        Пустое множество, если продолжать нечего.
+        """
+        if not os.path.exists(self.journal_path):
+            return set()
+
+        done = set()
+        with open(self.journal_path, encoding='utf-8') as f:
+            header = _read_record(f.readline())
+            if not header or header.get('folder') != self.folder:
+                return set()
+            for line in f:
+                record = _read_record(line)
+                # Последняя строка могла быть записана не до конца
+                if record is None:
+                    break
+                done.add(record['file'])
+        return done
+
+    def start(self, resume=False):
+        """Открывает журнал: продолжает прежний или начинает новый."""
+        if resume and self.done_files():
+            self._truncate_broken_tail()
+            self.journal = open(self.journal_path, 'a', encoding='utf-8')
+        else:
+            self.journal = open(self.journal_path, 'w', encoding='utf-8')
+            self._write({'folder': self.folder})
+            self.checkpoint()
+
+    def _truncate_broken_tail(self):
+        """Отрезает недописанную последнюю запись журнала."""
+        with open(self.journal_path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end != len(data):
+                f.truncate(end)
+
+    def _write(self, record):
+        self.journal.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def append(self, file_name, row):
+        """
+        Записывает результат обработки файла. row=None означает, что файл
+        обработан, но строки в справочнике не дает (например, это не реквизиты).
+        """
+        self._write({'file': file_name, 'row': row})
+        self.unsaved += 1
+        if self.unsaved >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Сбрасывает журнал на диск."""
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.unsaved = 0
+        if self.on_checkpoint:
+            self.on_checkpoint()
+
+    def close(self):
+        """Закрывает журнал, оставляя его для продолжения."""
+        if self.journal:
+            self.checkpoint()
+            self.journal.close()
+            self.journal = None
+
+    def finish(self, inn_overrides=None):
+        """
+        Переносит журнал в output.xlsx и удаляет журнал. Возвращает число строк.
+        inn_overrides ({наименование: ИНН}) — ИНН, найденные после разбора писем;
+        они подставляются в строки без ИНН или с ИНН из ignored_inns.
+        """
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+        from openpyxl.styles import Font
+
+        self.close()
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        header = []
+        for column in COLUMNS_ORDER:
+            cell = WriteOnlyCell(ws, value=column)
+            cell.font = Font(bold=True)
+            header.append(cell)
+        ws.append(header)
+
+        rows = 0
+        for row in self._rows(inn_overrides or {}):
+            values = []
+            for column in COLUMNS_ORDER:
+                value = row.get(column, '')
+                # Управляющие символы из .doc (например, маркеры ячеек) Excel не принимает
+                if isinstance(value, str):
+                    value = ILLEGAL_CHARACTERS_RE.sub('', value)
+                values.append(value)
+            ws.append(values)
+            rows += 1
+
+        # Пишем во временный файл, чтобы сбой не испортил прежний output.xlsx;
+        # журнал при сбое остается для продолжения
+        try:
+            wb.save(self.tmp_path)
+            os.replace(self.tmp_path, self.output_path)
+        except BaseException:
+            _remove(self.tmp_path)
+            raise
+        os.remove(self.journal_path)
+        return rows
+
+    def records(self):
+        """Записи журнала (имя файла, строка) для файлов, давших строку справочника."""
+        for _, file_name, row in self._journal_rows():
+            yield file_name, row
+
+    def _journal_rows(self):
+        """Как records(), но со смещением каждой записи в журнале."""
+        with open(self.journal_path, 'rb') as f:
+            offset = len(f.readline())
+            for line in f:
+                record = _read_record(line)
+                if record is None:
+                    break
+                if record['row'] is not None:
+                    yield offset, record['file'], record['row']
+                offset += len(line)
+
+    def _rows(self, inn_overrides):
+        """Строки для output.xlsx: по одной на письмо или на организацию."""
+        def with_inn(row):
+            inn = inn_overrides.get(row['Наименование'])
+            if inn and (not row['ИНН'] or row['ИНН'] in self.ignored_inns):
+                row['ИНН'] = inn
+            return row
+
+        if not self.collapse_duplicates:
+            for file_name, row in self.records():
+                row = with_inn(row)
+                row[SOURCES_COLUMN] = file_name
+                yield row
+            return
+
+        index = OrganizationIndex(self.ignored_inns)
+        for offset, _, row in self._journal_rows():
+            index.add(with_inn(row), offset)
+        logging.info(f"Строк из писем: {index.rows_added}, организаций после объединения: {len(index)}")
+
+        with open(self.journal_path, 'rb') as f:
+            def load(offset):
+                f.seek(offset)
+                record = _read_record(f.readline())
+                return record['file'], with_inn(record['row'])
+
+            yield from index.rows(load)
+
+    def discard(self):
+        """Удаляет журнал и недописанную книгу, когда запуск не будет продолжен."""
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+        _remove(self.journal_path)
+        _remove(self.tmp_path)
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _read_record(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
@@ -0,0 +1,301 @@
+import posixpath
+import re
+import xml.etree.ElementTree as ET
+import zipfile
+
+from dedup import LEGAL_FORM_NAMES
+
+# Правила разбора реквизитов. Чтобы научить extract_info новому случаю,
+# достаточно дополнить эти списки: регулярные выражения ниже собираются
+# из них один раз при импорте модуля.
+
+# Слова, после которых в письме начинается текст запроса, а не реквизиты
+STOP_WORDS = ('ЗАПРОС',)
+
+# Обращения, которые убираются из начала наименования
+SALUTATIONS = (
+    'Руководителю',
+    'ИП',
+    'Индивидуальный предприниматель',
+    'Индивидуальному предпринимателю',
+    'Директору',
+    'Генеральному директору',
+)
+
+# Организационно-правовые формы, которые в наименовании заменяются
+# сокращением (полные названия и сокращения — dedup.LEGAL_FORM_NAMES)
+LEGAL_FORM_REWRITES = ('общество с ограниченной ответственностью',)
+
+# Наименование, начинающееся с кавычки, получает эту форму
+QUOTES = ('«', '"', "'")
+DEFAULT_LEGAL_FORM = 'ООО'
+
+INN_MARKER = 'ИНН'
+ADDRESS_LABELS = ('Юридический адрес', 'Адрес')
+ADDRESS_TERMINATORS = ('E-mail', 'Телефон')
+
+def _alternation(words):
+    # Длинные варианты раньше коротких, чтобы совпадение было максимальным
+    return '|'.join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+
+_SALUTATION_RE = re.compile(rf'^(?:{_alternation(SALUTATIONS)})\s*', re.IGNORECASE)
+# Форма пишется с заглавной буквы: "Общество с ограниченной ответственностью" → "ООО"
+_LEGAL_FORM_ABBREVIATIONS = {
+    form.capitalize(): LEGAL_FORM_NAMES[form].upper() for form in LEGAL_FORM_REWRITES
+}
+_LEGAL_FORM_RE = re.compile(_alternation(_LEGAL_FORM_ABBREVIATIONS))
+
+# Все поля строки ищутся одним проходом. Почта и телефон начинаются только
+# на границе своей последовательности символов, поэтому время разбора
+# линейно и не зависит от длинных «слов» без совпадений. Каждый символ
+# достается одному полю: цифры ИНН и цифры внутри адреса почты не
+# попадают в телефоны. Перенос строки внутри абзаца телефону не мешает,
+# а номер, начатый кодом в конце абзаца ("Тел. 8 (495)"), продолжается в
+# следующем абзаце (см. _PHONE_TAIL_RE).
+_FIELDS_RE = re.compile(
+    rf'(?P<inn>{INN_MARKER}\s*(?P<inn_value>\d{{10,12}}))'
+    rf'|(?P<address>(?:{_alternation(ADDRESS_LABELS)}):\s*)'
+    r'|(?P<email>(?<![\w.-])[\w.-]+@[\w.-]+)'
+    r'|(?P<phone>(?<![\d+])\+?\d[\d\s\-()]{6,}\d)'
+)
+# Начало телефона в конце абзаца (код, код города), не ставшее телефоном
+# само: его продолжение ищется в начале следующего абзаца, как если бы
+# абзацы были склеены через пробел
+_PHONE_TAIL_RE = re.compile(r'(?<![\d+])\+?\d[\d\s\-()]*$')
+# ИНН, перенесенный на следующую строку
+_INN_TAIL_RE = re.compile(rf'{INN_MARKER}\s*$')
+_INN_HEAD_RE = re.compile(r'^\s*(\d{10,12})')
+_ADDRESS_END_RE = re.compile(rf'\s(?:{_alternation(ADDRESS_TERMINATORS)})')
+
+W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+W_BODY = W_NS + 'body'
+W_P = W_NS + 'p'
+W_R = W_NS + 'r'
+W_HYPERLINK = W_NS + 'hyperlink'
+W_SMART_TAG = W_NS + 'smartTag'
+W_T = W_NS + 't'
+W_TAB = W_NS + 'tab'
+W_PTAB = W_NS + 'ptab'
+W_BR = W_NS + 'br'
+W_CR = W_NS + 'cr'
+W_NO_BREAK_HYPHEN = W_NS + 'noBreakHyphen'
+W_TYPE = W_NS + 'type'
+# Текст элементов содержимого run (w:br — только перенос строки, см. _run_text)
+RUN_CONTENT_TEXT = {W_TAB: '\t', W_PTAB: '\t', W_CR: '\n', W_NO_BREAK_HYPHEN: '-'}
+OFFICE_DOCUMENT_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument'
+
+
+def is_stop_line(line):
+    """Проверяет, что строка содержит слово "ЗАПРОС" (в любом регистре)."""
+    upper = line.upper()
+    return any(word in upper for word in STOP_WORDS)
+
+def _main_document_part(archive):
+    """Имя основной части документа внутри архива .docx (обычно word/document.xml)."""
+    try:
+        rels = ET.fromstring(archive.read('_rels/.rels'))
+    except KeyError:
+        return 'word/document.xml'
+    for rel in rels:
+        if rel.get('Type') == OFFICE_DOCUMENT_REL:
+            return rel.get('Target').lstrip('/')
+    return 'word/document.xml'
+
+def iter_docx_paragraphs(file_path):
+    """
+    Лениво выдает текст абзацев верхнего уровня документа .docx.
+
+    Читает XML основной части прямо из архива потоковым парсером, не
+    распаковывая картинки и остальные части. Разобранные абзацы сразу
+    удаляются из дерева, поэтому память не растет с размером документа.
+    Как и python-docx, пропускает абзацы внутри таблиц и надписей.
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        part = posixpath.normpath(_main_document_part(archive))
+        with archive.open(part) as xml_stream:
+            depth = 0
+            body = None
+            for event, elem in ET.iterparse(xml_stream, events=('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    if elem.tag == W_BODY:
+                        body = elem
+                    continue
+
+                depth -= 1
+                # Абзацы верхнего уровня: w:document/w:body/w:p
+                if depth == 2 and body is not None:
+                    if elem.tag == W_P:
+                        yield _paragraph_text(elem)
+                    body.clear()
+
+def _paragraph_text(paragraph):
+    """
+    Текст абзаца так же, как его собирает python-docx (Paragraph.text):
+    только run-ы абзаца, в том числе внутри гиперссылок, без свойств абзаца
+    и без надписей и рисунков внутри run-ов. Run-ы внутри w:smartTag, которые
+    python-docx пропускает, тоже читаются.
+    """
+    parts = []
+    for child in paragraph:
+        if child.tag == W_R:
+            parts.append(_run_text(child))
+        elif child.tag in (W_HYPERLINK, W_SMART_TAG):
+            parts.extend(_run_text(run) for run in child if run.tag == W_R)
+    return ''.join(parts)
+
+def _run_text(run):
+    """Текст run-а по его прямым потомкам; разрыв страницы или колонки — пустая строка."""
+    parts = []
+    for elem in run:
+        if elem.tag == W_T:
+            parts.append(elem.text or '')
+        elif elem.tag == W_BR:
+            if elem.get(W_TYPE, 'textWrapping') == 'textWrapping':
+                parts.append('\n')
+        else:
+            parts.append(RUN_CONTENT_TEXT.get(elem.tag, ''))
+    return ''.join(parts)
+
+def extract_text_from_docx(file_path, stop_at_request=True):
+    """
+    Извлекает текст из файла .docx.
+    При stop_at_request чтение прекращается на первой строке со словом
+    "ЗАПРОС": дальше extract_info текст все равно не использует.
+    """
+    full_text = []
+    for text in iter_docx_paragraphs(file_path):
+        full_text.append(text)
+        if stop_at_request and is_stop_line(text):
+            break
+    return full_text
+
+def extract_text_from_doc(file_path):
+    """Извлекает текст из файла .doc."""
+    import win32com.client as win32
+
+    word = win32.gencache.EnsureDispatch('Word.Application')
+    word.Visible = False
+    doc = word.Documents.Open(file_path)
+    full_text = []
+    for para in doc.Paragraphs:
+        full_text.append(para.Range.Text.strip())
+    doc.Close()
+    word.Quit()
+    return full_text
+
+def normalize_name(name):
+    """Убирает обращения и сокращает организационно-правовую форму."""
+    # Удаляем обращения
+    name = _SALUTATION_RE.sub('', name, count=1).strip()
+
+    # Если наименование начинается с кавычек, добавляем "ООО"
+    if name.startswith(QUOTES):
+        name = f"{DEFAULT_LEGAL_FORM} {name}"
+
+    # Заменяем "Общество с ограниченной ответственностью" на "ООО"
+    return _LEGAL_FORM_RE.sub(lambda m: _LEGAL_FORM_ABBREVIATIONS[m.group(0)], name)
+
+def extract_info(text_lines):
+    """
+    Извлекает реквизиты из строк письма за один проход.
+
+    Разбор идет до первой строки со словом "ЗАПРОС". Наименование — строки
+    до первой строки с "ИНН" (или первая строка), адрес — текст после
+    "Адрес:" до "E-mail"/"Телефон", почта и телефоны — все найденные.
+    Прежний разбор склеивал все строки в одну, поэтому считал телефоном и
+    цифры ИНН и почты; теперь нет (см. _FIELDS_RE). Телефон, разорванный
+    между абзацами после кода, по-прежнему собирается целиком.
+    """
+    info = {'Наименование': '', 'ИНН': '', 'Адрес': '', 'Электронная почта': '', 'Телефон': ''}
+
+    lines = []
+    inn_index = None
+    emails = []
+    phones = []
+    # Части адреса, пока не встретился конец адреса; None — адрес еще не найден
+    address_parts = None
+    address_open = False
+    inn_pending = False
+    phone_tail = None
+
+    for line in text_lines:
+        # Убираем пустые строки
+        if not line.strip():
+            continue
+        # Останавливаем обработку при обнаружении слова "ЗАПРОС" (в любом регистре)
+        if is_stop_line(line):
+            break
+
+        if inn_index is None and INN_MARKER in line:
+            inn_index = len(lines)
+        lines.append(line)
+
+        if inn_pending:
+            inn_pending = False
+            inn_match = _INN_HEAD_RE.match(line)
+            if inn_match:
+                info['ИНН'] = inn_match.group(1)
+
+        # Продолжение адреса со следующей строки
+        if address_open:
+            end = _ADDRESS_END_RE.search(' ' + line)
+            if end:
+                address_parts.append(line[:max(end.start() - 1, 0)])
+                address_open = False
+            else:
+                address_parts.append(line)
+
+        # Продолжение телефона из предыдущего абзаца
+        start = 0
+        if phone_tail is not None:
+            joined = _FIELDS_RE.match(f'{phone_tail} {line}')
+            if joined and joined.lastgroup == 'phone' and joined.end() > len(phone_tail) + 1:
+                phones.append(joined.group())
+                start = joined.end() - len(phone_tail) - 1
+
+        fields_end = start
+        for match in _FIELDS_RE.finditer(line, start):
+            fields_end = match.end()
+            kind = match.lastgroup
+            if kind == 'inn':
+                if not info['ИНН']:
+                    info['ИНН'] = match.group('inn_value')
+            elif kind == 'address':
+                if address_parts is None:
+                    rest = line[match.end():]
+                    # В адресе хотя бы один символ до "E-mail"/"Телефон"
+                    end = _ADDRESS_END_RE.search(rest, 1)
+                    address_parts = [rest[:end.start()] if end else rest]
+                    address_open = end is None
+            elif kind == 'email':
+                emails.append(match.group())
+            else:
+                phones.append(match.group())
+
+        tail = _PHONE_TAIL_RE.search(line.rstrip(), fields_end)
+        phone_tail = tail.group() if tail else None
+
+        if not info['ИНН'] and _INN_TAIL_RE.search(line):
+            inn_pending = True
+
+    # Поиск наименования
+    if inn_index is not None:
+        name = ' '.join(line.strip() for line in lines[:inn_index])
+    else:
+        name = lines[0].strip() if lines else ''
+    info['Наименование'] = normalize_name(name)
+
+    if address_parts is not None:
+        info['Адрес'] = ' '.join(address_parts).strip()
+
+    # Все адреса электронной почты и номера телефонов
+    if emails:
+        info['Электронная почта'] = ', '.join(emails)
+    if phones:
+        info['Телефон'] = ', '.join(phones)
+
+    # Сохраняем всю информацию до строки со словом "ЗАПРОС"
+    info['Исходная информация'] = '\n'.join(lines)
+
+    return info
@@ -0,0 +1,116 @@
+import glob
+import logging
+import os
+import subprocess
+import threading
+import time
+
+# Паузы между заданиями печати, чтобы не перегружать очередь принтера, секунд
+FIRST_PAGE_PRINT_DELAY = 3
+ALL_PAGES_PRINT_DELAY = 2
+
+# Через сколько секунд удалять временный VBS-скрипт
+VBS_CLEANUP_DELAY = 10
+
+# VBS-скрипт печати первой страницы с параметрами как в рабочем макросе
+FIRST_PAGE_VBS = '''
+On Error Resume Next
+Dim Word, Doc
+Set Word = CreateObject("Word.Application")
+Word.Visible = False
+Word.DisplayAlerts = False
+' Открываем документ с параметрами ReadOnly и AddToRecentFiles как в макросе
+Set Doc = Word.Documents.Open("{path}", , True, True)
+If Err.Number = 0 Then
+    ' Печатаем только первую страницу с правильными параметрами
+    Doc.PrintOut False, , 4, , , , , , "1"
+    WScript.Sleep 2000
+    Doc.Close False
+End If
+Word.Quit
+WScript.Quit 0
+'''
+
+
+def is_word_installed():
+    """Проверяет, что Microsoft Word доступен через COM."""
+    try:
+        import win32com.client as win32
+
+        word = win32.Dispatch("Word.Application")
+        word.Quit()
+        return True
+    except Exception:
+        return False
+
+def list_print_files(folder):
+    """Документы Word в папке печати, отсортированные по имени."""
+    files = []
+    for ext in ['*.doc', '*.docx']:
+        files.extend(glob.glob(os.path.join(folder, ext)))
+    files.sort()
+    return files
+
+def print_first_page(file_path, index=0):
+    """Отправляет на печать первую страницу документа через VBS-скрипт (без ожидания)."""
+    vbs_script = FIRST_PAGE_VBS.format(path=os.path.abspath(file_path))
+
+    # Сохраняем VBS файл
+    vbs_path = os.path.join(os.environ['TEMP'], f'print_first_{index}_{int(time.time())}.vbs')
+    with open(vbs_path, 'w', encoding='cp1251') as f:
+        f.write(vbs_script)
+
+    # Запускаем VBS скрипт
+    subprocess.Popen(
+        ['cscript', '//nologo', vbs_path],
+        creationflags=subprocess.CREATE_NO_WINDOW,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+    # Планируем удаление VBS файла
+    def del_vbs():
+        time.sleep(VBS_CLEANUP_DELAY)
+        try:
+            if os.path.exists(vbs_path):
+                os.remove(vbs_path)
+        except OSError:
+            pass
+    threading.Thread(target=del_vbs, daemon=True).start()
+
+def print_all_pages(file_path):
+    """Отправляет на печать весь документ через ассоциированное приложение."""
+    os.startfile(file_path, "print")
+
+def print_files(files, first_page_only, check=None, sleep=time.sleep, progress_callback=None):
+    """
+    Печатает файлы по очереди с паузой между заданиями.
+    progress_callback(номер, всего, успешно, ошибок, строка состояния)
+    вызывается после каждого файла. Возвращает (успешно, ошибок).
+    """
+    delay = FIRST_PAGE_PRINT_DELAY if first_page_only else ALL_PAGES_PRINT_DELAY
+    completed = 0
+    failed = 0
+
+    for i, file_path in enumerate(files):
+        if check:
+            check()
+        try:
+            if first_page_only:
+                print_first_page(file_path, i)
+            else:
+                print_all_pages(file_path)
+            completed += 1
+            status_text = f"✓ {os.path.basename(file_path)}"
+        except Exception as e:
+            failed += 1
+            status_text = f"✗ {os.path.basename(file_path)}"
+            logging.error(f"Ошибка печати {file_path}: {str(e)}")
+
+        if progress_callback:
+            progress_callback(i + 1, len(files), completed, failed, status_text)
+
+        # Пауза между файлами
+        sleep(delay)
+
+    return completed, failed
@@ -0,0 +1,111 @@
+import logging
+from collections import Counter
+
+from directory import NOT_SPECIFIED, format_product_type
+
+
+def record_types(product_type):
+    """Типы товаров из записи отбора (через запятую); "не указан" — пустой список."""
+    if not product_type or product_type == NOT_SPECIFIED:
+        return []
+    return [t.strip() for t in str(product_type).split(',') if t.strip()]
+
+
+class Selection:
+    """
+    Отобранные организации в порядке отбора.
+
+    Ключ организации — (наименование, ИНН), как и прежде при проверке
+    повторов: строки одной организации с разными email не дают отдельных
+    запросов, а email берется из первой добавленной строки. Для каждой
+    организации хранятся ее записи (наименование, ИНН, email, типы товаров)
+    и счетчик типов товаров, который обновляется при добавлении, поэтому
+    группировка не пересчитывается по всему списку. Повторная
+    запись и номер организации в списке находятся по словарям, без
+    перебора списка.
+    """
+
+    def __init__(self):
+        self.orgs = {}
+        self.keys = []
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.orgs)
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def add(self, records):
+        """
+        Добавляет записи; повторные пропускаются.
+        Возвращает (ключи новых организаций, ключи организаций, у которых добавились типы).
+        """
+        added = {}
+        updated = {}
+        for record in records:
+            name, inn, email, product_type = record
+            key = (name, inn)
+            org = self.orgs.get(key)
+            if org is None:
+                org = self.orgs[key] = {'email': email, 'records': {}, 'types': Counter()}
+                self.positions[key] = len(self.keys)
+                self.keys.append(key)
+                added[key] = None
+            elif record in org['records']:
+                continue
+            elif key not in added:
+                updated[key] = None
+            org['records'][record] = None
+            org['types'].update(record_types(product_type))
+        return list(added), list(updated)
+
+    def remove(self, keys):
+        """Удаляет организации из отбора."""
+        for key in keys:
+            self.orgs.pop(key, None)
+        self.keys = [key for key in self.keys if key in self.orgs]
+        self.positions = {key: position for position, key in enumerate(self.keys)}
+
+    def clear(self):
+        self.orgs.clear()
+        self.keys.clear()
+        self.positions.clear()
+
+    def index(self, key):
+        """Номер организации в списке (с нуля)."""
+        return self.positions[key]
+
+    def key_at(self, position):
+        return self.keys[position]
+
+    def requisites(self, key):
+        """(наименование, ИНН, email) организации."""
+        name, inn = key
+        return name, inn, self.orgs[key]['email']
+
+    def types(self, key, format_types=True):
+        """Типы товаров организации; format_types — с заглавной буквы, как в списке."""
+        types = self.orgs[key]['types']
+        if format_types:
+            return {format_product_type(t) for t in types}
+        return set(types)
+
+    def grouped(self, format_types=True):
+        """{(наименование, ИНН, email): типы товаров} в порядке отбора."""
+        return {self.requisites(key): self.types(key, format_types) for key in self.keys}
+
+
+def write_requisites_file(file_path, selection):
+    """Записывает текстовый файл с реквизитами отобранных организаций."""
+    with open(file_path, 'w', encoding='utf-8') as f:
+        for i, ((name, inn, email), types) in enumerate(selection.grouped().items(), 1):
+            f.write(f"{i}. {name}\n")
+            f.write(f"   ИНН: {inn if inn else 'не указан'}\n")
+            f.write(f"   Email: {email if email else 'не указан'}\n")
+
+            if types:
+                f.write(f"   Типы товаров: {', '.join(sorted(types))}\n\n")
+            else:
+                f.write("   Типы товаров: не указаны\n\n")
+    logging.info(f"Создан файл {file_path}")
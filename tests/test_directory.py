@@ -0,0 +1,36 @@
+import pytest
+
+from directory import Directory
+
+pytest.importorskip('fuzzywuzzy')
+
+NAMES = ['ООО Аромат', 'ООО Ромашка', 'АО Громов и партнеры', 'ООО Лютик', 'ИП Романов']
+# Прочие организации справочника: без них почти все триграммы "частые"
+OTHER_NAMES = [f'ООО {word} {side}' for side in ('Юг', 'Восток', 'Запад') for word in (
+    'Береза', 'Василек', 'Гвоздика', 'Дуб', 'Ель', 'Жасмин', 'Ива', 'Клен', 'Липа', 'Мак',
+    'Нарцисс', 'Осина', 'Пион', 'Сирень', 'Тюльпан', 'Фиалка', 'Хвоя', 'Цикорий', 'Чабрец', 'Шалфей',
+)]
+
+
+def _directory():
+    rows = [{'Наименование': name, 'ИНН': str(7700000000 + i)} for i, name in enumerate(NAMES + OTHER_NAMES)]
+    return Directory(['Наименование', 'ИНН'], rows)
+
+@pytest.mark.parametrize('queries', [
+    ['ро', 'ром'],
+    ['р', 'ро', 'ром', 'рома'],
+    ['ромашка', 'ромашк'],
+    ['лют', 'аромат'],
+])
+def test_narrowed_search_matches_full_search(queries):
+    directory = _directory()
+    within = None
+    for query in queries:
+        results, within = directory.find_names(query, within=within)
+        assert results == directory.find_names(query)[0]
+
+def test_longer_query_finds_names_without_prefix_trigrams():
+    directory = _directory()
+    _, within = directory.find_names('ро')
+    names = [name for name, _ in directory.find_names('ром', within=within)[0]]
+    assert 'ООО Аромат' in names and 'ООО Ромашка' in names
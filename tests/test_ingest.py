@@ -0,0 +1,38 @@
+import os
+
+from ingest import IngestCache
+
+INFO = {'Наименование': 'ООО «Ромашка»', 'ИНН': '7701234567'}
+
+
+def _touch(path, shift):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + shift))
+
+def test_cache_is_keyed_on_size_and_mtime(tmp_path):
+    doc = tmp_path / 'a.docx'
+    doc.write_bytes(b'one')
+    with IngestCache(str(tmp_path), cache_path=str(tmp_path / 'cache.sqlite3')) as cache:
+        cache.put(str(doc), INFO)
+        assert cache.get(str(doc)) == INFO
+        _touch(doc, 10 ** 9)
+        assert cache.get(str(doc)) is None
+
+def test_hash_keeps_entry_when_only_mtime_changed(tmp_path):
+    doc = tmp_path / 'a.docx'
+    doc.write_bytes(b'one')
+    cache_path = str(tmp_path / 'cache.sqlite3')
+    with IngestCache(str(tmp_path), use_hash=True, cache_path=cache_path) as cache:
+        cache.put(str(doc), INFO)
+
+    # Синхронизация сменила время изменения, но не содержимое
+    _touch(doc, 10 ** 9)
+    with IngestCache(str(tmp_path), use_hash=True, cache_path=cache_path) as cache:
+        assert cache.get(str(doc)) == INFO
+        assert (cache.hits, cache.misses) == (1, 0)
+
+    # Содержимое того же размера изменилось
+    doc.write_bytes(b'two')
+    _touch(doc, 2 * 10 ** 9)
+    with IngestCache(str(tmp_path), use_hash=True, cache_path=cache_path) as cache:
+        assert cache.get(str(doc)) is None
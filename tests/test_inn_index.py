@@ -0,0 +1,44 @@
+import os
+
+import pytest
+
+from inn_index import load_local_index
+
+openpyxl = pytest.importorskip('openpyxl')
+
+ROMASHKA_INN = '7707083893'
+
+
+def _write_directory(path, rows):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(['Номер п/п', 'Наименование', 'ИНН'])
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+
+def test_unchanged_directory_is_not_reopened(tmp_path, monkeypatch):
+    path = str(tmp_path / 'output.xlsx')
+    _write_directory(path, [(1, 'ООО «Ромашка»', ROMASHKA_INN), (2, 'ООО Лютик', '123')])
+    assert load_local_index([path]).find('ООО Ромашка') == (ROMASHKA_INN, 100)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('справочник открыт заново')
+
+    monkeypatch.setattr(openpyxl, 'load_workbook', fail)
+    index = load_local_index([path])
+    assert index.find('ООО Ромашка') == (ROMASHKA_INN, 100)
+
+    # Пары из памяти не меняются, когда индекс пополняется письмами папки
+    index.add('ООО Лютик', '500100732259')
+    assert load_local_index([path]).find('ООО Лютик') is None
+
+def test_changed_directory_is_read_again(tmp_path):
+    path = str(tmp_path / 'output.xlsx')
+    _write_directory(path, [(1, 'ООО Ромашка', ROMASHKA_INN)])
+    assert load_local_index([path]).find('ООО Лютик') is None
+
+    _write_directory(path, [(1, 'ООО Ромашка', ROMASHKA_INN), (2, 'ООО Лютик', '500100732259')])
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert load_local_index([path]).find('ООО Лютик') == ('500100732259', 100)
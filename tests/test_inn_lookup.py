@@ -0,0 +1,114 @@
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from inn_lookup import NOT_FOUND_TTL, InnResolver, YandexProvider
+
+pytest.importorskip('requests')
+pytest.importorskip('bs4')
+
+ROMASHKA_INN = '7707083893'
+
+
+class SearchStub(BaseHTTPRequestHandler):
+    """Локальная замена поисковика: отвечает выдачей из server.pages."""
+
+    def do_GET(self):
+        server = self.server
+        query = parse_qs(urlsplit(self.path).query)['text'][0]
+        with server.lock:
+            server.requests.append((time.monotonic(), query))
+            failures = server.failures.get(query, 0)
+            if failures:
+                server.failures[query] = failures - 1
+        if failures:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        items = ''.join(f'<li class="serp-item">{text}</li>' for text in server.pages.get(query, []))
+        body = f'<html><body><ul>{items}</ul></body></html>'.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def search_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), SearchStub)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.failures = {}
+    server.pages = {
+        'ИНН ООО Ромашка': [f'ООО «Ромашка», тел. 84951234567, ИНН {ROMASHKA_INN}'],
+    }
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _resolver(server, tmp_path, **kwargs):
+    url = f"http://127.0.0.1:{server.server_address[1]}/search?text={{query}}"
+    options = dict(workers=4, rate=100, backoff=0.01, cache_path=str(tmp_path / 'inn.sqlite3'))
+    options.update(kwargs)
+    return InnResolver(YandexProvider(url), **options)
+
+def test_found_and_not_found_are_cached(search_server, tmp_path):
+    names = ['ООО Ромашка', 'ООО Лютик']
+    assert _resolver(search_server, tmp_path).resolve(names) == {'ООО Ромашка': ROMASHKA_INN, 'ООО Лютик': None}
+    assert len(search_server.requests) == 2
+
+    # Повторный поиск, в том числе другого написания того же наименования, идет из кэша
+    results = _resolver(search_server, tmp_path).resolve(names + ['ООО "Ромашка"'])
+    assert results['ООО "Ромашка"'] == ROMASHKA_INN
+    assert len(search_server.requests) == 2
+
+def test_not_found_expires_before_found(search_server, tmp_path):
+    names = ['ООО Ромашка', 'ООО Лютик']
+    _resolver(search_server, tmp_path).resolve(names)
+
+    # Отметка "не найден" устарела, найденный ИНН — еще нет
+    with sqlite3.connect(tmp_path / 'inn.sqlite3') as conn:
+        conn.execute('UPDATE inn_lookups SET checked_at = checked_at - ?', (NOT_FOUND_TTL + 60,))
+    _resolver(search_server, tmp_path).resolve(names)
+    assert [query for _, query in search_server.requests[2:]] == ['ИНН ООО Лютик']
+
+def test_retries_after_server_errors(search_server, tmp_path):
+    search_server.failures['ИНН ООО Ромашка'] = 2
+    assert _resolver(search_server, tmp_path, retries=3).resolve(['ООО Ромашка']) == {'ООО Ромашка': ROMASHKA_INN}
+    assert len(search_server.requests) == 3
+
+def test_failed_lookup_is_not_cached(search_server, tmp_path):
+    search_server.failures['ИНН ООО Ромашка'] = 2
+    assert _resolver(search_server, tmp_path, retries=1).resolve(['ООО Ромашка']) == {'ООО Ромашка': None}
+    assert len(search_server.requests) == 2
+
+    # Ошибка сети не запоминается: следующий запуск снова спрашивает сервер
+    assert _resolver(search_server, tmp_path).resolve(['ООО Ромашка']) == {'ООО Ромашка': ROMASHKA_INN}
+    assert len(search_server.requests) == 3
+
+def test_backoff_grows_between_retries(search_server, tmp_path):
+    search_server.failures['ИНН ООО Ромашка'] = 3
+    _resolver(search_server, tmp_path, retries=3, backoff=0.1).resolve(['ООО Ромашка'])
+    times = [t for t, _ in search_server.requests]
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    # Паузы 0.1, 0.2, 0.4 с (плюс до половины случайной добавки)
+    assert gaps[0] >= 0.1 and gaps[1] >= 0.2 and gaps[2] >= 0.4
+
+def test_rate_limit_spaces_requests(search_server, tmp_path):
+    names = [f'ООО Компания {i}' for i in range(6)]
+    _resolver(search_server, tmp_path, rate=10).resolve(names)
+    times = sorted(t for t, _ in search_server.requests)
+    assert len(times) == 6
+    # Не чаще 10 запросов в секунду даже при 4 одновременных потоках
+    assert min(b - a for a, b in zip(times, times[1:])) >= 0.08
@@ -0,0 +1,99 @@
+import os
+import zipfile
+
+import pytest
+
+from parsing import extract_info, iter_docx_paragraphs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE = os.path.join(ROOT, 'Образец.docx')
+
+NAMESPACES = (
+    'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+    'xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006" '
+    'xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" '
+    'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+    'xmlns:wps="http://schemas.microsoft.com/office/word/2010/wordprocessingShape" '
+    'xmlns:v="urn:schemas-microsoft-com:vml" '
+    'mc:Ignorable="wps"'
+)
+
+LETTERHEAD = '<w:p><w:r><w:t>ООО Бланк тел. 8 (495) 111-22-33</w:t></w:r></w:p>'
+
+# Надпись в бланке письма: ее текст есть и в mc:Choice, и в mc:Fallback
+TEXT_BOX_PARAGRAPH = (
+    '<w:p><w:pPr><w:tabs><w:tab w:val="left" w:pos="4253"/></w:tabs></w:pPr>'
+    '<w:r><mc:AlternateContent>'
+    '<mc:Choice Requires="wps"><w:drawing><wp:anchor><a:graphic><a:graphicData>'
+    f'<wps:wsp><wps:txbx><w:txbxContent>{LETTERHEAD}</w:txbxContent></wps:txbx></wps:wsp>'
+    '</a:graphicData></a:graphic></wp:anchor></w:drawing></mc:Choice>'
+    '<mc:Fallback><w:pict><v:shape><v:textbox>'
+    f'<w:txbxContent>{LETTERHEAD}</w:txbxContent>'
+    '</v:textbox></v:shape></w:pict></mc:Fallback>'
+    '</mc:AlternateContent></w:r></w:p>'
+)
+
+BREAKS_PARAGRAPH = (
+    '<w:p><w:pPr><w:tabs><w:tab w:val="left" w:pos="1000"/></w:tabs></w:pPr>'
+    '<w:r><w:t>ООО «Ромашка»</w:t><w:tab/><w:t>ИНН 7701234567</w:t><w:br/>'
+    '<w:t>Москва</w:t><w:noBreakHyphen/><w:t>3</w:t></w:r>'
+    '<w:hyperlink r:id="rId1"><w:r><w:t>info@romashka.ru</w:t></w:r></w:hyperlink>'
+    '<w:r><w:br w:type="page"/></w:r></w:p>'
+)
+
+def _write_docx(path, body):
+    """Копия образца с другим содержимым word/document.xml."""
+    document = f'<w:document {NAMESPACES}><w:body>{body}</w:body></w:document>'
+    with zipfile.ZipFile(SAMPLE) as source, zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as target:
+        for info in source.infolist():
+            data = document.encode('utf-8') if info.filename == 'word/document.xml' else source.read(info)
+            target.writestr(info, data)
+
+def _python_docx_paragraphs(path):
+    docx = pytest.importorskip('docx')
+    return [paragraph.text for paragraph in docx.Document(path).paragraphs]
+
+def test_sample_matches_python_docx():
+    assert list(iter_docx_paragraphs(SAMPLE)) == _python_docx_paragraphs(SAMPLE)
+
+def test_text_box_and_breaks_match_python_docx(tmp_path):
+    path = str(tmp_path / 'letter.docx')
+    _write_docx(path, TEXT_BOX_PARAGRAPH + BREAKS_PARAGRAPH)
+
+    paragraphs = list(iter_docx_paragraphs(path))
+    assert paragraphs == _python_docx_paragraphs(path)
+    # Надпись не читается, табуляции из свойств абзаца и разрыв страницы не дают символов
+    assert paragraphs == ['', 'ООО «Ромашка»\tИНН 7701234567\nМосква-3info@romashka.ru']
+
+def _phones(lines):
+    return extract_info(lines)['Телефон']
+
+def test_inn_digits_are_not_a_phone():
+    lines = ['ООО «Ромашка»', 'ИНН 7701234567', 'Тел. 8 (495) 123-45-67']
+    assert _phones(lines) == '8 (495) 123-45-67'
+
+def test_email_digits_are_not_a_phone():
+    lines = ['ООО «Ромашка»', 'E-mail: sales12345678@romashka.ru', 'Телефон +7 495 765-43-21']
+    info = extract_info(lines)
+    assert info['Электронная почта'] == 'sales12345678@romashka.ru'
+    assert info['Телефон'] == '+7 495 765-43-21'
+
+def test_phone_continues_in_next_paragraph():
+    # Как в прежнем разборе, склеивавшем абзацы через пробел
+    lines = ['ООО «Ромашка»', 'Тел. 8 (495)', '123-45-67, факс 8 (495) 765-43-21']
+    assert _phones(lines) == '8 (495) 123-45-67, 8 (495) 765-43-21'
+
+def test_inn_is_not_joined_with_next_paragraph():
+    lines = ['ООО «Ромашка»', 'ИНН 7701234567', '123-45-67']
+    info = extract_info(lines)
+    assert info['ИНН'] == '7701234567'
+    assert info['Телефон'] == '123-45-67'
+
+def test_phone_wrapped_inside_paragraph():
+    lines = ['ООО «Ромашка»', 'Тел. 8 (495)\n123-45-67']
+    assert _phones(lines) == '8 (495)\n123-45-67'
+
+def test_legal_form_is_abbreviated():
+    lines = ['Общество с ограниченной ответственностью «Ромашка»', 'ИНН 7701234567']
+    assert extract_info(lines)['Наименование'] == 'ООО «Ромашка»'
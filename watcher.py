@@ -0,0 +1,209 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+# Сколько секунд тишины ждать после последнего изменения, прежде чем сообщать о нем
+DEFAULT_DEBOUNCE = 2.0
+
+# Период опроса папки, если inotify недоступен, секунд
+DEFAULT_POLL_INTERVAL = 2.0
+
+# Как часто поток проверяет, не пора ли остановиться, секунд
+STOP_CHECK_INTERVAL = 0.5
+
+WATCHED_EXTENSIONS = ('.doc', '.docx')
+
+# Временные файлы Word ("~$имя.docx")
+LOCK_FILE_PREFIX = '~$'
+
+# Флаги inotify из <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+def is_watched_name(name):
+    """Проверяет, что изменение файла с таким именем влияет на справочник."""
+    return name.endswith(WATCHED_EXTENSIONS) and not name.startswith(LOCK_FILE_PREFIX)
+
+class _Inotify:
+    """Минимальная обертка над inotify через ctypes (только Linux)."""
+
+    def __init__(self, folder):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), INOTIFY_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch")
+
+    def read(self, timeout):
+        """
+        Ждет события до timeout секунд и возвращает список (маска, имя).
+        Пустой список, если событий не было.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            events.append((mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """
+    Следит за файлами .doc/.docx в папке.
+
+    На Linux использует inotify, в остальных случаях раз в poll_interval
+    секунд сравнивает размеры и время изменения файлов. Пачка изменений
+    (например, синхронизация Dropbox) собирается, пока в папке не станет
+    тихо на debounce секунд, и передается одним вызовом on_change(пути).
+    on_change вызывается из потока наблюдателя.
+    """
+
+    def __init__(self, folder, on_change, debounce=DEFAULT_DEBOUNCE, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.folder = folder
+        self.on_change = on_change
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.backend = None
+        self._inotify = None
+        self._polled = {}
+        self._changed = set()
+        self._last_change = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Запускает наблюдение в отдельном потоке."""
+        if sys.platform.startswith('linux'):
+            try:
+                self._inotify = _Inotify(self.folder)
+                self.backend = 'inotify'
+            except (OSError, AttributeError) as e:
+                logging.warning(f"inotify недоступен, папка будет опрашиваться: {e}")
+        if self._inotify is None:
+            self.backend = 'polling'
+            # Снимок делается до возврата из start(), чтобы не пропустить ранние изменения
+            self._polled = self._snapshot()
+
+        self._thread = threading.Thread(target=self._run, name='folder-watcher', daemon=True)
+        self._thread.start()
+        logging.info(f"Слежение за папкой {self.folder} ({self.backend})")
+
+    def stop(self):
+        """Останавливает наблюдение; необработанные изменения отбрасываются."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        try:
+            if self._inotify is not None:
+                self._run_inotify()
+            else:
+                self._run_polling()
+        except Exception as e:
+            logging.error(f"Слежение за папкой {self.folder} остановлено из-за ошибки: {e}", exc_info=True)
+        finally:
+            if self._inotify is not None:
+                self._inotify.close()
+                self._inotify = None
+
+    def _run_inotify(self):
+        while not self._stop_event.is_set():
+            for mask, name in self._inotify.read(self._timeout(STOP_CHECK_INTERVAL)):
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                    logging.warning(f"Папка {self.folder} удалена или перемещена, слежение остановлено")
+                    return
+                if is_watched_name(name):
+                    self._mark_changed(os.path.join(self.folder, name))
+            self._flush_if_quiet()
+
+    def _run_polling(self):
+        snapshot = self._polled
+        next_poll = time.monotonic() + self.poll_interval
+        while not self._stop_event.wait(self._timeout(max(0, next_poll - time.monotonic()))):
+            if time.monotonic() >= next_poll:
+                current = self._snapshot()
+                # Папка недоступна (сеть, Dropbox): ждем следующего опроса, а не
+                # считаем все файлы удаленными
+                if current is not None:
+                    if snapshot is not None:
+                        for name in current.keys() | snapshot.keys():
+                            if current.get(name) != snapshot.get(name):
+                                self._mark_changed(os.path.join(self.folder, name))
+                    snapshot = self._polled = current
+                next_poll = time.monotonic() + self.poll_interval
+            self._flush_if_quiet()
+
+    def _snapshot(self):
+        """Размер и время изменения каждого отслеживаемого файла папки; None, если папку не прочитать."""
+        snapshot = {}
+        try:
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if not is_watched_name(entry.name):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    snapshot[entry.name] = (st.st_size, st.st_mtime_ns)
+        except OSError as e:
+            logging.warning(f"Не удалось прочитать папку {self.folder}: {e}")
+            return None
+        return snapshot
+
+    def _mark_changed(self, path):
+        self._changed.add(path)
+        self._last_change = time.monotonic()
+
+    def _timeout(self, limit):
+        """Сколько ждать следующего события: не дольше, чем до конца тишины."""
+        if self._last_change is None:
+            return limit
+        return max(0, min(limit, self._last_change + self.debounce - time.monotonic()))
+
+    def _flush_if_quiet(self):
+        if self._last_change is None or time.monotonic() - self._last_change < self.debounce:
+            return
+        changed = sorted(self._changed)
+        self._changed = set()
+        self._last_change = None
+        try:
+            self.on_change(changed)
+        except Exception as e:
+            logging.error(f"Ошибка обработчика изменений папки {self.folder}: {e}", exc_info=True)